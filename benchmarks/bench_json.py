@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+#
+# JSON decoding benchmark
+#
+'''Compare JSON handling of large API responses
+
+Uses synthetic `users` and RMS `resources` payloads from
+{py:obj}`standin.Tenant` and measures, per payload:
+
+- `requests x3` : `requests.Response.json()` called three times, as
+  the service clients do (status check, then payload extraction)
+- `cached/json` : {py:obj}`scullery.jsoncodec.Response` with the
+  standard library backend, also called three times
+- `cached/orjson` : the same with the `orjson` backend (if installed)
+- `encode/...` : encoding the payload as a request body
+
+Usage:
+
+```bash
+python benchmarks/bench_json.py [--size N] [--repeat N]
+```
+'''
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import requests
+from scullery import api
+
+import standin
+
+jsoncodec = api.jsoncodec
+
+def timeit(fn, repeat:int) -> float:
+  '''Best time of `repeat` calls to `fn`'''
+  best = None
+  for _ in range(repeat):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    if best is None or elapsed < best: best = elapsed
+  return best
+
+def response(body:bytes) -> requests.Response:
+  '''Build a `requests.Response` with the given body'''
+  resp = requests.Response()
+  resp.status_code = 200
+  resp._content = body
+  resp.encoding = 'utf-8'
+  return resp
+
+def decode3(resp) -> None:
+  '''Decode as the service clients do'''
+  if resp.status_code != 200 or not 'items' in resp.json(): raise RuntimeError
+  resp.json()['items']
+  resp.json()
+
+def main(argv:list[str]) -> None:
+  cli = argparse.ArgumentParser(description = 'JSON decoding benchmark')
+  cli.add_argument('-n', '--size', type = int, default = 50000,
+                  help = 'Number of entities per payload')
+  cli.add_argument('-r', '--repeat', type = int, default = 5,
+                  help = 'Runs per measurement (the best is reported)')
+  args = cli.parse_args(argv)
+
+  tenant = standin.Tenant(users = args.size, groups = 10, projects = 100,
+                          resources = args.size, servers = 0, images = 0)
+  payloads = {
+    'users': { 'items': list(tenant.users.values()) },
+    'resources': { 'items': tenant.resources },
+  }
+  backends = [ b for b in jsoncodec.BACKENDS if b != 'orjson' or jsoncodec.orjson is not None ]
+
+  for name, payload in payloads.items():
+    body = json.dumps(payload).encode()
+    print(f'{name}: {len(payload["items"])} items, {len(body)/1e6:.1f} MB')
+    base = timeit(lambda: decode3(response(body)), args.repeat)
+    print(f'  {"requests x3":16} {base*1000:9.1f} ms')
+    for b in backends:
+      jsoncodec.use_backend(b)
+      t = timeit(lambda: decode3(jsoncodec.Response(response(body))), args.repeat)
+      print(f'  {"cached/"+b:16} {t*1000:9.1f} ms  {base/t:5.1f}x')
+    for b in backends:
+      jsoncodec.use_backend(b)
+      t = timeit(lambda: jsoncodec.dumps(payload), args.repeat)
+      print(f'  {"encode/"+b:16} {t*1000:9.1f} ms')
+  jsoncodec.use_backend()
+
+if __name__ == '__main__':
+  main(sys.argv[1:])
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+#
+# Connection pool benchmark
+#
+'''Compare one-connection-per-call against the pooled ApiSession
+
+Starts a local keep-alive HTTP server that stands in for the cloud
+REST end-points and measures calls/sec for:
+
+- `requests.get` : a new TCP connection for every call (the old
+  behaviour of `ApiSession`)
+- `ApiSession.get` : calls sharing the session connection pool
+
+Usage:
+
+```bash
+python benchmarks/bench_pool.py [--calls N]
+```
+
+Note that against the real cloud the difference is larger, as each
+new connection also pays for a TLS handshake.
+'''
+import argparse
+import gc
+import json
+import os
+import sys
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import requests
+from scullery import api
+
+class Handler(BaseHTTPRequestHandler):
+  '''Minimal keep-alive REST end-point'''
+  protocol_version = 'HTTP/1.1'
+  disable_nagle_algorithm = True
+
+  def reply(self, code:int, body:dict, headers:dict|None = None) -> None:
+    data = json.dumps(body).encode()
+    self.send_response(code)
+    self.send_header('Content-Type', 'application/json')
+    self.send_header('Content-Length', str(len(data)))
+    for k,v in (headers or {}).items():
+      self.send_header(k, v)
+    self.end_headers()
+    self.wfile.write(data)
+
+  def do_GET(self):
+    self.reply(200, { 'users': [] })
+
+  def do_POST(self):
+    self.rfile.read(int(self.headers.get('Content-Length', 0)))
+    self.reply(201, { 'token': {} }, { 'X-Subject-Token': 'benchmark-token' })
+
+  def do_DELETE(self):
+    self.reply(204, {})
+
+  def log_message(self, *args):
+    pass
+
+def run(label:str, fn, calls:int) -> float:
+  '''Time `calls` invocations of `fn` and report calls/sec'''
+  start = time.perf_counter()
+  for _ in range(calls):
+    fn().raise_for_status()
+  rate = calls / (time.perf_counter() - start)
+  print(f'{label:16} {rate:10.1f} calls/sec')
+  return rate
+
+def bench(base:str, calls:int) -> None:
+  '''Run the benchmark against the server at `base`'''
+  url = f'{base}/v3/users'
+
+  class LocalSession(api.ApiSession):
+    def tokens_api_path(self) -> str:
+      return f'{base}/v3/auth/tokens'
+
+  cc = LocalSession({
+    'username': 'bench',
+    'password': 'bench',
+    'user_domain_name': 'bench',
+    'project_name': 'eu-de',
+  })
+  headers = { 'X-Auth-Token': cc.token }
+
+  before = run('requests.get', lambda: requests.get(url, headers = headers), calls)
+  after = run('ApiSession.get', lambda: cc.get(url), calls)
+  print(f'speed-up         {after/before:10.2f}x')
+
+def main(argv:list[str]) -> None:
+  cli = argparse.ArgumentParser(description = 'Connection pool benchmark')
+  cli.add_argument('-n', '--calls', type = int, default = 1000,
+                  help = 'Number of calls per run')
+  args = cli.parse_args(argv)
+
+  server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+  threading.Thread(target = server.serve_forever, daemon = True).start()
+  try:
+    bench(f'http://127.0.0.1:{server.server_port}', args.calls)
+    gc.collect() # Release the session token while the server is up
+  finally:
+    server.shutdown()
+
+if __name__ == '__main__':
+  main(sys.argv[1:])
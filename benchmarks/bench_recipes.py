@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+#
+# Recipe benchmarks
+#
+'''Run recipes against the local stand-in server as the tenant grows
+
+Each recipe entry point is called against a freshly seeded
+{py:obj}`standin.StandIn` running in a child process, for every
+tenant size.  A tenant of size `N` has `N` users, groups, projects,
+custom roles, servers, images and resources.  For every run it
+reports:
+
+- `wall_time` : seconds spent in the recipe (including login)
+- `http_calls` : requests served by the stand-in
+- `calls` : requests per end-point (IDs replaced by `{id}`)
+- `peak_memory` : peak bytes allocated by the client (`tracemalloc`)
+
+Results are written as JSON so that they can be compared across
+releases.  A summary table is written to stderr: an `http_calls`
+column that grows with `N` shows an O(N) call pattern.
+
+Usage:
+
+```bash
+python benchmarks/bench_recipes.py [--sizes 10,100,1000,10000] [--latency 0.01] [--output results.json]
+```
+'''
+import argparse
+import contextlib
+import datetime
+import gc
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import requests
+import scullery
+from scullery import api
+from scullery import creds
+from scullery.__main__ import cmd_cli
+
+import standin
+
+CREDS = {
+  'cloud_name': 'standin',
+  'username': 'bench',
+  'password': 'bench',
+  'user_domain_name': 'bench',
+  'project_name': 'eu-de',
+}
+'''Credentials used to log into the stand-in'''
+
+SIZES = [10, 100, 1000, 10000]
+'''Default tenant sizes'''
+
+def recipes(outdir:str) -> dict:
+  '''Benchmarked recipes
+
+  :param outdir: directory for recipe output files
+  :returns: dictionary of name : (command line, scoped)
+  '''
+  return {
+    'prj-list': (['project'], False),
+    'prj-get': (['project', 'get', 'eu-de_prj00000'], False),
+    'prj-del': (['project', 'del', '--force', 'eu-de_prj00000'], False),
+    'usr-list': (['users'], False),
+    'grp-get': (['groups', 'get', 'grp00000'], False),
+    'rms': (['resources'], False),
+    'kermit': (['kermit', 'setup', 'eu-de_kermit', '-o', os.path.join(outdir, 'kermit.yaml')], False),
+    'ecs-start': (['ecs', 'start', 'ecs00000'], True),
+  }
+
+def parse(argv:list[str]) -> argparse.Namespace:
+  '''Parse a recipe command line with the scullery parser
+
+  :param argv: command line, starting with the recipe name
+  :returns: parsed arguments, with `recipe_cb`
+  '''
+  args, _ = cmd_cli(lazy = True).parse_known_args(argv)
+  return cmd_cli(lazy = True, recipe = args.recipe_name).parse_args(argv)
+
+def serve(size:int, latency:float, conn) -> None:
+  '''Child process: seed a tenant and run the stand-in until killed'''
+  tenant = standin.Tenant(users = size, groups = size, projects = size,
+                          resources = size, servers = size, images = size,
+                          roles = size)
+  srv = standin.StandIn(tenant, latency)
+  conn.send(srv.netloc)
+  srv.server.serve_forever()
+
+def run(name:str, size:int, latency:float, parallel:int) -> dict:
+  '''Run one recipe against a fresh stand-in
+
+  :param name: recipe name (key of {py:obj}`recipes`)
+  :param size: tenant size
+  :param latency: seconds added by the stand-in to every request
+  :param parallel: concurrent API calls used by recipes
+  :returns: result record
+  '''
+  parent, child = multiprocessing.Pipe()
+  proc = multiprocessing.Process(target = serve, args = (size, latency, child), daemon = True)
+  proc.start()
+  netloc = parent.recv()
+  api.set_api_endpoint(netloc, 'http')
+  scullery.defaults['cloud'] = CREDS['cloud_name']
+  scullery.defaults['token_cache'] = False
+  scullery.defaults['parallel'] = parallel
+
+  result = { 'recipe': name, 'size': size, 'error': None }
+  try:
+    with tempfile.TemporaryDirectory() as outdir, open(os.devnull, 'w') as devnull:
+      argv, scoped = recipes(outdir)[name]
+      args = parse(argv)
+      gc.collect()
+      tracemalloc.start()
+      start = time.perf_counter()
+      try:
+        with contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+          scullery.cloud(scoped = scoped)
+          args.recipe_cb(args)
+          scullery.clean_up()
+          gc.collect() # Revoke tokens inside the measurement
+      except Exception as e:
+        result['error'] = f'{type(e).__name__}: {e}'
+      result['wall_time'] = round(time.perf_counter() - start, 4)
+      result['peak_memory'] = tracemalloc.get_traced_memory()[1]
+      tracemalloc.stop()
+
+    stats = requests.get(f'http://{netloc}{standin.STATS_PATH}').json()
+    result['http_calls'] = stats['total']
+    result['calls'] = stats['calls']
+  finally:
+    # Sessions of a failed recipe must revoke their tokens on the
+    # stand-in, not on the real end-point
+    scullery.clean_up()
+    gc.collect()
+    proc.terminate()
+    proc.join()
+    api.set_api_endpoint()
+  return result
+
+def main(argv:list[str]) -> None:
+  cli = argparse.ArgumentParser(description = 'Recipe benchmarks')
+  cli.add_argument('--sizes', default = ','.join(str(s) for s in SIZES),
+                  help = 'Comma separated tenant sizes')
+  cli.add_argument('--latency', type = float, default = 0.0,
+                  help = 'Seconds added to every request by the stand-in')
+  cli.add_argument('-j', '--parallel', type = int, default = 1,
+                  help = 'Concurrent API calls used by recipes')
+  cli.add_argument('-r', '--recipe', action = 'append', default = [],
+                  help = 'Recipe to run (can be specified multiple times, defaults to all)')
+  cli.add_argument('-o', '--output', type = argparse.FileType('w'), default = sys.stdout,
+                  help = 'JSON output file')
+  args = cli.parse_args(argv)
+
+  for k,v in CREDS.items():
+    os.environ[creds.STR.ENV_PREFIX + k.upper()] = v
+  sizes = [ int(s) for s in args.sizes.split(',') ]
+  names = args.recipe if args.recipe else list(recipes(''))
+  report = {
+    'meta': {
+      'date': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec = 'seconds'),
+      'scullery': scullery.VERSION,
+      'python': platform.python_version(),
+      'latency': args.latency,
+      'parallel': args.parallel,
+    },
+    'results': [],
+  }
+
+  sys.stderr.write(f'{"recipe":12} {"size":>7} {"wall_time":>10} {"http_calls":>10} {"peak_kb":>10}\n')
+  for name in names:
+    for size in sizes:
+      res = run(name, size, args.latency, args.parallel)
+      report['results'].append(res)
+      sys.stderr.write(f'{name:12} {size:7} {res["wall_time"]:10.3f} {res["http_calls"]:10} {res["peak_memory"]//1024:10}'
+                        + (f'  {res["error"]}' if res['error'] else '') + '\n')
+
+  json.dump(report, args.output, indent = 2)
+  args.output.write('\n')
+
+if __name__ == '__main__':
+  main(sys.argv[1:])
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+#
+# Start-up benchmark
+#
+'''Measure the cold start time of the command line
+
+Runs each command several times in a new interpreter and reports
+the best wall time, minus the start-up time of a bare interpreter
+(`python -c pass`):
+
+- `--help` : builds the command line without importing any recipe
+- `tags` : imports one recipe and lists tags from a local
+  {py:obj}`standin.StandIn` server
+
+The exit code is `1` if a command exceeds its budget, so this can
+be used as a regression check.
+
+Usage:
+
+```bash
+python benchmarks/bench_startup.py [--runs N] [--help-budget SECS] [--tags-budget SECS]
+```
+'''
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import standin
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+def best_time(cmd:list[str], runs:int, env:dict) -> float:
+  '''Best wall time of `runs` executions of `cmd`'''
+  best = None
+  for _ in range(runs):
+    start = time.perf_counter()
+    subprocess.run(cmd, env = env, cwd = ROOT, check = True,
+                  stdout = subprocess.DEVNULL)
+    elapsed = time.perf_counter() - start
+    if best is None or elapsed < best: best = elapsed
+  return best
+
+def main(argv:list[str]) -> None:
+  cli = argparse.ArgumentParser(description = 'Start-up benchmark')
+  cli.add_argument('-n', '--runs', type = int, default = 10,
+                  help = 'Runs per command (the best is reported)')
+  cli.add_argument('--help-budget', type = float, default = 0.05,
+                  help = 'Maximum seconds for "--help" above interpreter start-up')
+  cli.add_argument('--tags-budget', type = float, default = 0.15,
+                  help = 'Maximum seconds for "tags" above interpreter start-up')
+  args = cli.parse_args(argv)
+
+  srv = standin.StandIn().start()
+  try:
+    with tempfile.TemporaryDirectory() as cfgdir:
+      env = dict(os.environ)
+      env.update({
+        'SCULLERY_CONFIG_DIR': cfgdir,
+        'OS_CLOUD_NAME': 'standin',
+        'OS_USERNAME': 'bench',
+        'OS_PASSWORD': 'bench',
+        'OS_USER_DOMAIN_NAME': 'bench',
+        'OS_PROJECT_NAME': 'eu-de',
+      })
+      scull = [ sys.executable, '-m', 'scullery' ]
+      base = best_time([ sys.executable, '-c', 'pass' ], args.runs, env)
+      checks = [
+        ('--help', scull + [ '--help' ], args.help_budget),
+        ('tags', scull + [ '--api-endpoint', srv.url, '--no-token-cache', 'tags' ], args.tags_budget),
+      ]
+      print(f'{"python -c pass":16} {base:8.3f}s')
+      failed = False
+      for label, cmd, budget in checks:
+        elapsed = best_time(cmd, args.runs, env) - base
+        over = elapsed > budget
+        failed = failed or over
+        print(f'{label:16} {elapsed:8.3f}s  budget {budget:.3f}s {"OVER" if over else "ok"}')
+  finally:
+    srv.stop()
+  sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+  main(sys.argv[1:])
@@ -0,0 +1,724 @@
+#!/usr/bin/env python3
+#
+# Local stand-in for the cloud REST APIs
+#
+'''Local stand-in server for the IAM, ECS, IMS, RMS and TMS end-points
+
+A stateful, threaded HTTP server implementing the subset of the
+cloud REST APIs used by scullery.  It is seeded with a synthetic
+tenant of arbitrary size so that recipes can be load tested without
+touching a real cloud.
+
+All services are served from the same `host:port`.  Use
+{py:obj}`scullery.api.set_api_endpoint` to point the service clients
+at it:
+
+```python
+from standin import StandIn, Tenant
+from scullery import api
+
+with StandIn(Tenant(users = 10000, projects = 1000, resources = 50000)) as srv:
+  api.set_api_endpoint(srv.netloc, 'http')
+  ...
+```
+
+It can also be run stand-alone:
+
+```bash
+python benchmarks/standin.py --users 10000 --projects 1000 --resources 50000 --port 8080
+scullery --api-endpoint http://127.0.0.1:8080 prj
+```
+
+Any user name and password are accepted, except for users created
+through the API, whose password is checked, and tokens scoped to a
+project that does not exist.  Requests must carry a token issued by
+the stand-in, otherwise `401` is returned.
+
+`GET /_standin/calls` returns the request counters (without
+counting itself).
+'''
+import argparse
+import datetime
+import json
+import random
+import re
+import sys
+import threading
+import time
+
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+REGIONS = ('eu-de', 'eu-nl')
+'''Regions created in every tenant'''
+
+SYSTEM_ROLES = [
+  ('te_admin', 'Tenant Administrator'),
+  ('readonly', 'Tenant Guest'),
+  ('server_adm', 'Server Administrator'),
+  ('ecs_adm', 'ECS Administrator'),
+]
+'''System roles as (name, display_name)'''
+
+RESOURCE_TYPES = [
+  ('ecs', 'cloudservers'),
+  ('evs', 'volumes'),
+  ('vpc', 'vpcs'),
+  ('vpc', 'securityGroups'),
+  ('obs', 'buckets'),
+  ('rds', 'instances'),
+]
+'''RMS resource types as (provider, type)'''
+
+STATS_PATH = '/_standin/calls'
+'''End-point returning the request counters'''
+
+IMAGES_PAGE = 25
+'''Default IMS page size'''
+RMS_PAGE = 200
+'''Maximum RMS page size'''
+SERVERS_PAGE = 1000
+'''Maximum ECS page size'''
+ASSIGNMENTS_PAGE = 500
+'''Role assignments per page'''
+
+class Tenant:
+  '''Synthetic tenant data
+
+  Entities are generated deterministically from `seed`.  About half
+  of the users, groups and custom roles carry the scullery project
+  signature in their description, as if created by `kermit`.
+  '''
+
+  def __init__(self, users:int = 100, groups:int = 20, projects:int = 10,
+                resources:int = 500, servers:int = 20, images:int = 50,
+                roles:int = 10, tags:int = 10, seed:int = 0,
+                delete_delay:float = 0.0) -> None:
+    '''Constructor
+
+    :param users: number of IAM users
+    :param groups: number of IAM groups
+    :param projects: number of projects (besides the region projects)
+    :param resources: number of RMS resources
+    :param servers: number of ECS servers
+    :param images: number of IMS images
+    :param roles: number of custom roles
+    :param tags: number of predefined tags
+    :param seed: random seed
+    :param delete_delay: seconds a deleted project stays in `deleting` status
+    '''
+    self.rng = random.Random(seed)
+    self.lock = threading.RLock()
+    self.tokens = set()
+
+    self.domain = { 'id': self.uuid(), 'name': 'OTC-EU-DE-STANDIN', 'enabled': True }
+    self.projects = dict()
+    self.users = dict()
+    self.passwords = dict() # user name -> password, for users created with one
+    self.groups = dict()
+    self.members = dict()   # group id -> set of user ids
+    self.sys_roles = dict()
+    self.usr_roles = dict()
+    self.grants = dict()    # (project id, group id) -> set of role ids
+    self.servers = dict()
+    self.images = []
+    self.resources = []
+    self.tags = []
+    self.delete_delay = delete_delay
+    self.deleting = dict()  # project id -> time it is gone
+
+    for region in REGIONS:
+      self.add_project(region, self.domain['id'], '')
+    for i in range(projects):
+      region = REGIONS[i % len(REGIONS)]
+      self.add_project(f'{region}_prj{i:05d}', self.project_by_name(region)['id'],
+                        '-- Project created by standin using scullery')
+    prjnames = [ p['name'] for p in self.projects.values() if '_' in p['name'] ]
+
+    for name, display_name in SYSTEM_ROLES:
+      rid = self.uuid()
+      self.sys_roles[rid] = {
+        'id': rid, 'name': name, 'display_name': display_name,
+        'type': 'XA', 'description': display_name, 'domain_id': None,
+      }
+    for i in range(roles):
+      self.add_role({ 'display_name': f'role{i:05d}', 'type': 'XA',
+                      'description': self.signature('role', prjnames, i),
+                      'policy': { 'Version': '1.1', 'Statement': [] } })
+
+    for i in range(groups):
+      self.add_group({ 'name': f'grp{i:05d}', 'description': self.signature('group', prjnames, i) })
+    for i in range(users):
+      self.add_user({ 'name': f'usr{i:05d}', 'email': f'usr{i:05d}@example.com',
+                      'description': self.signature('user', prjnames, i) })
+
+    gids = list(self.groups)
+    if gids:
+      for uid in self.users:
+        for gid in self.rng.sample(gids, min(len(gids), self.rng.randint(1,3))):
+          self.members[gid].add(uid)
+      rids = list(self.sys_roles) + list(self.usr_roles)
+      for prj in self.projects.values():
+        for gid in self.rng.sample(gids, min(len(gids), 3)):
+          self.grants[(prj['id'], gid)] = { self.rng.choice(rids) }
+
+    prjs = list(self.projects.values())
+    for i in range(servers):
+      prj = prjs[i % len(prjs)]
+      sid = self.uuid()
+      self.servers[sid] = {
+        'id': sid, 'name': f'ecs{i:05d}', 'tenant_id': prj['id'],
+        'status': self.rng.choice(['ACTIVE', 'SHUTOFF']),
+        'flavor': { 'id': 's3.medium.2' },
+        'metadata': {},
+      }
+    for i in range(images):
+      self.images.append({
+        'id': self.uuid(), 'name': f'img{i:05d}', 'status': 'active',
+        '__imagetype': self.rng.choice(['gold', 'private', 'shared']),
+        'visibility': 'public', 'min_disk': 4,
+      })
+    for i in range(resources):
+      prj = self.rng.choice(prjs)
+      provider, rtype = self.rng.choice(RESOURCE_TYPES)
+      self.resources.append({
+        'id': self.uuid(), 'name': f'{rtype}{i:06d}',
+        'provider': provider, 'type': rtype,
+        'region_id': prj['name'].split('_',1)[0],
+        'project_id': prj['id'], 'project_name': prj['name'],
+        'tags': {}, 'properties': {},
+      })
+    for i in range(tags):
+      self.tags.append({ 'key': f'key{i:03d}', 'value': f'value{i:03d}' })
+
+  def uuid(self) -> str:
+    '''Generate a (seeded) random ID'''
+    return '%032x' % self.rng.getrandbits(128)
+
+  def signature(self, kind:str, prjnames:list, i:int) -> str:
+    '''Description for generated entities (every other one belongs to a project)'''
+    desc = f'-- {kind} created by standin using scullery'
+    if prjnames and i % 2 == 0: desc += f' -- project:{prjnames[(i//2) % len(prjnames)]}'
+    return desc
+
+  def project_by_name(self, name:str) -> dict|None:
+    '''Look-up a project by name'''
+    for prj in self.projects.values():
+      if prj['name'] == name: return prj
+    return None
+
+  def expire(self) -> None:
+    '''Drop projects whose deletion has completed'''
+    now = time.monotonic()
+    for pid, gone in list(self.deleting.items()):
+      if gone <= now:
+        del self.deleting[pid]
+        self.projects.pop(pid, None)
+
+  def add_project(self, name:str, parent_id:str, description:str) -> dict:
+    '''Create a project'''
+    pid = self.uuid()
+    self.projects[pid] = {
+      'id': pid, 'name': name, 'description': description,
+      'domain_id': self.domain['id'], 'parent_id': parent_id,
+      'enabled': True, 'is_domain': False, 'status': 'normal',
+    }
+    return self.projects[pid]
+
+  def add_user(self, user:dict) -> dict:
+    '''Create a user'''
+    uid = self.uuid()
+    rec = {
+      'id': uid, 'name': user['name'], 'domain_id': self.domain['id'],
+      'description': user.get('description', ''), 'email': user.get('email', ''),
+      'enabled': user.get('enabled', True), 'pwd_status': user.get('pwd_status', True),
+    }
+    self.users[uid] = rec
+    if 'password' in user: self.passwords[user['name']] = user['password']
+    return rec
+
+  def add_group(self, group:dict) -> dict:
+    '''Create a group'''
+    gid = self.uuid()
+    self.groups[gid] = {
+      'id': gid, 'name': group['name'], 'domain_id': self.domain['id'],
+      'description': group.get('description', ''),
+    }
+    self.members[gid] = set()
+    return self.groups[gid]
+
+  def add_role(self, role:dict) -> dict:
+    '''Create a custom role'''
+    rid = self.uuid()
+    self.usr_roles[rid] = {
+      'id': rid, 'name': f'custom_{self.domain["id"][:8]}_{len(self.usr_roles)}',
+      'display_name': role['display_name'], 'type': role.get('type', 'XA'),
+      'description': role.get('description', ''), 'policy': role.get('policy', {}),
+      'domain_id': self.domain['id'],
+    }
+    return self.usr_roles[rid]
+
+class Reply(Exception):
+  '''INTERNAL: raised by end-point handlers to send an error reply'''
+  def __init__(self, code:int, message:str = '') -> None:
+    super().__init__(message)
+    self.code = code
+
+def by_name(items, query:dict) -> list:
+  '''INTERNAL: apply the optional `name` filter of a list query'''
+  if 'name' not in query: return list(items)
+  return [ i for i in items if i['name'] == query['name'] ]
+
+class Api:
+  '''REST end-point implementations
+
+  Every handler receives the tenant, the match groups of its route,
+  the query parameters and the decoded JSON body, and returns a tuple
+  with status code, reply body and optional extra headers.
+  '''
+
+  def __init__(self, tenant:Tenant) -> None:
+    '''Constructor'''
+    self.t = tenant
+    self.routes = [
+      ('GET', r'/v3/auth/domains', self.domains),
+      ('GET', r'/v3/users', self.list_users),
+      ('POST', r'/v3\.0/OS-USER/users', self.new_user),
+      ('PATCH', r'/v3/users/(\w+)', self.patch_user),
+      ('DELETE', r'/v3/users/(\w+)', self.del_user),
+      ('GET', r'/v3/users/(\w+)/groups', self.user_groups),
+      ('GET', r'/v3/groups', self.list_groups),
+      ('POST', r'/v3/groups', self.new_group),
+      ('DELETE', r'/v3/groups/(\w+)', self.del_group),
+      ('GET', r'/v3/groups/(\w+)/users', self.group_users),
+      ('PUT', r'/v3/groups/(\w+)/users/(\w+)', self.add_member),
+      ('DELETE', r'/v3/groups/(\w+)/users/(\w+)', self.del_member),
+      ('GET', r'/v3/roles', self.system_roles),
+      ('GET', r'/v3\.0/OS-ROLE/roles', self.custom_roles),
+      ('POST', r'/v3\.0/OS-ROLE/roles', self.new_role),
+      ('DELETE', r'/v3\.0/OS-ROLE/roles/(\w+)', self.del_role),
+      ('GET', r'/v3/domains/(\w+)/groups/(\w+)/roles', self.domain_grants),
+      ('GET', r'/v3/projects/(\w+)/groups/(\w+)/roles', self.project_grants),
+      ('GET', r'/v3/role_assignments', self.role_assignments),
+      ('PUT', r'/v3/projects/(\w+)/groups/(\w+)/roles/(\w+)', self.grant),
+      ('DELETE', r'/v3/projects/(\w+)/groups/(\w+)/roles/(\w+)', self.revoke),
+      ('GET', r'/v3/projects', self.list_projects),
+      ('POST', r'/v3/projects', self.new_project),
+      ('DELETE', r'/v3/projects/(\w+)', self.del_project),
+      ('GET', r'/v3-ext/projects/(\w+)', self.project_details),
+      ('POST', r'/v3\.0/OS-CREDENTIAL/securitytokens', self.securitytoken),
+      ('GET', r'/v2\.1/(\w+)/servers(/detail)?', self.list_servers),
+      ('POST', r'/v2\.1/(\w+)/servers/(\w+)/action', self.server_action),
+      ('GET', r'/v2/(\w+)/os-availability-zone', self.availability_zones),
+      ('GET', r'/v2/(\w+)/flavors/detail', self.flavors),
+      ('GET', r'/v1\.0/(\w+)/availability-zone/([\w-]+)/dedicated-host-types', self.deh_types),
+      ('GET', r'/v2/images', self.list_images),
+      ('GET', r'/v1/resource-manager/domains/(\w+)/all-resources', self.list_resources),
+      ('GET', r'/v1\.0/predefine_tags', self.list_tags),
+      ('POST', r'/v1\.0/predefine_tags/action', self.tag_action),
+    ]
+    self.routes = [ (m, re.compile(p + '$'), fn) for m,p,fn in self.routes ]
+
+  def dispatch(self, method:str, path:str, query:dict, body) -> tuple:
+    '''Find and call the handler for a request'''
+    for m, regex, fn in self.routes:
+      if m != method: continue
+      if mv := regex.match(path):
+        with self.t.lock:
+          return fn(*mv.groups(), query = query, body = body)
+    raise Reply(404, f'{method} {path}: not found')
+
+  def get(self, table:dict, key:str) -> dict:
+    '''INTERNAL: look-up an entity or reply 404'''
+    if key not in table: raise Reply(404, f'{key}: not found')
+    return table[key]
+
+  def new_token(self, body) -> tuple:
+    '''Issue a session token'''
+    try:
+      user = body['auth']['identity']['password']['user']
+      user['name'], user['password']
+    except (KeyError, TypeError):
+      raise Reply(400, 'Invalid auth request')
+    if self.t.passwords.get(user['name'], user['password']) != user['password']:
+      raise Reply(401, 'The username or password is wrong.')
+    scope = (body['auth'].get('scope') or {}).get('project')
+    if scope is not None and self.t.project_by_name(scope.get('name')) is None:
+      raise Reply(401, f'{scope.get("name")}: no such project to scope to')
+    token = self.t.uuid()
+    self.t.tokens.add(token)
+    expires_at = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours = 24)
+    return 201, { 'token': {
+      'expires_at': expires_at.strftime('%Y-%m-%dT%H:%M:%S.%fZ'),
+      'methods': [ 'password' ],
+      'user': { 'name': user['name'], 'domain': self.t.domain },
+    }}, { 'X-Subject-Token': token }
+
+  def domains(self, query, body):
+    return 200, { 'domains': [ self.t.domain ] }
+
+  def list_users(self, query, body):
+    return 200, { 'users': by_name(self.t.users.values(), query) }
+
+  def new_user(self, query, body):
+    if any(u['name'] == body['user']['name'] for u in self.t.users.values()):
+      raise Reply(409, f'{body["user"]["name"]}: user already exists')
+    return 201, { 'user': self.t.add_user(body['user']) }
+
+  def patch_user(self, uid, query, body):
+    user = self.get(self.t.users, uid)
+    if 'pwd_status' in body['user']: user['pwd_status'] = body['user']['pwd_status']
+    return 200, { 'user': user }
+
+  def del_user(self, uid, query, body):
+    self.t.passwords.pop(self.get(self.t.users, uid)['name'], None)
+    del self.t.users[uid]
+    for members in self.t.members.values(): members.discard(uid)
+    return 204, None
+
+  def user_groups(self, uid, query, body):
+    self.get(self.t.users, uid)
+    return 200, { 'groups': [ self.t.groups[g] for g,m in self.t.members.items() if uid in m ] }
+
+  def list_groups(self, query, body):
+    return 200, { 'groups': by_name(self.t.groups.values(), query) }
+
+  def new_group(self, query, body):
+    return 201, { 'group': self.t.add_group(body['group']) }
+
+  def del_group(self, gid, query, body):
+    self.get(self.t.groups, gid)
+    del self.t.groups[gid]
+    del self.t.members[gid]
+    return 204, None
+
+  def group_users(self, gid, query, body):
+    self.get(self.t.groups, gid)
+    return 200, { 'users': [ self.t.users[u] for u in self.t.members[gid] ] }
+
+  def add_member(self, gid, uid, query, body):
+    self.get(self.t.groups, gid)
+    self.get(self.t.users, uid)
+    self.t.members[gid].add(uid)
+    return 204, None
+
+  def del_member(self, gid, uid, query, body):
+    self.get(self.t.groups, gid)
+    if uid not in self.t.members[gid]: raise Reply(404, f'{uid}: not a member')
+    self.t.members[gid].discard(uid)
+    return 204, None
+
+  def system_roles(self, query, body):
+    return 200, { 'roles': list(self.t.sys_roles.values()) }
+
+  def custom_roles(self, query, body):
+    return 200, { 'roles': list(self.t.usr_roles.values()) }
+
+  def new_role(self, query, body):
+    return 201, { 'role': self.t.add_role(body['role']) }
+
+  def del_role(self, rid, query, body):
+    self.get(self.t.usr_roles, rid)
+    del self.t.usr_roles[rid]
+    return 200, None
+
+  def role(self, rid:str) -> dict:
+    '''INTERNAL: look-up a system or custom role'''
+    if rid in self.t.sys_roles: return self.t.sys_roles[rid]
+    return self.get(self.t.usr_roles, rid)
+
+  def domain_grants(self, did, gid, query, body):
+    self.get(self.t.groups, gid)
+    return 200, { 'roles': [] }
+
+  def project_grants(self, pid, gid, query, body):
+    self.get(self.t.projects, pid)
+    self.get(self.t.groups, gid)
+    return 200, { 'roles': [ self.role(r) for r in self.t.grants.get((pid, gid), ()) ] }
+
+  def role_assignments(self, query, body):
+    if 'user.id' in query or 'scope.domain.id' in query: return 200, { 'role_assignments': [], 'links': { 'next': None } }
+    assignments = [
+      { 'role': { 'id': rid }, 'group': { 'id': gid }, 'scope': { 'project': { 'id': pid } } }
+      for (pid, gid), rids in self.t.grants.items()
+        if query.get('scope.project.id', pid) == pid and query.get('group.id', gid) == gid
+      for rid in rids if query.get('role.id', rid) == rid
+    ]
+    start = int(query.get('marker', 0))
+    end = start + ASSIGNMENTS_PAGE
+    nxt = None
+    if end < len(assignments): nxt = '/v3/role_assignments?' + urlencode(dict(query, marker = end))
+    return 200, { 'role_assignments': assignments[start:end], 'links': { 'next': nxt } }
+
+  def grant(self, pid, gid, rid, query, body):
+    self.get(self.t.projects, pid)
+    self.get(self.t.groups, gid)
+    self.role(rid)
+    self.t.grants.setdefault((pid, gid), set()).add(rid)
+    return 204, None
+
+  def revoke(self, pid, gid, rid, query, body):
+    if rid not in self.t.grants.get((pid, gid), ()): raise Reply(404, f'{rid}: not granted')
+    self.t.grants[(pid, gid)].discard(rid)
+    return 204, None
+
+  def list_projects(self, query, body):
+    self.t.expire()
+    return 200, { 'projects': by_name(self.t.projects.values(), query) }
+
+  def new_project(self, query, body):
+    prj = body['project']
+    if self.t.project_by_name(prj['name']) is not None: raise Reply(409, f'{prj["name"]}: already exists')
+    self.get(self.t.projects, prj['parent_id'])
+    return 201, { 'project': self.t.add_project(prj['name'], prj['parent_id'], prj.get('description', '')) }
+
+  def del_project(self, pid, query, body):
+    self.t.expire()
+    prj = self.get(self.t.projects, pid)
+    if self.t.delete_delay > 0:
+      prj['status'] = 'deleting'
+      self.t.deleting.setdefault(pid, time.monotonic() + self.t.delete_delay)
+    else:
+      del self.t.projects[pid]
+    return 204, None
+
+  def project_details(self, pid, query, body):
+    self.t.expire()
+    return 200, { 'project': self.get(self.t.projects, pid) }
+
+  def securitytoken(self, query, body):
+    return 201, { 'credential': {
+      'access': self.t.uuid()[:20].upper(), 'secret': self.t.uuid(),
+      'securitytoken': self.t.uuid(), 'expires_at': '',
+    }}
+
+  def list_servers(self, pid, detail, query, body):
+    servers = [ s for s in self.t.servers.values() if s['tenant_id'] == pid ]
+    if 'name' in query: servers = [ s for s in servers if re.search(query['name'], s['name']) ]
+    if 'status' in query: servers = [ s for s in servers if s['status'] == query['status'] ]
+    start = 0
+    if 'marker' in query:
+      ids = [ s['id'] for s in servers ]
+      if query['marker'] not in ids: raise Reply(400, f'{query["marker"]}: invalid marker')
+      start = ids.index(query['marker']) + 1
+    limit = min(int(query.get('limit', SERVERS_PAGE)), SERVERS_PAGE)
+    servers = servers[start:start+limit]
+    if not detail: servers = [ { 'id': s['id'], 'name': s['name'] } for s in servers ]
+    return 200, { 'servers': servers }
+
+  def server_action(self, pid, sid, query, body):
+    server = self.get(self.t.servers, sid)
+    if 'os-start' in body: server['status'] = 'ACTIVE'
+    elif 'os-stop' in body: server['status'] = 'SHUTOFF'
+    return 202, None
+
+  def availability_zones(self, rid, query, body):
+    region = self.get(self.t.projects, rid)['name']
+    return 200, { 'availabilityZoneInfo': [
+      { 'zoneName': f'{region}-{z:02d}', 'zoneState': { 'available': True }, 'hosts': None }
+      for z in (1,2,3)
+    ]}
+
+  def flavors(self, rid, query, body):
+    return 200, { 'flavors': [
+      { 'id': f's3.{size}.{ratio}', 'name': f's3.{size}.{ratio}', 'vcpus': vcpus, 'ram': vcpus * ratio * 1024 }
+      for size, vcpus in (('medium',1), ('large',2), ('xlarge',4)) for ratio in (1,2,4)
+    ]}
+
+  def deh_types(self, rid, az, query, body):
+    return 200, { 'dedicated_host_types': [ { 'host_type': 's3', 'host_type_name': 'General computing' } ] }
+
+  def list_images(self, query, body):
+    images = self.t.images
+    for k,v in query.items():
+      if k not in ('limit', 'marker'): images = [ i for i in images if str(i.get(k)) == v ]
+    start = 0
+    if 'marker' in query:
+      ids = [ i['id'] for i in images ]
+      if query['marker'] not in ids: raise Reply(400, f'{query["marker"]}: invalid marker')
+      start = ids.index(query['marker']) + 1
+    limit = int(query.get('limit', IMAGES_PAGE))
+    page = images[start:start+limit]
+    reply = { 'images': page, 'first': '/v2/images', 'schema': '/v2/schemas/images' }
+    if start + limit < len(images): reply['next'] = f'/v2/images?limit={limit}&marker={page[-1]["id"]}'
+    return 200, reply
+
+  def list_resources(self, did, query, body):
+    if did != self.t.domain['id']: raise Reply(404, f'{did}: not found')
+    resources = self.t.resources
+    if 'region_id' in query: resources = [ r for r in resources if r['region_id'] == query['region_id'] ]
+    if 'type' in query:
+      resources = [ r for r in resources
+                      if query['type'] in (r['type'], '{provider}.{type}'.format(**r)) ]
+    start = int(query.get('marker', 0))
+    limit = min(int(query.get('limit', RMS_PAGE)), RMS_PAGE)
+    page = resources[start:start+limit]
+    marker = str(start + limit) if start + limit < len(resources) else None
+    return 200, { 'resources': page,
+                  'page_info': { 'current_count': len(page), 'next_marker': marker } }
+
+  def list_tags(self, query, body):
+    return 200, { 'tags': self.t.tags, 'total_count': len(self.t.tags) }
+
+  def tag_action(self, query, body):
+    for tag in body['tags']:
+      if body['action'] == 'create':
+        if tag not in self.t.tags: self.t.tags.append(tag)
+      elif tag in self.t.tags:
+        self.t.tags.remove(tag)
+    return 204, None
+
+class Handler(BaseHTTPRequestHandler):
+  '''Keep-alive request handler dispatching to {py:obj}`Api`'''
+  protocol_version = 'HTTP/1.1'
+  disable_nagle_algorithm = True
+
+  def reply(self, code:int, body, headers:dict|None = None) -> None:
+    data = b'' if body is None else json.dumps(body).encode()
+    self.send_response(code)
+    if body is not None: self.send_header('Content-Type', 'application/json')
+    if code not in (204, 304): self.send_header('Content-Length', str(len(data)))
+    for k,v in (headers or {}).items():
+      self.send_header(k, v)
+    self.end_headers()
+    if code not in (204, 304): self.wfile.write(data)
+
+  def handle_any(self) -> None:
+    standin = self.server.standin
+    url = urlsplit(self.path)
+    query = { k: v[-1] for k,v in parse_qs(url.query).items() }
+    length = int(self.headers.get('Content-Length', 0))
+    raw = self.rfile.read(length) if length else b''
+    if url.path == STATS_PATH:
+      with standin.calls_lock:
+        self.reply(200, { 'calls': dict(standin.calls), 'total': sum(standin.calls.values()) })
+      return
+    standin.count(self.command, url.path)
+    if standin.latency > 0: time.sleep(standin.latency)
+    try:
+      body = json.loads(raw) if raw else None
+      api = standin.api
+      if url.path == '/v3/auth/tokens':
+        if self.command == 'POST':
+          self.reply(*api.new_token(body))
+          return
+        if self.command == 'DELETE':
+          with api.t.lock:
+            api.t.tokens.discard(self.headers.get('X-Subject-Token'))
+          self.reply(204, None)
+          return
+      if self.headers.get('X-Auth-Token') not in api.t.tokens:
+        raise Reply(401, 'The request you have made requires authentication.')
+      self.reply(*api.dispatch(self.command, url.path, query, body))
+    except Reply as e:
+      self.reply(e.code, { 'error': { 'code': e.code, 'message': str(e) } })
+    except (KeyError, TypeError, ValueError) as e:
+      self.reply(400, { 'error': { 'code': 400, 'message': f'Bad request: {e!r}' } })
+
+  do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = handle_any
+
+  def log_message(self, *args):
+    pass
+
+class StandIn:
+  '''Threaded stand-in server
+
+  Keeps per end-point request counters in `calls`, keyed by
+  `METHOD /path`, with object IDs replaced by `{id}`.
+  '''
+
+  def __init__(self, tenant:Tenant|None = None, latency:float = 0.0,
+                host:str = '127.0.0.1', port:int = 0) -> None:
+    '''Constructor
+
+    :param tenant: tenant data (defaults to a small {py:obj}`Tenant`)
+    :param latency: seconds added to every request
+    :param host: address to listen on
+    :param port: TCP port (`0` picks a free port)
+    '''
+    self.api = Api(Tenant() if tenant is None else tenant)
+    self.latency = latency
+    self.calls = Counter()
+    self.calls_lock = threading.Lock()
+    self.server = ThreadingHTTPServer((host, port), Handler)
+    self.server.daemon_threads = True
+    self.server.standin = self
+    self.thread = None
+
+  @property
+  def tenant(self) -> Tenant:
+    return self.api.t
+
+  @property
+  def netloc(self) -> str:
+    '''`host:port` of the server'''
+    host, port = self.server.server_address[:2]
+    return f'{host}:{port}'
+
+  @property
+  def url(self) -> str:
+    '''Base URL of the server'''
+    return f'http://{self.netloc}'
+
+  def count(self, method:str, path:str) -> None:
+    '''INTERNAL: count a request'''
+    path = re.sub(r'/[0-9a-f]{32}(?=/|$)', '/{id}', path)
+    with self.calls_lock:
+      self.calls[f'{method} {path}'] += 1
+
+  def total_calls(self) -> int:
+    '''Total number of requests served'''
+    with self.calls_lock:
+      return sum(self.calls.values())
+
+  def reset_stats(self) -> None:
+    '''Clear the request counters'''
+    with self.calls_lock:
+      self.calls.clear()
+
+  def start(self) -> 'StandIn':
+    '''Start serving in a background thread'''
+    self.thread = threading.Thread(target = self.server.serve_forever, daemon = True)
+    self.thread.start()
+    return self
+
+  def stop(self) -> None:
+    '''Stop the server'''
+    self.server.shutdown()
+    self.server.server_close()
+
+  def __enter__(self) -> 'StandIn':
+    return self.start()
+
+  def __exit__(self, *exc) -> None:
+    self.stop()
+
+def main(argv:list[str]) -> None:
+  cli = argparse.ArgumentParser(description = 'Local stand-in for the cloud REST APIs')
+  cli.add_argument('--host', default = '127.0.0.1', help = 'Address to listen on')
+  cli.add_argument('-p', '--port', type = int, default = 8080, help = 'TCP port')
+  cli.add_argument('--latency', type = float, default = 0.0, help = 'Seconds added to every request')
+  cli.add_argument('--seed', type = int, default = 0, help = 'Random seed')
+  cli.add_argument('--delete-delay', type = float, default = 0.0,
+                  help = 'Seconds a deleted project takes to disappear')
+  for kind, count in (('users',100), ('groups',20), ('projects',10), ('resources',500),
+                      ('servers',20), ('images',50), ('roles',10), ('tags',10)):
+    cli.add_argument(f'--{kind}', type = int, default = count, help = f'Number of {kind}')
+  args = cli.parse_args(argv)
+
+  tenant = Tenant(users = args.users, groups = args.groups, projects = args.projects,
+                  resources = args.resources, servers = args.servers, images = args.images,
+                  roles = args.roles, tags = args.tags, seed = args.seed,
+                  delete_delay = args.delete_delay)
+  srv = StandIn(tenant, args.latency, args.host, args.port)
+  sys.stderr.write(f'Serving on {srv.url}\n')
+  try:
+    srv.server.serve_forever()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    srv.server.server_close()
+
+if __name__ == '__main__':
+  main(sys.argv[1:])
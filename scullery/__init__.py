@@ -3,8 +3,13 @@
 
 '''
 
+import gc
+import importlib
 import os
 import sys
+import threading
+
+from typing import TYPE_CHECKING
 
 try:
   from icecream import ic
@@ -20,45 +25,115 @@ sys.path.append(os.path.dirname(__file__))
 from version import VERSION
 import __meta__
 
-import creds
-import api
-
 sys.path = saved_path
 del saved_path
 
+if TYPE_CHECKING:
+  from scullery import api
+
+LAZY_MODULES = ('api', 'creds', 'snapshot')
+'''Modules imported on first use'''
+
+def __getattr__(name:str):
+  '''Import `api`, `creds` and `snapshot` on first use
+
+  Keeps start-up fast for commands that do not connect to a cloud.
+  '''
+  if name not in LAZY_MODULES:
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+  saved_path = list(sys.path)
+  sys.path.append(os.path.dirname(__file__))
+  try:
+    module = importlib.import_module(name)
+  finally:
+    sys.path = saved_path
+  globals()[name] = module
+  return module
+
 clouds = {}
 '''Dictionary keeping cloud connections'''
 
+local = threading.local()
+'''Per-thread settings: `local.cloud` overrides the default cloud'''
+
 defaults = {
   'cloud': None,
+  'token_cache': True,
+  'rate_limits': {},
+  'parallel': 1,
+  'cassette': None,
+  'cache_ttl': 0,
+  'offline': False,
+  'max_age': None,
 }
 '''Default options'''
 #
 # Support functions
 #
-def cloud(cloud_name:str = '', scoped:bool =False, **kwargs) -> api.ApiSession:
+def cloud(cloud_name:str = '', scoped:bool =False, snapshot:bool = False, **kwargs) -> 'api.ApiSession':
   '''Return connections to clouds
 
   :param cloud_name: Cloud to configure
   :param scoped: create a scoped token
+  :param snapshot: the caller only reads the IAM directory, so it may be served from a local snapshot
   :param **kwargs: optional credentials to use
   :returns: An API session
+  :raises RuntimeError: if offline and `snapshot` is not allowed
+
+  Without `cloud_name`, threads started by {py:obj}`scullery.multicloud.run`
+  get the session of the cloud they were started for.
+
+  With `snapshot`, a {py:obj}`scullery.snapshot.OfflineSession` is
+  returned when offline, or when the snapshot is not older than the
+  `max_age` default.
   '''
-  cloud_id = f'{cloud_name if cloud_name != "" else defaults["cloud"]}{":scoped" if scoped else ""}'
+  default_cloud = getattr(local, 'cloud', None) or defaults['cloud']
+  cloud_id = f'{cloud_name if cloud_name != "" else default_cloud}{":scoped" if scoped else ""}'
+
+  if defaults['offline'] or defaults['max_age'] is not None:
+    if snapshot and not scoped:
+      if not f'{cloud_id}:snapshot' in clouds:
+        from scullery import snapshot as snapshots
+        session = snapshots.OfflineSession(cloud_creds(cloud_name, **kwargs))
+        age = session.snapshot.age()
+        if defaults['offline'] or (age is not None and age <= defaults['max_age']):
+          clouds[f'{cloud_id}:snapshot'] = session
+      if f'{cloud_id}:snapshot' in clouds: return clouds[f'{cloud_id}:snapshot']
+    elif defaults['offline']:
+      raise RuntimeError('This recipe is not available offline')
 
   if not cloud_id in clouds:
-    fopts = dict(kwargs)
-    if cloud_name != '':
-      fopts['cloud_name'] = cloud_name
-    elif 'cloud_name' not in fopts:
-      fopts['cloud_name'] = defaults['cloud'] # Default cloud
-    cloud_creds = creds.creds(**fopts)
-    clouds[cloud_id] = api.ApiSession(cloud_creds, scoped)
+    from scullery import api
+    clouds[cloud_id] = api.ApiSession(cloud_creds(cloud_name, **kwargs), scoped,
+                                      token_cache = defaults['token_cache'],
+                                      rate_limits = defaults['rate_limits'],
+                                      max_workers = defaults['parallel'],
+                                      cassette = defaults['cassette'],
+                                      cache_ttl = defaults['cache_ttl'])
 
   return clouds[cloud_id]
 
+def cloud_creds(cloud_name:str = '', **kwargs) -> dict:
+  '''Look-up the credentials used by {py:obj}`scullery.cloud`
+
+  :param cloud_name: Cloud to configure
+  :param **kwargs: optional credentials to use
+  :returns: dictionary containing credentials
+  '''
+  from scullery import creds
+  fopts = dict(kwargs)
+  if cloud_name != '':
+    fopts['cloud_name'] = cloud_name
+  elif 'cloud_name' not in fopts:
+    fopts['cloud_name'] = getattr(local, 'cloud', None) or defaults['cloud'] # Default cloud
+  return creds.creds(**fopts)
+
 def clean_up()->None:
   '''Clean-up all connections'''
   keys = list(clouds.keys())
   for k in keys:
     del clouds[k]
+  if defaults['cassette'] is not None:
+    gc.collect() # Let sessions revoke their tokens while recording
+    defaults['cassette'].close()
+    defaults['cassette'] = None
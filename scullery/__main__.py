@@ -6,6 +6,7 @@ import os
 import sys
 
 from argparse import ArgumentParser
+from urllib.parse import urlsplit
 
 try:
   from icecream import ic
@@ -16,58 +17,140 @@ if '__file__' in globals():
   sys.path.append(os.path.join(os.path.dirname(__file__),'..'))
 
 import scullery
-from scullery import proxycfg
 from scullery import parsers
-from scullery import api
-
-from scullery import rcp_ecs
-from scullery import rcp_ims
-from scullery import rcp_groups
-from scullery import rcp_kermit
-from scullery import rcp_projects
-from scullery import rcp_rms
-from scullery import rcp_roles
-from scullery import rcp_showcfg
-from scullery import rcp_tms
-from scullery import rcp_users
-
-from scullery import cloud
-
-def cmd_cli():
-  ''' Command Line Interface argument parser '''
+from scullery import ratelimit
+
+def cmd_cli(lazy:bool = False, recipe:str|None = None):
+  ''' Command Line Interface argument parser
+
+  :param lazy: only import the module of the selected `recipe`
+  :param recipe: recipe selected on the command line
+
+  By default all recipe modules are imported (as needed for the
+  documentation).  See {py:obj}`scullery.parsers.add_parsers`.
+  '''
   cli = ArgumentParser(prog=scullery.__meta__.name,description=scullery.__meta__.description)
 
   cli.add_argument('-A','--autocfg',help='Use WinReg to configure proxy', action='store_true', default = False)
   cli.add_argument('-C','--cloud', help='Specify default cloud config')
+  clouds = cli.add_mutually_exclusive_group()
+  clouds.add_argument('--clouds', help='Run the recipe against each of these clouds in parallel (comma separated)', type = lambda v: [ cn for cn in v.split(',') if cn ], metavar = 'CLOUD,...')
+  clouds.add_argument('--all-clouds', help='Run the recipe against every cloud in clouds.yaml in parallel', action='store_true', default = False)
   cli.add_argument('-V','--version', action='version', version='%(prog)s '+ scullery.VERSION)
   cli.add_argument('-d', '--debug', help='Turn on debugging options', action='store_true', default = False)
+  cli.add_argument('--no-token-cache', dest='token_cache', help='Do not re-use cached session tokens', action='store_false', default = True)
+  cli.add_argument('-j', '--parallel', help='Number of concurrent API calls used by recipes', type = int, default = 1, metavar = 'N')
+  cli.add_argument('--record', help='Record API requests and responses to a cassette file', metavar = 'FILE')
+  cli.add_argument('--replay', help='Replay API responses from a cassette file', metavar = 'FILE')
+  cli.add_argument('--replay-latency', help='Seconds added to each replayed request or "recorded"', default = '0', metavar = 'SECS')
+  cli.add_argument('--api-endpoint', help='Send all API requests to URL (e.g. a local stand-in server)', metavar = 'URL')
+  cli.add_argument('--offline', help='Answer directory queries from the local snapshot only (see "cache sync")', action='store_true', default = False)
+  cli.add_argument('--max-age', help='Answer directory queries from the local snapshot if it is not older than SECS', type = float, default = None, metavar = 'SECS')
+  cli.add_argument('--no-daemon', help='Do not forward the command to a running "serve" daemon', action='store_true', default = False)
+  cli.add_argument('--rate-limit', dest='rate_limits', help='Limit requests per second to a service, e.g. iam=10[:burst] (can be specified multiple times)', action='append', default = [], metavar = 'SERVICE=RATE')
 
   subp = cli.add_subparsers(
                     title ='recipe',
                     description = 'Recipe to execute',
                     required = False,
-                    help = 'Run a recipe')
-  for _, fact in sorted(parsers.PARSER_FACTORY.items()):
-    fact(subp)
+                    help = 'Run a recipe',
+                    parser_class = parsers.RecipeParser)
+  parsers.add_parsers(subp, lazy, recipe)
 
   return cli
 
-def main(argv:list[str]) -> None:
-  '''Main script entry point
+def run(argv:list[str]) -> int:
+  '''Parse the command line and run the selected recipe
 
   :param argv: Command line arguments
+  :returns: exit status
+
+  Sessions are left open in {py:obj}`scullery.clouds`, see
+  {py:obj}`scullery.clean_up`.
   '''
-  cli = cmd_cli()
+  cli = cmd_cli(lazy = True)
+  args, _ = cli.parse_known_args(argv)
+  if hasattr(args, 'recipe_name'):
+    # Import only the selected recipe and parse again
+    cli = cmd_cli(lazy = True, recipe = args.recipe_name)
   args = cli.parse_args(argv)
 
-  if args.debug: api.http_logging()
+  if args.debug: scullery.api.http_logging()
   if args.cloud is not None: scullery.defaults['cloud'] = args.cloud
-
+  scullery.defaults['token_cache'] = args.token_cache
+  scullery.defaults['parallel'] = args.parallel
+  scullery.defaults['offline'] = args.offline
+  scullery.defaults['max_age'] = args.max_age
+  if args.api_endpoint is not None:
+    endpoint = urlsplit(args.api_endpoint)
+    scullery.api.set_api_endpoint(endpoint.netloc, endpoint.scheme or 'https')
+  for limit in args.rate_limits:
+    try:
+      host, rate, burst = ratelimit.parse_limit(limit)
+    except ValueError:
+      cli.error(f'argument --rate-limit: invalid value: {limit!r}')
+    scullery.defaults['rate_limits'][host] = (rate, burst)
+  if args.replay is not None:
+    try:
+      latency = scullery.api.cassettes.parse_latency(args.replay_latency)
+    except ValueError:
+      cli.error(f'argument --replay-latency: invalid value: {args.replay_latency!r}')
+    scullery.defaults['cassette'] = scullery.api.cassettes.Cassette(args.replay, scullery.api.cassettes.MODE.REPLAY, latency)
+  elif args.record is not None:
+    scullery.defaults['cassette'] = scullery.api.cassettes.Cassette(args.record, scullery.api.cassettes.MODE.RECORD)
+
+  cloud_names = args.clouds
+  if args.all_clouds:
+    cloud_names = scullery.creds.cloud_names()
+    if not cloud_names: cli.error('argument --all-clouds: no clouds configured')
+
+  failed = False
   if not hasattr(args,'recipe_cb'):
     cli.print_help()
+  elif cloud_names:
+    from scullery import multicloud
+    results = multicloud.run(args.recipe_cb, args, cloud_names)
+    multicloud.report(results)
+    failed = not all(r.ok for r in results)
   else:
     args.recipe_cb(args)
+  if args.debug:
+    for cloud_id, cc in scullery.clouds.items():
+      sys.stderr.write(f'{cloud_id}: {dict(cc.limiter.stats)}\n')
+  return 1 if failed else 0
+
+def session_options(argv:list[str]) -> tuple:
+  '''Return the options of a command line fixed when a session is created
+
+  :param argv: Command line arguments
+  :returns: hashable tuple
+
+  Used by {py:obj}`scullery.daemon.Server` to keep separate sessions
+  for commands that would configure them differently.
+  '''
+  args, _ = cmd_cli(lazy = True).parse_known_args(argv)
+  return (args.api_endpoint, tuple(args.rate_limits), args.parallel, args.token_cache,
+          args.record, args.replay, args.replay_latency)
+
+def main(argv:list[str]) -> None:
+  '''Main script entry point
+
+  :param argv: Command line arguments
+
+  If a {py:obj}`scullery.daemon` is running, the command is forwarded
+  to it unless `--no-daemon` is given.  Commands recording or
+  replaying a cassette always run in this process.
+  '''
+  args, _ = cmd_cli(lazy = True).parse_known_args(argv)
+  cassette = args.record is not None or args.replay is not None
+  if not args.no_daemon and not cassette and getattr(args, 'recipe_name', 'serve') != 'serve':
+    from scullery import daemon
+    status = daemon.forward(argv)
+    if status is not None: sys.exit(status)
+
+  status = run(argv)
   scullery.clean_up()
+  if status: sys.exit(status)
 
 ###################################################################
 #
@@ -0,0 +1,420 @@
+#!python3
+#
+# Asyncio API sessions
+#
+'''Asyncio REST API session and service clients
+
+Async counterparts of {py:obj}`scullery.api.ApiSession` and the
+service clients.  Methods have the same names as the synchronous
+versions but must be awaited.  Paginated queries such as
+`Ims.images` and `Rms.resources` are async generators and are used
+with `async for`.
+
+The service client methods are generated from the synchronous
+clients (see {py:obj}`scullery.aio.Client`): their code runs in
+worker threads of the session while requests go through the aiohttp
+connection pool, so no method blocks the event loop.
+
+Requires [aiohttp](https://docs.aiohttp.org/).
+
+```python
+async with AsyncApiSession(creds.creds(cloud_name = 'otc')) as cc:
+  users, groups = await asyncio.gather(cc.iam.users(), cc.iam.groups())
+```
+'''
+import asyncio
+import functools
+import inspect
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+try:
+  import aiohttp
+except ImportError:
+  aiohttp = None
+
+try:
+  from icecream import ic
+except ImportError:  # Graceful fallback if IceCream isn't installed.
+  ic = lambda *a: None if not a else (a[0] if len(a) == 1 else a)  # noqa
+
+from scullery import api
+from scullery import ratelimit
+
+CONNECTION_LIMIT = 100
+'''Maximum number of simultaneous connections (and worker threads) of a session'''
+
+class HTTPError(RuntimeError):
+  '''Raised by {py:obj}`scullery.aio.Response.raise_for_status`'''
+
+class Response:
+  '''Fully read HTTP response
+
+  Provides the subset of the `requests.Response` interface used by
+  the service clients.
+  '''
+  def __init__(self, method:str, url:str, status:int, reason:str, headers, content:bytes) -> None:
+    '''Constructor'''
+    self.method = method
+    self.url = url
+    self.status_code = status
+    self.reason = reason
+    self.headers = headers
+    self.content = content
+    self.data = None
+
+  @property
+  def ok(self) -> bool:
+    '''True if status code is less than 400'''
+    return self.status_code < 400
+
+  @property
+  def text(self) -> str:
+    '''Response body as text'''
+    return self.content.decode('utf-8', errors = 'replace')
+
+  def json(self):
+    '''Decode the response body as JSON'''
+    if self.data is None: self.data = api.jsoncodec.loads(self.content)
+    return self.data
+
+  def raise_for_status(self) -> None:
+    '''Raise {py:obj}`scullery.aio.HTTPError` on error status codes'''
+    if not self.ok:
+      raise HTTPError(f'{self.status_code} {self.reason}: {self.method} {self.url}')
+
+class AsyncApiSession(api.SessionBase):
+  '''Asyncio API Session class'''
+
+  def __init__(self, creds:dict, scoped:bool = False,
+                limit:int = CONNECTION_LIMIT, limit_per_host:int = 0,
+                token_cache:bool = False,
+                rate_limits:dict[str,tuple[float,int]]|None = None,
+                limiter:ratelimit.RateLimiter|None = None) -> None:
+    '''Constructor
+
+    :param creds: Contain session credentials
+    :param scoped: create a scoped token
+    :param limit: maximum number of simultaneous connections and of client calls running at once
+    :param limit_per_host: maximum number of simultaneous connections per host (`0` for no limit)
+    :param token_cache: re-use tokens saved by other processes
+    :param rate_limits: dictionary of service/host : (requests per second, burst)
+    :param limiter: share an existing rate limiter instead of `rate_limits`
+
+    The session token is created by {py:obj}`scullery.aio.AsyncApiSession.open`
+    or when entering the session as an async context manager.
+    '''
+    if aiohttp is None:
+      raise ImportError('aiohttp is required for asyncio sessions')
+    super().__init__(creds, scoped, token_cache)
+    if limiter is None:
+      limiter = ratelimit.RateLimiter(rate_limits,
+                          exceptions = (aiohttp.ClientConnectionError, asyncio.TimeoutError))
+    self.limiter = limiter
+    self.limit = limit
+    self.limit_per_host = limit_per_host
+    self.http = None
+    self.token_lock = None
+    self.loop = None
+    self.executor = None
+
+    self.deh = Deh(self)
+    self.ecs = Ecs(self)
+    self.iam = Iam(self)
+    self.ims = Ims(self)
+    self.tms = Tms(self)
+    self.rms = Rms(self)
+
+    self.region_data = None
+    self.project_data = None
+
+  async def open(self) -> None:
+    '''Create the connection pool and the session token
+
+    :raises PermissionError: if authentication fails
+    '''
+    self.token_lock = asyncio.Lock()
+    self.loop = asyncio.get_running_loop()
+    self.executor = ThreadPoolExecutor(max_workers = self.limit)
+    self.http = aiohttp.ClientSession(connector = aiohttp.TCPConnector(
+                                        limit = self.limit,
+                                        limit_per_host = self.limit_per_host),
+                                      json_serialize = lambda obj: api.jsoncodec.dumps(obj).decode())
+    cached = self.cached_token()
+    if cached is not None:
+      self.set_token(cached['token'], cached['expires_at'])
+    else:
+      await self.new_token()
+
+  async def close(self) -> None:
+    '''Revoke the session token (unless cached) and close connections'''
+    if self.http is None: return
+    try:
+      if self.revocable():
+        await self.revoke_token(self.token)
+    finally:
+      self.token = None
+      await self.http.close()
+      self.http = None
+      self.executor.shutdown(wait = False, cancel_futures = True)
+      self.executor = None
+
+  async def __aenter__(self):
+    await self.open()
+    return self
+
+  async def __aexit__(self, *exc) -> None:
+    await self.close()
+
+  async def run_sync(self, fn:Callable, *args, **kwargs) -> Any:
+    '''Run blocking code in a worker thread of the session
+
+    :param fn: function to call with `args` and `kwargs`
+    :returns: result of `fn`
+    '''
+    return await self.loop.run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+
+  async def send(self, method:str, api_url:str, headers:dict|None = None, **kwargs) -> Response:
+    '''INTERNAL: send a request and read the response'''
+    async with self.http.request(method, api_url, headers = headers, **kwargs) as resp:
+      content = await resp.read()
+      return Response(method, api_url, resp.status, resp.reason, resp.headers, content)
+
+  async def new_token(self) -> None:
+    '''Create a new session token
+
+    :raises PermissionError: if authentication fails
+    '''
+    api_url = self.tokens_api_path()
+    response = await self.limiter.acall('POST', api_url,
+                          lambda: self.send('POST', api_url, json = self.auth_data))
+    if response.status_code != 201 or not 'X-Subject-Token' in response.headers:
+      raise PermissionError(response.text)
+
+    self.set_token(response.headers['X-Subject-Token'], self.parse_token(response))
+    self.save_token()
+
+  def set_token(self, token:str, expires_at:float|None) -> None:
+    '''Make `token` the session token
+
+    :param token: token to use
+    :param expires_at: expiration time (seconds since the epoch)
+    '''
+    self.token = token
+    self.expires_at = expires_at
+
+  async def refresh_token(self, refresh_ahead:float = api.tokencache.REFRESH_AHEAD) -> bool:
+    '''Refresh the session token ahead of its expiration
+
+    :param refresh_ahead: seconds before `expires_at` to refresh
+    :returns: True if the token was replaced
+    '''
+    if self.expires_at is None or time.time() < self.expires_at - refresh_ahead:
+      return False
+    async with self.token_lock:
+      if time.time() < self.expires_at - refresh_ahead: return False
+      old_token = self.token
+      await self.new_token()
+    if self.cache_key is None:
+      await self.revoke_token(old_token)
+    return True
+
+  async def revoke_token(self, token:str) -> None:
+    '''Revoke a session token
+
+    :param token: token to revoke
+    '''
+    await self.send('DELETE', self.tokens_api_path(), headers = {
+        'X-Auth-Token': self.token,
+        'X-Subject-Token': token,
+    })
+
+  async def request(self, method:str, api_url:str, **kwargs) -> Response:
+    '''Send a REST API request over the session connection pool
+
+    :param method: HTTP method
+    :param api_url: URL for REST API
+    :param **kwargs: additional params as needed by REST API
+    '''
+    await self.refresh_token()
+    headers = kwargs.pop('headers', None) or dict()
+    send = lambda: self.send(method, api_url, headers = { 'X-Auth-Token': self.token, **headers }, **kwargs)
+    resp = await self.limiter.acall(method, api_url, send)
+    if resp.status_code == 401 and self.cache_key is not None:
+      # Cached token may have been revoked elsewhere
+      api.tokencache.discard(self.cache_key)
+      await self.new_token()
+      resp = await self.limiter.acall(method, api_url, send)
+    return resp
+
+  async def get(self, api_url, **kwargs) -> Response:
+    '''REST API `get` method
+
+    :param api_url: URL for REST API
+    :param **kwargs: additional params as needed by REST API
+    '''
+    return await self.request('GET', api_url, **kwargs)
+  async def post(self, api_url, **kwargs) -> Response:
+    '''REST API `post` method
+
+    :param api_url: URL for REST API
+    :param **kwargs: additional params as needed by REST API
+    '''
+    return await self.request('POST', api_url, **kwargs)
+  async def patch(self, api_url, **kwargs) -> Response:
+    '''REST API `patch` method
+
+    :param api_url: URL for REST API
+    :param **kwargs: additional params as needed by REST API
+    '''
+    return await self.request('PATCH', api_url, **kwargs)
+  async def delete(self, api_url, **kwargs) -> Response:
+    '''REST API `delete` method
+
+    :param api_url: URL for REST API
+    :param **kwargs: additional params as needed by REST API
+    '''
+    return await self.request('DELETE', api_url, **kwargs)
+  async def put(self, api_url, **kwargs) -> Response:
+    '''REST API `put` method
+
+    :param api_url: URL for REST API
+    :param **kwargs: additional params as needed by REST API
+    '''
+    return await self.request('PUT', api_url, **kwargs)
+
+  async def project_id(self) -> str:
+    if self.project_name is None: return await self.region_id()
+    if self.project_data is None:
+      q = await self.iam.projects(name = self.project_name)
+      if len(q) != 1: raise KeyError(self.project_name)
+      self.project_data = q[0]
+    return self.project_data['id']
+
+  async def region_id(self) -> str:
+    if self.region_data is None:
+      q = await self.iam.projects(name = self.region)
+      if len(q) != 1: raise KeyError(self.region)
+      self.region_data = q[0]
+    return self.region_data['id']
+
+class Client:
+  '''Async service client
+
+  Every public method of the synchronous client class `SYNC` is
+  available as a coroutine (generators as async generators).  The
+  synchronous code runs in a worker thread of the session, on a
+  blocking view of the session whose requests are sent by the event
+  loop, so there is a single implementation of each method.  Other
+  attributes are those of the synchronous client.
+  '''
+  SYNC = None
+  '''Synchronous client class'''
+
+  def __init__(self, session) -> None:
+    '''Constructor'''
+    self.session = session
+    self.sync = self.SYNC(Blocking(session))
+
+  def __getattr__(self, name:str):
+    return getattr(self.sync, name)
+
+  def __init_subclass__(cls, **kwargs) -> None:
+    super().__init_subclass__(**kwargs)
+    for name, fn in inspect.getmembers(cls.SYNC, inspect.isfunction):
+      if not name.startswith('_'): setattr(cls, name, coroutine(fn))
+
+def coroutine(fn:Callable) -> Callable:
+  '''INTERNAL: async version of a synchronous client method'''
+  if inspect.isgeneratorfunction(fn):
+    @functools.wraps(fn)
+    async def agen(self, *args, **kwargs):
+      items = fn(self.sync, *args, **kwargs)
+      done = object()
+      try:
+        while (item := await self.session.run_sync(next, items, done)) is not done:
+          yield item
+      finally:
+        await self.session.run_sync(items.close)
+    return agen
+
+  @functools.wraps(fn)
+  async def method(self, *args, **kwargs):
+    return await self.session.run_sync(fn, self.sync, *args, **kwargs)
+  return method
+
+class Blocking:
+  '''INTERNAL: blocking view of an async session
+
+  Used by the synchronous client code running in worker threads.
+  Coroutine methods of the session block until the event loop
+  completes them; service clients are their synchronous versions.
+  '''
+  def __init__(self, session) -> None:
+    self.session = session
+    self.max_workers = session.limit
+    '''Concurrent calls of `map`'''
+
+  map = api.ApiSession.map
+
+  def __getattr__(self, name:str):
+    value = getattr(self.session, name)
+    if isinstance(value, Client): return value.sync
+    if not inspect.iscoroutinefunction(value): return value
+    def call(*args, **kwargs):
+      return asyncio.run_coroutine_threadsafe(value(*args, **kwargs), self.session.loop).result()
+    return call
+
+class Iam(Client):
+  '''Async IAM client
+
+  See {py:obj}`scullery.iam.Iam` for method documentation.
+  '''
+  SYNC = api.iam.Iam
+
+class Ecs(Client):
+  '''Async ECS client
+
+  See {py:obj}`scullery.ecs.Ecs` for method documentation.
+  '''
+  SYNC = api.ecs.Ecs
+
+class Ims(Client):
+  '''Async IMS client
+
+  See {py:obj}`scullery.ims.Ims` for method documentation.
+  '''
+  SYNC = api.ims.Ims
+
+class Rms(Client):
+  '''Async RMS client
+
+  See {py:obj}`scullery.rms.Rms` for method documentation.
+  '''
+  SYNC = api.rms.Rms
+
+class Tms(Client):
+  '''Async TMS client
+
+  See {py:obj}`scullery.tms.Tms` for method documentation.
+  '''
+  SYNC = api.tms.Tms
+
+class Deh(Client):
+  '''Async DeH client
+
+  See {py:obj}`scullery.deh.Deh` for method documentation.
+  '''
+  SYNC = api.deh.Deh
+
+if __name__ == '__main__':
+  from scullery import creds
+
+  async def main():
+    async with AsyncApiSession(creds.creds(cloud_name = 'otc-de-iam')) as cc:
+      users, groups = await asyncio.gather(cc.iam.users(), cc.iam.groups())
+      ic(len(users), len(groups))
+
+  asyncio.run(main())
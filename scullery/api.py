@@ -10,6 +10,11 @@ import requests
 import shlex
 import subprocess
 import sys
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable
 
 try:
   from icecream import ic
@@ -19,11 +24,58 @@ except ImportError:  # Graceful fallback if IceCream isn't installed.
 import deh
 import ecs
 import iam
+import cassette as cassettes
 import ims
+import jsoncodec
 import tms
 import rms
+import tokencache
 
 from creds import STR as CRSTR
+from scullery import ratelimit
+
+POOL_CONNECTIONS = 8
+'''Number of per-host connection pools kept by a session'''
+POOL_MAXSIZE = 16
+'''Maximum number of keep-alive connections kept per host'''
+
+COALESCED_METHODS = ('GET', 'HEAD')
+'''Methods whose identical in-flight requests share one response'''
+
+class Flight:
+  '''INTERNAL: request in progress, shared by identical requests'''
+  def __init__(self) -> None:
+    self.done = threading.Event()
+    self.response = None
+    self.error = None
+
+  def wait(self) -> 'jsoncodec.Response':
+    '''Wait for the response of the leading request
+
+    :raises Exception: the exception raised by the leading request
+    '''
+    self.done.wait()
+    if self.error is not None: raise self.error
+    return self.response
+
+def http_session(pool_connections:int = POOL_CONNECTIONS,
+                 pool_maxsize:int = POOL_MAXSIZE) -> requests.Session:
+  '''Create a HTTP session with keep-alive connection pooling
+
+  :param pool_connections: number of hosts to keep connection pools for
+  :param pool_maxsize: maximum number of connections kept per host
+  :returns: a `requests.Session` object
+
+  All REST API calls made through a session re-use the TCP/TLS
+  connections to the same host instead of opening a new one for
+  every request.
+  '''
+  http = requests.Session()
+  adapter = requests.adapters.HTTPAdapter(pool_connections = pool_connections,
+                                          pool_maxsize = pool_maxsize)
+  http.mount('https://', adapter)
+  http.mount('http://', adapter)
+  return http
 
 def http_logging(level:int = 1) -> None:
   '''Enable HTTP request logging
@@ -58,25 +110,30 @@ if os.name == 'posix':
 else:
   token_shutdown = token_shutdown_win
 
-class ApiSession:
-  '''API Session class'''
+class SessionBase:
+  '''Session credentials and token handling common to all sessions'''
   IAM_HOST = 'iam.{region}.otc.t-systems.com'
   '''API Endpoint for creating session tokens'''
+  API_SCHEME = 'https'
+  '''API URL scheme'''
 
   def tokens_api_path(self) -> str:
     '''API URL path'''
-    api_host = ApiSession.IAM_HOST.format(region = self.region)
-    return f'https://{api_host}/v3/auth/tokens'
+    api_host = self.IAM_HOST.format(region = self.region)
+    return f'{self.API_SCHEME}://{api_host}/v3/auth/tokens'
 
-  def __init__(self, creds:dict, scoped:bool = False) -> None:
+  def __init__(self, creds:dict, scoped:bool = False, token_cache:bool = False) -> None:
     '''Constructor
 
     :param creds: Contain session credentials
+    :param scoped: create a scoped token
+    :param token_cache: re-use tokens saved by other processes
 
-    Will get a session token using REST API using the given
-    credentials
+    Prepares the token request from the given credentials.
     '''
     self.token = None
+    self.expires_at = None
+    self.cache_key = None
     jsdat = {
         'auth': {
           'identity': {
@@ -119,21 +176,264 @@ class ApiSession:
     self.domain_name = creds[CRSTR.USER_DOMAIN_NAME]
     self.cloud_name = creds[CRSTR.CLOUD_NAME] if CRSTR.CLOUD_NAME in creds else None
 
-    response = requests.post(self.tokens_api_path(), json = jsdat)
+    self.auth_data = jsdat
+    if token_cache:
+      scope = self.project_name if self.project_name else f'{self.region}{":scoped" if self.scoped else ""}'
+      self.cache_key = tokencache.cache_key(self.cloud_name, self.user_name,
+                                            self.domain_name, scope)
+
+  def cached_token(self) -> dict|None:
+    '''Look-up the session token in the token cache
+
+    :returns: dict with `token` and `expires_at` or None
+    '''
+    if self.cache_key is None: return None
+    return tokencache.lookup(self.cache_key)
+
+  def parse_token(self, response) -> float|None:
+    '''Get the token expiration from a token request response
+
+    :param response: response to a token creation request
+    :returns: expiration time in seconds since the epoch or None
+    '''
+    try:
+      return tokencache.parse_expires_at(response.json()['token']['expires_at'])
+    except (KeyError, ValueError, TypeError):
+      return None
+
+  def save_token(self) -> None:
+    '''Save the session token in the token cache (if enabled)'''
+    if self.cache_key is not None and self.expires_at is not None:
+      tokencache.store(self.cache_key, self.token, self.expires_at)
+
+  def revocable(self) -> bool:
+    '''Returns True if the session token should be revoked on close'''
+    return not self.token is None and (self.cache_key is None or self.expires_at is None)
+
+API_ENDPOINTS = [
+  (SessionBase, 'IAM_HOST', SessionBase.IAM_HOST),
+  (deh.Deh, 'API_HOST', deh.Deh.API_HOST),
+  (ecs.Ecs, 'API_HOST', ecs.Ecs.API_HOST),
+  (iam.Iam, 'API_HOST', iam.Iam.API_HOST),
+  (ims.Ims, 'API_HOST', ims.Ims.API_HOST),
+  (rms.Rms, 'API_HOST', rms.Rms.API_HOST),
+  (tms.Tms, 'API_HOST', tms.Tms.API_HOST),
+]
+'''INTERNAL: service classes with their default host templates'''
+
+def set_api_endpoint(netloc:str|None = None, scheme:str = 'https') -> None:
+  '''Point all service API end-points to a different host
+
+  :param netloc: `host[:port]` serving all services, or None to restore the cloud end-points
+  :param scheme: URL scheme, e.g. `http` for a local stand-in server
+
+  This is used to run recipes against a local stand-in of the cloud
+  REST APIs (see `benchmarks/standin.py`).  It affects all sessions.
+  '''
+  for cls, attr, default in API_ENDPOINTS:
+    setattr(cls, attr, default if netloc is None else netloc)
+    cls.API_SCHEME = scheme
+
+class ApiSession(SessionBase):
+  '''API Session class'''
+  SERVICES = {
+    'deh': deh.Deh,
+    'ecs': ecs.Ecs,
+    'iam': iam.Iam,
+    'ims': ims.Ims,
+    'rms': rms.Rms,
+    'tms': tms.Tms,
+  }
+  '''Service client classes, instantiated on first access'''
+
+  def __init__(self, creds:dict, scoped:bool = False,
+                pool_maxsize:int = POOL_MAXSIZE,
+                token_cache:bool = False,
+                rate_limits:dict[str,tuple[float,int]]|None = None,
+                limiter:ratelimit.RateLimiter|None = None,
+                max_workers:int = 1,
+                cassette:cassettes.Cassette|None = None,
+                cache_ttl:float = 0) -> None:
+    '''Constructor
+
+    :param creds: Contain session credentials
+    :param scoped: create a scoped token
+    :param pool_maxsize: maximum number of keep-alive connections per host
+    :param token_cache: re-use tokens saved by other processes
+    :param rate_limits: dictionary of service/host : (requests per second, burst)
+    :param limiter: share an existing rate limiter instead of `rate_limits`
+    :param max_workers: default number of concurrent calls for {py:obj}`scullery.api.ApiSession.map`
+    :param cassette: record requests to or replay responses from a {py:obj}`scullery.cassette.Cassette`
+    :param cache_ttl: seconds successful `GET` responses are re-used (`0` disables the read cache)
+
+    Will get a session token using REST API using the given
+    credentials.  All service clients share the same connection
+    pool.
+
+    If `token_cache` is enabled, unexpired tokens are taken from
+    the {py:obj}`scullery.tokencache` and newly created tokens
+    are saved there instead of being revoked when the session ends.
+
+    Requests are throttled and retried by a
+    {py:obj}`scullery.ratelimit.RateLimiter`.
+
+    The token cache is not used with a cassette, so recordings
+    always contain the token request.  Session tokens are never
+    written to a cassette.
+
+    With a `cache_ttl`, identical `GET` requests are answered from
+    memory until the entry expires.  Any other request empties the
+    read cache, so changes made through the session are seen.
+
+    Identical `GET` requests issued while one is in progress wait
+    for it and share its response (counted as `coalesced` in the
+    limiter `stats`).
+    '''
+    self.token = None
+    self.cache_ttl = cache_ttl
+    self.read_cache = {}
+    self.in_flight = {}
+    self.flight_lock = threading.Lock()
+    self.cassette = cassette
+    if cassette is not None:
+      cassette.add_secret(creds[CRSTR.PASSWORD])
+      token_cache = False
+    self.token_lock = threading.Lock()
+    if limiter is None:
+      limiter = ratelimit.RateLimiter(rate_limits,
+                          exceptions = (requests.ConnectionError, requests.Timeout))
+    self.limiter = limiter
+    self.max_workers = max(1, max_workers)
+    self.http = http_session(pool_maxsize = max(pool_maxsize, self.max_workers))
+    super().__init__(creds, scoped, token_cache)
+
+    cached = self.cached_token()
+    if cached is not None:
+      self.set_token(cached['token'], cached['expires_at'])
+    else:
+      self.new_token()
+
+    self.region_data = None
+    self.project_data = None
+
+  def __getattr__(self, name:str) -> Any:
+    '''Create service clients (`deh`, `ecs`, `iam`, ...) on first use'''
+    if name not in self.SERVICES: raise AttributeError(name)
+    return self.__dict__.setdefault(name, self.SERVICES[name](self))
+
+  def new_token(self) -> None:
+    '''Create a new session token
+
+    :raises PermissionError: if authentication fails
+
+    The token is saved in the token cache if enabled.
+    '''
+    api_url = self.tokens_api_path()
+    response = self.limiter.call('POST', api_url,
+                          lambda: self.send('POST', api_url, json = self.auth_data,
+                                                 headers = { 'X-Auth-Token': None }))
     if response.status_code != 201 or not 'X-Subject-Token' in response.headers:
       # Authentication...
       raise PermissionError(response.text)
 
-    self.token = response.headers['X-Subject-Token']
-    self.deh = deh.Deh(self)
-    self.ecs = ecs.Ecs(self)
-    self.iam = iam.Iam(self)
-    self.ims = ims.Ims(self)
-    self.tms = tms.Tms(self)
-    self.rms = rms.Rms(self)
+    self.set_token(response.headers['X-Subject-Token'], self.parse_token(response))
+    self.save_token()
 
-    self.region_data = None
-    self.project_data = None
+  def set_token(self, token:str, expires_at:float|None) -> None:
+    '''Make `token` the session token
+
+    :param token: token to use
+    :param expires_at: expiration time (seconds since the epoch)
+    '''
+    self.token = token
+    self.expires_at = expires_at
+    self.http.headers['X-Auth-Token'] = token
+    if self.cassette is not None: self.cassette.add_secret(token)
+
+  def refresh_token(self, refresh_ahead:float = tokencache.REFRESH_AHEAD) -> bool:
+    '''Refresh the session token ahead of its expiration
+
+    :param refresh_ahead: seconds before `expires_at` to refresh
+    :returns: True if the token was replaced
+
+    Called before every request so that long running batch jobs
+    never use an expired token.  Tokens that are not kept in the
+    token cache are revoked after being replaced.
+    '''
+    if self.expires_at is None or time.time() < self.expires_at - refresh_ahead:
+      return False
+    with self.token_lock:
+      if time.time() < self.expires_at - refresh_ahead: return False
+      old_token = self.token
+      self.new_token()
+    if self.cache_key is None:
+      self.revoke_token(old_token)
+    return True
+
+  def revoke_token(self, token:str) -> None:
+    '''Revoke a session token
+
+    :param token: token to revoke
+    '''
+    self.send('DELETE', self.tokens_api_path(), headers = {
+        'X-Auth-Token': self.token,
+        'X-Subject-Token': token,
+    })
+
+  def check_creds(self, creds:dict, scoped:bool = False) -> None:
+    '''Authenticate with other credentials and revoke the token right away
+
+    :param creds: credentials to check (same keys as the session credentials)
+    :param scoped: create a scoped token
+    :raises PermissionError: if authentication fails
+
+    The token request goes through the session connection pool and
+    rate limiter.  The token is revoked with itself, so the session
+    token is not involved, and is never saved in the token cache.
+    '''
+    if self.cassette is not None: self.cassette.add_secret(creds[CRSTR.PASSWORD])
+    auth = SessionBase(creds, scoped)
+    api_url = auth.tokens_api_path()
+    response = self.limiter.call('POST', api_url,
+                          lambda: self.send('POST', api_url, json = auth.auth_data,
+                                                 headers = { 'X-Auth-Token': None }))
+    if response.status_code != 201 or not 'X-Subject-Token' in response.headers:
+      raise PermissionError(response.text)
+    token = response.headers['X-Subject-Token']
+    if self.cassette is not None: self.cassette.add_secret(token)
+    self.send('DELETE', api_url, headers = { 'X-Auth-Token': token, 'X-Subject-Token': token })
+
+  def revocable(self) -> bool:
+    '''Returns True if the session token should be revoked on close'''
+    if self.cassette is not None and self.cassette.replaying: return False
+    return super().revocable()
+
+  def map(self, fn:Callable[[Any],Any], items:Iterable, max_workers:int|None = None) -> list:
+    '''Apply `fn` to every item using a bounded thread pool
+
+    :param fn: function called with each item
+    :param items: items to process
+    :param max_workers: maximum concurrent calls (defaults to the session `max_workers`)
+    :returns: list of results in the same order as `items`
+
+    Calls share the session connection pool.  If `fn` raises an
+    exception for an item, the exception object is returned in its
+    place and the remaining items are still processed.
+    '''
+    items = list(items)
+    workers = self.max_workers if max_workers is None else max(1, max_workers)
+    if workers == 1 or len(items) < 2:
+      results = []
+      for item in items:
+        try:
+          results.append(fn(item))
+        except Exception as e:
+          results.append(e)
+      return results
+
+    with ThreadPoolExecutor(max_workers = min(workers, len(items))) as pool:
+      futures = [pool.submit(fn, item) for item in items]
+    return [f.exception() if f.exception() is not None else f.result() for f in futures]
 
   def project_id(self) -> str:
     if self.project_name is None: return self.region_id()
@@ -153,17 +453,94 @@ class ApiSession:
   def __del__(self) -> None:
     '''Destructor
 
-    Deletes the created session token
+    Deletes the created session token, unless it is kept in the
+    token cache.
     '''
-    if not self.token is None:
+    if self.revocable():
       if sys.meta_path is None:
         sys.stderr.write('Deleting session while Python is shutting down\n')
         token_shutdown(self.tokens_api_path(), self.token)
       else:
-        response = requests.delete(self.tokens_api_path(), headers = {
-            'X-Auth-Token': self.token,
-            'X-Subject-Token': self.token,
-        })
+        self.revoke_token(self.token)
+    self.http.close()
+
+  def send(self, method:str, api_url:str, **kwargs) -> jsoncodec.Response:
+    '''Send a single HTTP request
+
+    :param method: HTTP method
+    :param api_url: URL for REST API
+    :param **kwargs: additional params as needed by REST API
+
+    Uses the session connection pool, recording the exchange or
+    serving it from the cassette if one is in use.  `json` bodies
+    are encoded and responses decoded by {py:obj}`scullery.jsoncodec`.
+    '''
+    if kwargs.get('json') is not None:
+      kwargs['data'] = jsoncodec.dumps(kwargs.pop('json'))
+      kwargs['headers'] = { 'Content-Type': 'application/json', **(kwargs.get('headers') or {}) }
+    if self.cassette is None:
+      resp = self.http.request(method, api_url, **kwargs)
+    elif self.cassette.replaying:
+      resp = self.cassette.play(method, api_url, kwargs)
+    else:
+      start = time.monotonic()
+      resp = self.http.request(method, api_url, **kwargs)
+      self.cassette.record(method, api_url, kwargs, resp, time.monotonic() - start)
+    return jsoncodec.Response(resp)
+
+  def request(self, method:str, api_url:str, **kwargs) -> jsoncodec.Response:
+    '''Send a REST API request over the session connection pool
+
+    :param method: HTTP method
+    :param api_url: URL for REST API
+    :param **kwargs: additional params as needed by REST API
+
+    Requests are rate limited and retried on `429` and transient
+    server errors.
+    '''
+    if method not in COALESCED_METHODS or not set(kwargs) <= {'params'}:
+      if self.cache_ttl > 0 and method != 'GET': self.read_cache.clear()
+      return self.fetch(method, api_url, **kwargs)
+
+    key = (method, api_url, tuple(sorted((str(k), str(v)) for k, v in (kwargs.get('params') or {}).items())))
+    if self.cache_ttl > 0:
+      cached = self.read_cache.get(key)
+      if cached is not None and time.monotonic() < cached[0]:
+        self.limiter.count('cached')
+        return cached[1]
+
+    with self.flight_lock:
+      flight = self.in_flight.get(key)
+      leader = flight is None
+      if leader: flight = self.in_flight[key] = Flight()
+    if not leader:
+      self.limiter.count('coalesced')
+      return flight.wait()
+
+    try:
+      flight.response = self.fetch(method, api_url, **kwargs)
+    except Exception as e:
+      flight.error = e
+      raise
+    finally:
+      with self.flight_lock:
+        del self.in_flight[key]
+      flight.done.set()
+    if self.cache_ttl > 0 and flight.response.status_code == 200:
+      self.read_cache[key] = (time.monotonic() + self.cache_ttl, flight.response)
+    return flight.response
+
+  def fetch(self, method:str, api_url:str, **kwargs) -> jsoncodec.Response:
+    '''INTERNAL: send a request, bypassing the read cache'''
+    self.refresh_token()
+    send = lambda: self.send(method, api_url, **kwargs)
+    resp = self.limiter.call(method, api_url, send)
+    if resp.status_code == 401 and self.cache_key is not None:
+      # Cached token may have been revoked elsewhere
+      tokencache.discard(self.cache_key)
+      self.new_token()
+      resp = self.limiter.call(method, api_url, send)
+    return resp
 
   def get(self, api_url, **kwargs):
     '''REST API `get` method
@@ -171,46 +548,35 @@ class ApiSession:
     :param api_url: URL for REST API
     :param **kwargs: additional params as needed by REST API
     '''
-    return requests.get(api_url, **kwargs, headers = {
-            'X-Auth-Token': self.token,
-        })
+    return self.request('GET', api_url, **kwargs)
   def post(self, api_url, **kwargs):
     '''REST API `post` method
 
     :param api_url: URL for REST API
     :param **kwargs: additional params as needed by REST API
     '''
-    return requests.post(api_url, **kwargs, headers = {
-            'X-Auth-Token': self.token,
-        })
+    return self.request('POST', api_url, **kwargs)
   def patch(self, api_url, **kwargs):
     '''REST API `patch` method
 
     :param api_url: URL for REST API
     :param **kwargs: additional params as needed by REST API
     '''
-    return requests.patch(api_url, **kwargs, headers = {
-            'X-Auth-Token': self.token,
-        })
+    return self.request('PATCH', api_url, **kwargs)
   def delete(self, api_url, **kwargs):
     '''REST API `delete` method
 
     :param api_url: URL for REST API
     :param **kwargs: additional params as needed by REST API
     '''
-    return requests.delete(api_url, **kwargs, headers = {
-            'X-Auth-Token': self.token,
-        })
-
+    return self.request('DELETE', api_url, **kwargs)
   def put(self, api_url, **kwargs):
     '''REST API `put` method
 
     :param api_url: URL for REST API
     :param **kwargs: additional params as needed by REST API
     '''
-    return requests.put(api_url, **kwargs, headers = {
-            'X-Auth-Token': self.token,
-        })
+    return self.request('PUT', api_url, **kwargs)
 
 if __name__ == '__main__':
   import creds
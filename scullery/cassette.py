@@ -0,0 +1,204 @@
+#!python3
+#
+# Record/replay of API sessions
+#
+'''Record and replay REST API sessions
+
+A cassette is a file containing the requests and responses of an
+{py:obj}`scullery.api.ApiSession`, one JSON record per line (gzip
+compressed if the file name ends with `.gz`).  Session tokens,
+passwords and other secrets are scrubbed before being written.
+
+In `record` mode requests are sent to the cloud and saved.  In
+`replay` mode responses are served from the cassette without any
+network access, optionally adding a simulated latency.  This makes
+it possible to profile recipes and compare changes deterministically
+offline.
+
+Replayed requests are matched by method, URL (including query
+parameters) and scrubbed body.  If no exact match is found, the
+method and URL alone are used.  When all recorded responses for a
+request have been used, the last one is served again.
+'''
+import gzip
+import json
+import threading
+import time
+
+from collections import deque
+
+import requests
+
+try:
+  from icecream import ic
+except ImportError:  # Graceful fallback if IceCream isn't installed.
+  ic = lambda *a: None if not a else (a[0] if len(a) == 1 else a)  # noqa
+
+class MODE:
+  '''Cassette modes'''
+  RECORD = 'record'
+  REPLAY = 'replay'
+
+SCRUBBED = '**scrubbed**'
+'''Replacement text for secrets'''
+
+SECRET_KEYS = frozenset(['password', 'access', 'secret', 'securitytoken', 'ak', 'sk'])
+'''JSON keys whose values are always scrubbed'''
+
+SECRET_HEADERS = frozenset(['x-auth-token', 'x-subject-token', 'authorization', 'x-obs-security-token'])
+'''Headers whose values are always scrubbed'''
+
+KEEP_HEADERS = frozenset(['content-type', 'x-subject-token', 'retry-after', 'location'])
+'''Response headers saved in the cassette'''
+
+class Cassette:
+  '''Cassette recorder/player'''
+
+  def __init__(self, path:str, mode:str = MODE.REPLAY, latency:float|str = 0.0) -> None:
+    '''Constructor
+
+    :param path: cassette file
+    :param mode: `record` or `replay`
+    :param latency: seconds added to every replayed request, or
+      `recorded` to use the recorded response times
+    '''
+    if mode not in (MODE.RECORD, MODE.REPLAY): raise ValueError(mode)
+    self.path = path
+    self.mode = mode
+    self.latency = latency
+    self.secrets = set()
+    self.lock = threading.Lock()
+    self.exact = dict()
+    self.loose = dict()
+    self.fp = None
+    if mode == MODE.RECORD:
+      self.fp = gzip.open(path, 'at') if path.endswith('.gz') else open(path, 'a')
+    else:
+      self.load()
+
+  @property
+  def replaying(self) -> bool:
+    '''True if serving responses from the cassette'''
+    return self.mode == MODE.REPLAY
+
+  def close(self) -> None:
+    '''Close the cassette file'''
+    with self.lock:
+      if self.fp is not None:
+        self.fp.close()
+        self.fp = None
+
+  def add_secret(self, secret:str|None) -> None:
+    '''Register a string that must never be written to the cassette
+
+    :param secret: secret text (e.g. password or token)
+    '''
+    if secret: self.secrets.add(secret)
+
+  def scrub_text(self, text:str) -> str:
+    '''Replace registered secrets in `text`'''
+    for secret in self.secrets:
+      text = text.replace(secret, SCRUBBED)
+    return text
+
+  def scrub_data(self, data):
+    '''Scrub secret keys from decoded JSON data'''
+    if isinstance(data, dict):
+      return { k: SCRUBBED if k.lower() in SECRET_KEYS and isinstance(v,(str,int)) else self.scrub_data(v)
+                for k,v in data.items() }
+    if isinstance(data, list):
+      return [ self.scrub_data(v) for v in data ]
+    return data
+
+  def scrub_body(self, body:bytes|str|None) -> str|None:
+    '''Scrub a request or response body'''
+    if body is None: return None
+    if isinstance(body, bytes): body = body.decode('utf-8', errors = 'replace')
+    try:
+      body = json.dumps(self.scrub_data(json.loads(body)), separators = (',',':'), sort_keys = True)
+    except ValueError:
+      pass
+    return self.scrub_text(body)
+
+  def prepare(self, method:str, url:str, kwargs:dict) -> tuple[str,str,str|None]:
+    '''INTERNAL: compute the scrubbed method, URL and body of a request'''
+    prep = requests.Request(method, url,
+                            params = kwargs.get('params'),
+                            data = kwargs.get('data'),
+                            json = kwargs.get('json')).prepare()
+    return method.upper(), self.scrub_text(prep.url), self.scrub_body(prep.body)
+
+  def record(self, method:str, url:str, kwargs:dict, resp:requests.Response, elapsed:float) -> None:
+    '''Save a request/response pair
+
+    :param method: HTTP method
+    :param url: request URL
+    :param kwargs: request arguments (`params`, `data`, `json`)
+    :param resp: response received
+    :param elapsed: response time in seconds
+    '''
+    if 'X-Subject-Token' in resp.headers: self.add_secret(resp.headers['X-Subject-Token'])
+    method, url, body = self.prepare(method, url, kwargs)
+    headers = dict()
+    for k,v in resp.headers.items():
+      if k.lower() not in KEEP_HEADERS: continue
+      headers[k] = SCRUBBED if k.lower() in SECRET_HEADERS else v
+    entry = {
+      'm': method,
+      'u': url,
+      'b': body,
+      's': resp.status_code,
+      'r': resp.reason,
+      'h': headers,
+      'c': self.scrub_body(resp.content) if resp.content else '',
+      't': round(elapsed, 4),
+    }
+    line = json.dumps(entry, separators = (',',':')) + '\n'
+    with self.lock:
+      self.fp.write(line)
+      self.fp.flush()
+
+  def load(self) -> None:
+    '''INTERNAL: read the cassette file for replay'''
+    fp = gzip.open(self.path, 'rt') if self.path.endswith('.gz') else open(self.path, 'r')
+    with fp:
+      for line in fp:
+        if not line.strip(): continue
+        entry = json.loads(line)
+        self.exact.setdefault((entry['m'], entry['u'], entry['b']), deque()).append(entry)
+        self.loose.setdefault((entry['m'], entry['u']), deque()).append(entry)
+
+  def play(self, method:str, url:str, kwargs:dict) -> requests.Response:
+    '''Serve a recorded response
+
+    :param method: HTTP method
+    :param url: request URL
+    :param kwargs: request arguments (`params`, `data`, `json`)
+    :returns: recorded response
+    :raises KeyError: if the request was not recorded
+    '''
+    method, url, body = self.prepare(method, url, kwargs)
+    with self.lock:
+      queue = self.exact.get((method, url, body)) or self.loose.get((method, url))
+      if not queue: raise KeyError(f'{method} {url}: not in cassette {self.path}')
+      entry = queue.popleft() if len(queue) > 1 else queue[0]
+
+    delay = entry['t'] if self.latency == 'recorded' else float(self.latency)
+    if delay > 0: time.sleep(delay)
+
+    resp = requests.Response()
+    resp.status_code = entry['s']
+    resp.reason = entry['r']
+    resp.headers.update(entry['h'])
+    resp._content = entry['c'].encode('utf-8')
+    resp.encoding = 'utf-8'
+    resp.url = url
+    return resp
+
+def parse_latency(text:str) -> float|str:
+  '''Parse a replay latency option
+
+  :param text: number of seconds or `recorded`
+  :returns: latency value for {py:obj}`scullery.cassette.Cassette`
+  '''
+  return text if text == 'recorded' else float(text)
@@ -2,7 +2,6 @@
 #
 #
 import os
-import yaml
 
 
 try:
@@ -63,6 +62,37 @@ def check_kwargs(opts:dict) -> bool:
     if not arg in opts: return False
   return True
 
+def config_files() -> list[str]:
+  '''List the `clouds.yaml` files to search, in order
+
+  :returns: list of existing configuration files
+  '''
+  cloud_yamls = []
+  if STR.OS_CONFIG_FILE in os.environ: cloud_yamls.append(os.environ[STR.OS_CONFIG_FILE])
+  cloud_yamls.append(STR.CLOUDS_YAML)
+  if STR.HOME in os.environ:
+    cloud_yamls.append(os.path.join(os.environ[STR.HOME],STR.OS_CFG_HOME,STR.CLOUDS_YAML))
+  cloud_yamls.append(os.path.join(STR.ETC_CFG,STR.CLOUDS_YAML))
+  return [ cfgfile for cfgfile in cloud_yamls if os.path.isfile(cfgfile) ]
+
+def cloud_names() -> list[str]:
+  '''List the clouds configured in `clouds.yaml`
+
+  :returns: names of clouds with `auth` settings, in configuration order
+
+  Clouds defined in more than one file are listed once.
+  '''
+  import yaml
+
+  names = []
+  for cfgfile in config_files():
+    with open(cfgfile, 'r') as fp:
+      ydat = yaml.safe_load(fp)
+    if not isinstance(ydat, dict) or not STR.CLOUDS in ydat: continue
+    for cn,dat in ydat[STR.CLOUDS].items():
+      if isinstance(dat,dict) and STR.AUTH in dat and not cn in names: names.append(cn)
+  return names
+
 def creds(cloud_name:str|None = None, **kwargs) -> dict:
   '''Get configured login credentials
 
@@ -76,14 +106,9 @@ def creds(cloud_name:str|None = None, **kwargs) -> dict:
   env_creds = get_env_creds()
   if check_kwargs(env_creds): return env_creds
 
-  cloud_yamls = []
-  if STR.OS_CONFIG_FILE in os.environ: cloud_yamls.append(os.environ[STR.OS_CONFIG_FILE])
-  cloud_yamls.append(STR.CLOUDS_YAML)
-  if STR.HOME in os.environ:
-    cloud_yamls.append(os.path.join(os.environ[STR.HOME],STR.OS_CFG_HOME,STR.CLOUDS_YAML))
-  cloud_yamls.append(os.path.join(STR.ETC_CFG,STR.CLOUDS_YAML))
-  for cfgfile in cloud_yamls:
-    if not os.path.isfile(cfgfile): continue
+  import yaml
+
+  for cfgfile in config_files():
     with open(cfgfile, 'r') as fp:
       ydat = yaml.safe_load(fp)
     if not STR.CLOUDS in ydat: continue
@@ -0,0 +1,265 @@
+#!python3
+#
+# Background accelerator daemon
+#
+'''Run commands in a long lived process with warm sessions
+
+{py:obj}`scullery.daemon.Server` listens on a Unix socket and runs
+forwarded command lines in-process.  Authenticated sessions, their
+connection pools and read caches are kept between commands, so
+repeated commands skip interpreter start-up, configuration parsing
+and token creation.
+
+{py:obj}`scullery.daemon.forward` is the thin client used by
+{py:obj}`scullery.__main__.main`.  It sends the command line, current
+directory and `OS_*`/`SCULLERY_*` environment variables, then
+streams back the output and exit status.
+
+Protocol: one JSON object per line.  The client sends
+`{"argv": [...], "cwd": ..., "env": {...}}`; the daemon replies with
+any number of `{"out": text}` and `{"err": text}` messages followed
+by `{"exit": status}`.
+
+Commands are run one at a time.
+'''
+import json
+import os
+import socket
+import sys
+
+try:
+  from icecream import ic
+except ImportError:  # Graceful fallback if IceCream isn't installed.
+  ic = lambda *a: None if not a else (a[0] if len(a) == 1 else a)  # noqa
+
+class STR:
+  '''String constants for this module'''
+  SOCKET_ENV = 'SCULLERY_SOCKET'
+  SOCKET_FILE = 'scullery.sock'
+  CONFIG_DIR = 'SCULLERY_CONFIG_DIR'
+  XDG_CONFIG_HOME = 'XDG_CONFIG_HOME'
+  HOME = 'HOME'
+  CFG_HOME = '.config'
+  APP_DIR = 'scullery'
+
+ENV_PREFIXES = ('OS_', 'SCULLERY_')
+'''Environment variables forwarded to the daemon'''
+
+DEFAULT_CACHE_TTL = 30
+'''Default seconds `GET` responses are re-used by the daemon'''
+
+def socket_path() -> str:
+  '''Return the path of the daemon socket
+
+  :returns: `SCULLERY_SOCKET` if defined, otherwise `scullery.sock`
+    in the configuration directory (see {py:obj}`scullery.tokencache.config_dir`)
+  '''
+  if STR.SOCKET_ENV in os.environ: return os.environ[STR.SOCKET_ENV]
+  # Same as tokencache.config_dir, without importing the API modules
+  if STR.CONFIG_DIR in os.environ:
+    cfgdir = os.environ[STR.CONFIG_DIR]
+  elif STR.XDG_CONFIG_HOME in os.environ:
+    cfgdir = os.path.join(os.environ[STR.XDG_CONFIG_HOME], STR.APP_DIR)
+  else:
+    home = os.environ[STR.HOME] if STR.HOME in os.environ else os.path.expanduser('~')
+    cfgdir = os.path.join(home, STR.CFG_HOME, STR.APP_DIR)
+  return os.path.join(cfgdir, STR.SOCKET_FILE)
+
+def forward(argv:list[str], path:str|None = None) -> int|None:
+  '''Run a command line in the daemon
+
+  :param argv: command line arguments
+  :param path: socket path (default {py:obj}`scullery.daemon.socket_path`)
+  :returns: exit status, or None if no daemon is listening
+
+  Output of the command is written to `sys.stdout` and `sys.stderr`
+  as it arrives.
+  '''
+  if path is None: path = socket_path()
+  if not hasattr(socket, 'AF_UNIX') or not os.path.exists(path): return None
+  sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+  try:
+    sock.connect(path)
+  except OSError:
+    sock.close()
+    return None
+
+  with sock, sock.makefile('rb') as fp:
+    request = {
+      'argv': argv,
+      'cwd': os.getcwd(),
+      'env': { k: v for k, v in os.environ.items() if k.startswith(ENV_PREFIXES) },
+    }
+    sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+    for line in fp:
+      msg = json.loads(line)
+      if 'out' in msg:
+        sys.stdout.write(msg['out'])
+      elif 'err' in msg:
+        sys.stderr.write(msg['err'])
+      elif 'exit' in msg:
+        sys.stdout.flush()
+        return msg['exit']
+  sys.stderr.write('Connection to daemon lost\n')
+  return 1
+
+class Output:
+  '''INTERNAL: text stream sending writes to the client'''
+  def __init__(self, wfile, kind:str) -> None:
+    self.wfile = wfile
+    self.kind = kind
+    self.closed = False
+
+  def write(self, text:str) -> int:
+    if text and not self.closed:
+      try:
+        self.wfile.write(json.dumps({ self.kind: text }).encode('utf-8') + b'\n')
+        self.wfile.flush()
+      except OSError:
+        self.closed = True # Client went away; keep running
+    return len(text)
+
+  def flush(self) -> None:
+    pass
+
+  def isatty(self) -> bool:
+    return False
+
+def exit_status(e:SystemExit) -> int:
+  '''INTERNAL: convert a `SystemExit` to an exit status'''
+  if e.code is None: return 0
+  if isinstance(e.code, int): return e.code
+  sys.stderr.write(f'{e.code}\n')
+  return 1
+
+class Server:
+  '''Daemon running forwarded command lines'''
+  def __init__(self, run, path:str|None = None, cache_ttl:float = DEFAULT_CACHE_TTL,
+                options = None) -> None:
+    '''Constructor
+
+    :param run: function running a command line and returning its exit status
+      (i.e. {py:obj}`scullery.__main__.run`)
+    :param path: socket path (default {py:obj}`scullery.daemon.socket_path`)
+    :param cache_ttl: seconds `GET` responses are re-used
+    :param options: function of a command line returning the options fixed
+      when a session is created (i.e. {py:obj}`scullery.__main__.session_options`)
+
+    Sessions are kept per set of forwarded environment variables and
+    working directory, as these select the credentials, and per
+    session `options` (API end-point, rate limits, cassette...).
+    '''
+    import copy
+    import scullery
+
+    self.run = run
+    self.options = (lambda argv: None) if options is None else options
+    self.path = socket_path() if path is None else path
+    self.cache_ttl = cache_ttl
+    self.sessions = {}
+    self.scullery = scullery
+    self.defaults = copy.deepcopy(scullery.defaults)
+    self.defaults['cache_ttl'] = cache_ttl
+    self.requests = 0
+
+  def execute(self, request:dict, out:Output, err:Output) -> int:
+    '''Run one forwarded command line
+
+    :param request: decoded client request
+    :param out: stream for standard output
+    :param err: stream for standard error
+    :returns: exit status
+    '''
+    import copy
+    import traceback
+
+    scullery = self.scullery
+    env = request.get('env', {})
+    cwd = request.get('cwd', os.getcwd())
+    key = None
+
+    saved_env = { k: v for k, v in os.environ.items() if k.startswith(ENV_PREFIXES) }
+    saved_cwd = os.getcwd()
+    saved_streams = (sys.stdout, sys.stderr)
+    for k in saved_env: del os.environ[k]
+    os.environ.update(env)
+    scullery.defaults.clear()
+    scullery.defaults.update(copy.deepcopy(self.defaults))
+    sys.stdout, sys.stderr = out, err
+    try:
+      os.chdir(cwd)
+      key = (cwd, tuple(sorted(env.items())), self.options(request['argv']))
+      scullery.clouds = self.sessions.setdefault(key, {})
+      scullery.api.set_api_endpoint()
+      status = self.run(request['argv'])
+    except SystemExit as e:
+      status = exit_status(e)
+    except Exception:
+      traceback.print_exc()
+      status = 1
+    finally:
+      if scullery.defaults['cassette'] is not None:
+        # Cassettes belong to a single command
+        scullery.clean_up()
+        self.sessions.pop(key, None)
+      sys.stdout, sys.stderr = saved_streams
+      os.chdir(saved_cwd)
+      for k in env: os.environ.pop(k, None)
+      os.environ.update(saved_env)
+      scullery.clouds = {}
+      self.requests += 1
+    return status
+
+  def serve_forever(self) -> None:
+    '''Listen for commands until interrupted
+
+    :raises RuntimeError: if another daemon is already listening
+    '''
+    import socketserver
+    import threading
+
+    if listening(self.path):
+      raise RuntimeError(f'{self.path}: a daemon is already running')
+    if os.path.exists(self.path): os.unlink(self.path) # Stale socket
+    os.makedirs(os.path.dirname(self.path) or '.', exist_ok = True)
+
+    server = self
+    lock = threading.Lock()
+    class Handler(socketserver.StreamRequestHandler):
+      def handle(self) -> None:
+        line = self.rfile.readline()
+        if not line: return
+        request = json.loads(line)
+        out, err = Output(self.wfile, 'out'), Output(self.wfile, 'err')
+        with lock:
+          status = server.execute(request, out, err)
+        try:
+          self.wfile.write(json.dumps({ 'exit': status }).encode('utf-8') + b'\n')
+        except OSError:
+          pass
+
+    umask = os.umask(0o177) # Sessions carry tokens: owner only
+    try:
+      srv = socketserver.ThreadingUnixStreamServer(self.path, Handler)
+    finally:
+      os.umask(umask)
+    srv.daemon_threads = True
+    try:
+      srv.serve_forever()
+    finally:
+      srv.server_close()
+      os.unlink(self.path)
+      self.sessions.clear()
+      self.scullery.clean_up()
+
+def listening(path:str) -> bool:
+  '''INTERNAL: True if a daemon accepts connections on `path`'''
+  if not os.path.exists(path): return False
+  sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+  try:
+    sock.connect(path)
+    return True
+  except OSError:
+    return False
+  finally:
+    sock.close()
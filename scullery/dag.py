@@ -0,0 +1,225 @@
+#!python3
+#
+# Dependency graph execution
+#
+'''Run tasks of a dependency graph concurrently
+
+A {py:obj}`scullery.dag.Graph` holds named tasks and the tasks they
+depend on.  {py:obj}`scullery.dag.Graph.run` starts every task as
+soon as its dependencies completed, using a bounded thread pool, so
+independent tasks run at the same time.
+
+Each task is called with a dictionary of the results of the tasks
+that completed so far.  If a task fails, the tasks depending on it
+(directly or not) are skipped; the others still run.  Results of
+tasks completed by an earlier run can be passed in, so only the
+remaining tasks run.
+
+Start time and duration of every task are recorded, so
+{py:obj}`scullery.dag.Graph.report` can show where the time was
+spent and which chain of tasks (the critical path) bounded the total.
+
+```python
+g = dag.Graph()
+g.add('project', lambda r: cc.iam.new_project(...))
+g.add('group', lambda r: usergroup.add_group(cc, ...), ['project'])
+g.add('grant', lambda r: cc.iam.grant_project_group_perms(r['project'], r['group'], ...), ['project','group'])
+results = g.run(max_workers = 8)
+g.report()
+```
+'''
+import sys
+import time
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Iterable
+
+try:
+  from icecream import ic
+except ImportError:  # Graceful fallback if IceCream isn't installed.
+  ic = lambda *a: None if not a else (a[0] if len(a) == 1 else a)  # noqa
+
+class STATE:
+  '''States of a task'''
+  PENDING = 'pending'
+  RUNNING = 'running'
+  DONE = 'done'
+  FAILED = 'failed'
+  SKIPPED = 'skipped'
+
+class Node:
+  '''A task of the graph'''
+  def __init__(self, name:str, fn:Callable[[dict],Any], deps:list[str]) -> None:
+    '''Constructor
+
+    :param name: task name
+    :param fn: function called with the results of completed tasks
+    :param deps: names of the tasks that must complete first
+    '''
+    self.name = name
+    self.fn = fn
+    self.deps = deps
+    self.state = STATE.PENDING
+    self.result = None
+    self.error = None
+    '''Exception raised by the task'''
+    self.start = None
+    '''Start time, in seconds since the graph started'''
+    self.end = None
+    '''End time, in seconds since the graph started'''
+
+  @property
+  def duration(self) -> float|None:
+    '''Seconds the task ran'''
+    if self.start is None or self.end is None: return None
+    return self.end - self.start
+
+class Graph:
+  '''Dependency graph of tasks'''
+  def __init__(self) -> None:
+    self.nodes = dict()
+    '''Tasks by name, in insertion order'''
+    self.elapsed = None
+    '''Seconds the last run took'''
+
+  def add(self, name:str, fn:Callable[[dict],Any], deps:Iterable[str] = ()) -> str:
+    '''Add a task
+
+    :param name: unique task name
+    :param fn: function called with a dictionary of the results of the
+      completed tasks (at least those in `deps`)
+    :param deps: names of tasks that must complete first
+    :returns: the task name
+    :raises KeyError: if the name is already used
+    '''
+    if name in self.nodes: raise KeyError(f'{name}: duplicate task')
+    self.nodes[name] = Node(name, fn, list(dict.fromkeys(deps)))
+    return name
+
+  def check(self) -> None:
+    '''Verify that dependencies exist and have no cycles
+
+    :raises KeyError: on unknown dependencies
+    :raises ValueError: on dependency cycles
+    '''
+    for node in self.nodes.values():
+      for dep in node.deps:
+        if not dep in self.nodes: raise KeyError(f'{node.name}: unknown dependency {dep}')
+    state = dict()
+    def visit(name:str, path:list[str]) -> None:
+      if state.get(name) == 'done': return
+      if state.get(name) == 'visiting':
+        raise ValueError(f'Dependency cycle: {" -> ".join(path + [name])}')
+      state[name] = 'visiting'
+      for dep in self.nodes[name].deps: visit(dep, path + [name])
+      state[name] = 'done'
+    for name in self.nodes: visit(name, [])
+
+  def run(self, max_workers:int = 8,
+          done:dict[str,Any]|None = None,
+          on_done:Callable[[Node],None]|None = None) -> dict[str,Any]:
+    '''Run all tasks
+
+    :param max_workers: maximum tasks running at the same time
+    :param done: results of tasks completed earlier (e.g. by a previous run); these tasks are not run
+    :param on_done: called in the calling thread with each task as soon as it completes
+    :returns: dictionary task name : result, for the tasks that completed
+    :raises KeyError: on unknown dependencies
+    :raises ValueError: on dependency cycles
+
+    Task failures do not raise; see {py:obj}`scullery.dag.Graph.failed`.
+    '''
+    self.check()
+    done = done or {}
+    results = { name: result for name, result in done.items() if name in self.nodes }
+    dependents = { name: [] for name in self.nodes }
+    waiting = dict()
+    for node in self.nodes.values():
+      node.state, node.result, node.error, node.start, node.end = STATE.PENDING, None, None, None, None
+      if node.name in results: node.state, node.result = STATE.DONE, results[node.name]
+      waiting[node.name] = sum(1 for dep in node.deps if not dep in results)
+      for dep in node.deps: dependents[dep].append(node.name)
+
+    t0 = time.perf_counter()
+    def call(node:Node) -> Any:
+      node.start = time.perf_counter() - t0
+      try:
+        return node.fn(results)
+      finally:
+        node.end = time.perf_counter() - t0
+
+    def skip(name:str) -> None:
+      for d in dependents[name]:
+        if self.nodes[d].state != STATE.PENDING: continue
+        self.nodes[d].state = STATE.SKIPPED
+        skip(d)
+
+    with ThreadPoolExecutor(max_workers = max(1, max_workers)) as pool:
+      running = dict()
+      def submit(name:str) -> None:
+        node = self.nodes[name]
+        node.state = STATE.RUNNING
+        running[pool.submit(call, node)] = node
+      for name, count in waiting.items():
+        if count == 0 and self.nodes[name].state == STATE.PENDING: submit(name)
+
+      while running:
+        finished, _ = wait(running, return_when = FIRST_COMPLETED)
+        for future in finished:
+          node = running.pop(future)
+          if future.exception() is not None:
+            node.state = STATE.FAILED
+            node.error = future.exception()
+            skip(node.name)
+            continue
+          node.state = STATE.DONE
+          node.result = results[node.name] = future.result()
+          if on_done is not None: on_done(node)
+          for d in dependents[node.name]:
+            waiting[d] -= 1
+            if waiting[d] == 0 and self.nodes[d].state == STATE.PENDING: submit(d)
+
+    self.elapsed = time.perf_counter() - t0
+    return results
+
+  @property
+  def failed(self) -> list[Node]:
+    '''Tasks that failed in the last run'''
+    return [ node for node in self.nodes.values() if node.state == STATE.FAILED ]
+
+  def critical_path(self) -> list[Node]:
+    '''Return the chain of tasks that finished last
+
+    :returns: tasks from the first to the last, each one being the
+      latest finishing dependency of the next one
+    '''
+    ran = [ node for node in self.nodes.values() if node.end is not None ]
+    if not ran: return []
+    path = [ max(ran, key = lambda n: n.end) ]
+    while True:
+      deps = [ self.nodes[d] for d in path[-1].deps if self.nodes[d].end is not None ]
+      if not deps: break
+      path.append(max(deps, key = lambda n: n.end))
+    return list(reversed(path))
+
+  def report(self, fp = None) -> None:
+    '''Write per-task timings
+
+    :param fp: stream to write to (default `sys.stderr`)
+
+    Tasks are listed by start time.  Tasks on the critical path are
+    marked with `*`.
+    '''
+    if fp is None: fp = sys.stderr
+    critical = { node.name for node in self.critical_path() }
+    nodes = sorted(self.nodes.values(), key = lambda n: (n.start is None, n.start or 0))
+    width = max([len('task')] + [len(n.name) for n in nodes])
+    fp.write(f'  {"task":{width}} {"start":>8} {"time":>8}  state\n')
+    for n in nodes:
+      start = '-' if n.start is None else f'{n.start:.2f}s'
+      duration = '-' if n.duration is None else f'{n.duration:.2f}s'
+      state = n.state if n.error is None else f'{n.state}: {n.error}'.splitlines()[0]
+      if n.state == STATE.DONE and n.start is None: state += ' earlier'
+      fp.write(f'{"*" if n.name in critical else " "} {n.name:{width}} {start:>8} {duration:>8}  {state}\n')
+    if self.elapsed is not None:
+      fp.write(f'{len(self.nodes)} tasks in {self.elapsed:.2f}s, critical path {len(critical)} tasks\n')
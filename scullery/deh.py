@@ -14,11 +14,13 @@ class Deh:
   '''Main class for DeH'''
   API_HOST = 'deh.{region}.otc.t-systems.com'
   '''API End-point'''
+  API_SCHEME = 'https'
+  '''API URL scheme'''
 
   def api_path(self, path) -> str:
     '''API URL path'''
     host = Deh.API_HOST.format(region = self.session.region)
-    return f'https://{host}/{path}'
+    return f'{Deh.API_SCHEME}://{host}/{path}'
 
   def __init__(self, session) -> None:
     '''Constructor'''
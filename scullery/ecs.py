@@ -6,6 +6,8 @@
 
 from typing import Any
 
+from scullery import paginator
+
 try:
   from icecream import ic
 except ImportError:  # Graceful fallback if IceCream isn't installed.
@@ -22,13 +24,17 @@ class Ecs:
   '''Main class for ECS'''
   API_HOST = 'ecs.{region}.otc.t-systems.com'
   '''API End-point'''
+  API_SCHEME = 'https'
+  '''API URL scheme'''
+  PAGE_SIZE = 1000
+  '''Servers per page'''
 
 
 
   def api_path(self, path) -> str:
     '''API URL path'''
     host = Ecs.API_HOST.format(region = self.session.region)
-    return f'https://{host}/{path}'
+    return f'{Ecs.API_SCHEME}://{host}/{path}'
 
   def __init__(self, session) -> None:
     '''Constructor'''
@@ -54,19 +60,23 @@ class Ecs:
     resp.raise_for_status()
 
 
-  def servers(self, detail:bool = False, **kwargs) -> list:
-    # https://docs.otc.t-systems.com/elastic-cloud-server/api-ref/native_openstack_nova_apis/lifecycle_management/querying_the_ecs_list.html#en-us-topic-0020212688
-    # TODO: handle pagination
+  def servers(self, detail:bool = False, **kwargs):
+    '''Query servers
+
+    :param detail: return server details
+    :param kwargs: query args to pass (e.g. `name`, `status`)
+    :returns: generator yielding servers
+    :raises RuntimeError: on error
+
+    Follows pagination.  See
+    [REST API](https://docs.otc.t-systems.com/elastic-cloud-server/api-ref/native_openstack_nova_apis/lifecycle_management/querying_the_ecs_list.html#en-us-topic-0020212688)
+    '''
     # TODO: [flavor][id] -> [flavor_id]
     project_id = self.session.project_id()
     url = f'v2.1/{project_id}/servers'
     if detail: url += '/detail'
-    # ~ ic(url, self.session.region_data)
-    resp = self.session.get(self.api_path(url), params = kwargs)
-    resp.raise_for_status()
-    data = resp.json()
-    # ~ ic(data)
-    return data['servers']
+    yield from paginator.MarkerPaginator(self.session, self.api_path(url), 'servers', kwargs,
+                                          limit = Ecs.PAGE_SIZE)
 
 
   def flavors(self, **kwargs) -> list:
@@ -8,26 +8,75 @@ import random
 import string
 import json
 
+from typing import Iterable
+
+from scullery import paginator
+
 try:
   from icecream import ic
 except ImportError:  # Graceful fallback if IceCream isn't installed.
   ic = lambda *a: None if not a else (a[0] if len(a) == 1 else a)  # noqa
 
+BULK_THRESHOLD = 8
+'''Batches of at least this many names are resolved from a full listing'''
+
+class Index:
+  '''Hash index of IAM entities by name and ID'''
+  def __init__(self, entities:Iterable[dict], keys:Iterable[str] = ('name',)) -> None:
+    '''Constructor
+
+    :param entities: entities to index, in order of precedence
+    :param keys: fields holding the names of the entities
+    '''
+    self.entities = list(entities)
+    self.names = dict()
+    self.ids = dict()
+    for entity in self.entities:
+      self.ids.setdefault(entity['id'], entity)
+      for key in keys:
+        if entity.get(key): self.names.setdefault(entity[key], entity)
+
+  def get(self, key:str, default:dict|None = None) -> dict|None:
+    '''Look-up an entity
+
+    :param key: name or ID
+    :param default: returned if there is no match
+    :returns: matching entity
+    '''
+    if key in self.names: return self.names[key]
+    return self.ids.get(key, default)
+
+  def named(self, name:str, default:dict|None = None) -> dict|None:
+    '''Look-up an entity by name only
+
+    :param name: name
+    :param default: returned if there is no match
+    :returns: matching entity
+    '''
+    return self.names.get(name, default)
+
 class Iam:
   '''Main class for IAM'''
+  INDEXED = ('users', 'groups', 'projects', 'roles')
+  '''Entity kinds supported by {py:obj}`scullery.iam.Iam.resolve`'''
+  NAME_KEYS = { 'roles': ('name', 'display_name') }
+  '''Fields holding entity names, if not just `name` (custom roles are named by `display_name`)'''
   API_HOST = 'iam.{region}.otc.t-systems.com'
   '''API End-point'''
+  API_SCHEME = 'https'
+  '''API URL scheme'''
 
   def api_path(self, path) -> str:
     '''API URL path'''
     host = Iam.API_HOST.format(region = self.session.region)
-    return f'https://{host}/{path}'
+    return f'{Iam.API_SCHEME}://{host}/{path}'
 
   def __init__(self, session) -> None:
     '''Constructor'''
     self.session = session
     self.sys_roles = None
     self.usr_roles = None
+    self.indexes = dict()
 
   def system_roles(self) -> list:
     '''Create a list of system roles
@@ -71,13 +120,73 @@ class Iam:
     Returns a role from a `name`.  The role can be either a system
     or a custom role.
     '''
-    self.custom_roles()
-    for role in self.usr_roles:
-      if role['name'] == name or ('display_name' in role and role['display_name'] == name): return role
-    self.system_roles()
-    for role in self.sys_roles:
-      if role['name'] == name or ('display_name' in role and role['display_name'] == name): return role
-    raise KeyError(f'Role "{name}" not found')
+    role = self.index('roles').get(name)
+    if role is None: raise KeyError(f'Role "{name}" not found')
+    return role
+
+  def index(self, kind:str) -> Index:
+    '''Return the index of all entities of a kind
+
+    :param kind: one of {py:obj}`scullery.iam.Iam.INDEXED`
+    :returns: index, built from a full listing on first use
+    :raises RuntimeError: on error
+
+    Custom roles take precedence over system roles.  Indexes are
+    dropped when entities of that kind are created or deleted
+    through this client.
+    '''
+    if not kind in self.indexes:
+      if kind == 'roles':
+        entities = self.custom_roles() + self.system_roles()
+      elif kind in self.INDEXED:
+        entities = getattr(self, kind)()
+      else:
+        raise ValueError(f'{kind}: cannot be indexed')
+      self.indexes[kind] = Index(entities, self.NAME_KEYS.get(kind, ('name',)))
+    return self.indexes[kind]
+
+  def invalidate(self, kind:str) -> None:
+    '''Drop cached entities of a kind
+
+    :param kind: one of {py:obj}`scullery.iam.Iam.INDEXED`
+    '''
+    self.indexes.pop(kind, None)
+    if kind == 'roles': self.usr_roles = None
+
+  def resolve(self, kind:str, names:Iterable[str], bulk:bool|None = None) -> dict[str,dict]:
+    '''Resolve a batch of names
+
+    :param kind: one of {py:obj}`scullery.iam.Iam.INDEXED`
+    :param names: names to look-up
+    :param bulk: use the full listing index (default: automatic)
+    :returns: dictionary name : entity, only for names that matched
+    :raises RuntimeError: on error
+
+    Small batches are resolved with one query per name.  Batches of
+    {py:obj}`scullery.iam.BULK_THRESHOLD` names or more, roles and
+    kinds already indexed use {py:obj}`scullery.iam.Iam.index`.
+    Either way only exact names match (display names for custom
+    roles), never IDs, so the same names always resolve to the same
+    entities.
+    '''
+    names = list(dict.fromkeys(names))
+    if bulk is None:
+      bulk = kind in self.indexes or kind == 'roles' or len(names) >= BULK_THRESHOLD
+    if bulk:
+      index = self.index(kind)
+      return { name: index.named(name) for name in names if index.named(name) is not None }
+
+    if not kind in self.INDEXED: raise ValueError(f'{kind}: cannot be indexed')
+    query = getattr(self, kind)
+    if hasattr(self.session, 'map'):
+      results = self.session.map(query, names)
+    else:
+      results = [ query(name) for name in names ]
+    found = dict()
+    for name, q in zip(names, results):
+      if isinstance(q, Exception): raise q
+      if len(q) == 1: found[name] = q[0]
+    return found
 
   def new_role(self, *, display_name:str, policy:dict|list, role_type:str = 'XA', description:str|None = None) -> dict:
     '''Create a new custom role
@@ -121,6 +230,7 @@ class Iam:
     })
     if resp.status_code != 201 or not 'role' in resp.json():
       raise RuntimeError(resp.text)
+    self.invalidate('roles')
     return resp.json()['role']
 
   def del_role(self, role_id:str) -> None:
@@ -131,6 +241,7 @@ class Iam:
     resp = self.session.delete(self.api_path(f'v3.0/OS-ROLE/roles/{role_id}'))
     if not resp.status_code in [200, 204]:
       raise RuntimeError(resp.text if resp.text else resp.reason)
+    self.invalidate('roles')
 
   def users(self, name:str|None = None) -> list:
     '''Get a list of users
@@ -184,6 +295,7 @@ class Iam:
     resp = self.session.post(self.api_path('v3.0/OS-USER/users'), json = { 'user': kwargs })
     if resp.status_code != 201 or not 'user' in resp.json():
       raise RuntimeError(resp.text)
+    self.invalidate('users')
     return resp.json()['user']['id']
 
   def del_user(self, usr_id:str) -> None:
@@ -195,6 +307,7 @@ class Iam:
     resp = self.session.delete(self.api_path(f'v3/users/{usr_id}'))
     if not resp.status_code in [200, 204]:
       raise RuntimeError(resp.text if resp.text else resp.reason)
+    self.invalidate('users')
 
   def reset_passwd(self, usr_id:str, password:str,pwd_status:bool = True):
     '''Used to reset a password for a user.
@@ -260,6 +373,7 @@ class Iam:
     resp = self.session.post(self.api_path('v3/groups'), json=dict(group=payload))
     if resp.status_code != 201 or not 'group' in resp.json():
       raise RuntimeError(resp.text)
+    self.invalidate('groups')
     return resp.json()['group']['id']
 
   def del_group(self, grp_id:str) -> None:
@@ -271,6 +385,7 @@ class Iam:
     resp = self.session.delete(self.api_path(f'v3/groups/{grp_id}'))
     if not resp.status_code in [200, 204]:
       raise RuntimeError(resp.text if resp.text else resp.reason)
+    self.invalidate('groups')
 
   def add_group_user(self, grp_id:str, usr_id:str) -> None:
     '''Add user member to group
@@ -378,6 +493,34 @@ class Iam:
     if resp.status_code != 204:
       raise RuntimeError(resp.text if resp.text else resp.reason)
 
+  def role_assignments(self, project_id:str|None = None, group_id:str|None = None,
+                        user_id:str|None = None, role_id:str|None = None,
+                        domain_id:str|None = None) -> list:
+    '''List role assignments
+
+    :param project_id: only assignments on this project
+    :param group_id: only assignments to this group
+    :param user_id: only assignments to this user
+    :param role_id: only assignments of this role
+    :param domain_id: only assignments on this domain
+    :returns: list of assignments
+    :raises RuntimeError: on error
+
+    Uses the Keystone
+    [role assignments](https://docs.openstack.org/api-ref/identity/v3/#list-role-assignments)
+    listing, so that all grants are retrieved in a few paged calls
+    instead of one call per project and group.  Each assignment has
+    `role`, `group` or `user`, and a `scope` with either `project` or
+    `domain`, each as a dict with an `id`.
+    '''
+    params = dict()
+    for key, value in (('scope.project.id', project_id), ('scope.domain.id', domain_id),
+                        ('group.id', group_id), ('user.id', user_id), ('role.id', role_id)):
+      if value is not None: params[key] = value
+    return list(paginator.NextLinkPaginator(self.session, self.api_path('v3/role_assignments'),
+                      'role_assignments', params, next_key = 'links.next',
+                      link = lambda href: href if '://' in href else self.api_path(href.lstrip('/'))))
+
   def projects(self, name:str|None = None) -> list:
     '''Return a list of projects
 
@@ -407,6 +550,20 @@ class Iam:
       raise RuntimeError(resp.text)
     return resp.json()['project']
 
+  def project_status(self, prj_id:str) -> str|None:
+    '''Return the status of a project
+
+    :param prj_id: Project ID to query
+    :returns: project `status` (see {py:obj}`scullery.iam.Iam.get_project_details`),
+      or None if the project does not exist (e.g. its deletion completed)
+    :raises RuntimeError: on error
+    '''
+    resp = self.session.get(self.api_path(f'v3-ext/projects/{prj_id}'))
+    if resp.status_code == 404: return None
+    if resp.status_code != 200 or not 'project' in resp.json():
+      raise RuntimeError(resp.text)
+    return resp.json()['project'].get('status')
+
   def new_project(self, name:str, parent_id:str, description:str|None = None) -> str:
     '''Create a new project
 
@@ -431,6 +588,7 @@ class Iam:
     resp = self.session.post(self.api_path('v3/projects'), json = dict(project = payload))
     if resp.status_code != 201 or not 'project' in resp.json():
       raise RuntimeError(resp.text)
+    self.invalidate('projects')
     return resp.json()['project']['id']
 
   def del_project(self, prj_id:str) -> None:
@@ -440,10 +598,13 @@ class Iam:
     :raises RuntimeError: on error
 
     *NOTE* deleting a project takes over 30 minutes to complete.
+    Use {py:obj}`scullery.iam.Iam.project_status` (or
+    {py:obj}`scullery.waiter.Waiter` for many projects) to wait for it.
     '''
     resp = self.session.delete(self.api_path(f'v3/projects/{prj_id}'))
     if not resp.status_code in [200, 204]:
       raise RuntimeError(resp.text if resp.text else resp.reason)
+    self.invalidate('projects')
 
   def gen_user_name(self, length = 8) -> str:
     '''Generate a random user name
@@ -3,7 +3,7 @@
 # IMS functionality
 #
 '''Implement Image Management services'''
-
+from scullery import paginator
 
 try:
   from icecream import ic
@@ -14,41 +14,31 @@ class Ims:
   '''Main class for IMS'''
   API_HOST = 'ims.{region}.otc.t-systems.com'
   '''API End-point'''
+  API_SCHEME = 'https'
+  '''API URL scheme'''
 
   def api_path(self, path) -> str:
     '''API URL path'''
     host = Ims.API_HOST.format(region = self.session.region)
-    return f'https://{host}/{path}'
+    return f'{Ims.API_SCHEME}://{host}/{path}'
 
   def __init__(self, session) -> None:
     '''Constructor'''
     self.session = session
 
-  def images(self, **kwargs) -> list:
+  def images(self, **kwargs):
     '''Query images
 
     :param kwargs: query args to pass
-    :returns: list of images
+    :returns: generator yielding images
     :raises RuntimeError: on error
 
-    Will query and return a list images.  The list is cached
-    within the process
+    Will query and yield images, following the `next` links
+    of the reply.
     '''
-
-    url = 'v2/images'
-    while url:
-      resp = self.session.get(self.api_path(url), params = kwargs)
-      if kwargs: kwargs = dict()
-
-      resp.raise_for_status()
-      data = resp.json()
-
-      # Yield images from this page
-      for img in data.get('images',[]):
-        yield img
-
-      # Follow pagination
-      url = data.get('next')
+    # next links are absolute paths
+    yield from paginator.NextLinkPaginator(self.session, self.api_path('v2/images'), 'images', kwargs,
+                                            link = lambda href: self.api_path(href.lstrip('/')))
 
 
 
@@ -0,0 +1,92 @@
+#!python3
+#
+# JSON encoding/decoding
+#
+'''JSON encoding and decoding for REST API calls
+
+Uses [orjson](https://github.com/ijl/orjson) when it is installed,
+otherwise the standard library `json` module.  Set the environment
+variable `SCULLERY_JSON=json` to force the standard library.
+'''
+import json
+import os
+
+try:
+  import orjson
+except ImportError:
+  orjson = None
+
+try:
+  from icecream import ic
+except ImportError:  # Graceful fallback if IceCream isn't installed.
+  ic = lambda *a: None if not a else (a[0] if len(a) == 1 else a)  # noqa
+
+BACKENDS = ('orjson', 'json')
+'''Supported backends'''
+
+backend = None
+'''Name of the backend in use'''
+
+def _json_dumps(obj) -> bytes:
+  '''INTERNAL: encode using the standard library'''
+  return json.dumps(obj, separators = (',',':')).encode('utf-8')
+
+def use_backend(name:str|None = None) -> str:
+  '''Select the JSON backend
+
+  :param name: `orjson`, `json` or None for the fastest available
+  :returns: name of the backend selected
+  :raises ImportError: if `orjson` is requested but not installed
+  :raises ValueError: on unknown backend names
+  '''
+  global backend, loads, dumps
+  if name is None: name = 'json' if orjson is None else 'orjson'
+  if name not in BACKENDS: raise ValueError(f'Unknown JSON backend: {name}')
+  if name == 'orjson':
+    if orjson is None: raise ImportError('orjson is not installed')
+    loads, dumps = orjson.loads, orjson.dumps
+  else:
+    loads, dumps = json.loads, _json_dumps
+  backend = name
+  return name
+
+loads = None
+'''Decode JSON from `bytes` or `str`'''
+dumps = None
+'''Encode an object to JSON `bytes`'''
+
+use_backend(os.environ.get('SCULLERY_JSON'))
+
+class Response:
+  '''HTTP response decoding its JSON body only once
+
+  Wraps a `requests.Response`.  All attributes other than `json`
+  are those of the wrapped response.
+  '''
+  def __init__(self, resp) -> None:
+    '''Constructor
+
+    :param resp: `requests.Response` to wrap
+    '''
+    self.response = resp
+    self.data = None
+    self.decoded = False
+
+  def json(self):
+    '''Return the decoded JSON body (cached)
+
+    :raises ValueError: if the body is not valid JSON
+    '''
+    if not self.decoded:
+      self.data = loads(self.response.content)
+      self.decoded = True
+    return self.data
+
+  def __getattr__(self, name:str):
+    return getattr(self.response, name)
+
+  def __bool__(self) -> bool:
+    return bool(self.response)
+
+  def __repr__(self) -> str:
+    return repr(self.response)
@@ -0,0 +1,200 @@
+#!python3
+#
+# Multi-cloud recipe execution
+#
+'''Run a recipe against several clouds in parallel
+
+Each cloud gets its own thread.  Within that thread
+{py:obj}`scullery.cloud` returns the session of that cloud, so
+recipes run unchanged.  Sessions of all clouds authenticate
+concurrently.
+
+Lines written to `sys.stdout` and `sys.stderr` by a cloud thread are
+prefixed with the cloud name, so the output of all clouds can be
+merged and filtered with the usual tools.  Output of other threads is
+passed through.
+
+Each cloud thread gets its own copy of the parsed arguments, as
+recipes change them.  Input files are read once and every thread
+reads its own copy of the contents.
+'''
+import copy
+import io
+import sys
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+  from icecream import ic
+except ImportError:  # Graceful fallback if IceCream isn't installed.
+  ic = lambda *a: None if not a else (a[0] if len(a) == 1 else a)  # noqa
+
+import scullery
+
+class PrefixedOutput:
+  '''Text stream prefixing lines with the cloud of the writing thread
+
+  Partial lines are buffered per thread, so lines of different clouds
+  are never mixed.
+  '''
+  def __init__(self, stream, width:int = 0) -> None:
+    '''Constructor
+
+    :param stream: stream to write to
+    :param width: width of the cloud name column
+    '''
+    self.stream = stream
+    self.width = width
+    self.lock = threading.Lock()
+    self.local = threading.local()
+    '''Partial line of each thread'''
+
+  def write(self, text:str) -> int:
+    cloud_name = getattr(scullery.local, 'cloud', None)
+    if cloud_name is None:
+      with self.lock:
+        return self.stream.write(text)
+    *lines, self.local.pending = (getattr(self.local, 'pending', '') + text).split('\n')
+    if lines:
+      out = ''.join(f'{cloud_name:{self.width}} {line}\n' for line in lines)
+      with self.lock:
+        self.stream.write(out)
+    return len(text)
+
+  def finish(self) -> None:
+    '''Write the pending partial line of the calling thread'''
+    pending = getattr(self.local, 'pending', '')
+    if pending: self.write('\n')
+
+  def flush(self) -> None:
+    self.stream.flush()
+
+  def __getattr__(self, name:str):
+    return getattr(self.stream, name)
+
+class Input(io.StringIO):
+  '''In-memory copy of an input file, keeping its `name`'''
+  def __init__(self, text:str, name:str) -> None:
+    super().__init__(text)
+    self.name = name
+
+def thread_args(args, inputs:dict[str,tuple[str,str]]):
+  '''INTERNAL: copy of the parsed arguments for one cloud thread
+
+  :param args: parsed command line arguments
+  :param inputs: dictionary argument : (file contents, file name)
+  :returns: shallow copy of `args`, with its own copy of each input file
+  '''
+  args = copy.copy(args)
+  for key, (text, name) in inputs.items():
+    setattr(args, key, Input(text, name))
+  return args
+
+def read_inputs(args) -> dict[str,tuple[str,str]]:
+  '''INTERNAL: read the input files of the parsed arguments
+
+  :param args: parsed command line arguments
+  :returns: dictionary argument : (file contents, file name)
+  '''
+  inputs = dict()
+  for key, value in vars(args).items():
+    if value is sys.stdout or value is sys.stderr: continue
+    if isinstance(value, io.TextIOBase) and not value.closed and value.readable():
+      inputs[key] = (value.read(), getattr(value, 'name', key))
+  return inputs
+
+class Result:
+  '''Outcome of a recipe on one cloud'''
+  def __init__(self, cloud_name:str) -> None:
+    '''Constructor
+
+    :param cloud_name: cloud the recipe ran against
+    '''
+    self.cloud_name = cloud_name
+    self.auth_time = None
+    '''Seconds spent authenticating'''
+    self.run_time = None
+    '''Seconds spent running the recipe'''
+    self.error = None
+    '''Exception raised, or None on success'''
+
+  @property
+  def ok(self) -> bool:
+    '''True if the recipe succeeded'''
+    return self.error is None
+
+def run_one(recipe_cb, args, cloud_name:str, outputs:list[PrefixedOutput] = []) -> Result:
+  '''Run a recipe against one cloud in the calling thread
+
+  :param recipe_cb: recipe callback
+  :param args: parsed command line arguments, for this thread only
+  :param cloud_name: cloud to run against
+  :param outputs: prefixed output streams (if installed)
+  :returns: the outcome
+  '''
+  result = Result(cloud_name)
+  scullery.local.cloud = cloud_name
+  start = time.perf_counter()
+  try:
+    scullery.cloud()
+    result.auth_time = time.perf_counter() - start
+    start = time.perf_counter()
+    recipe_cb(args)
+  except SystemExit as e:
+    if e.code not in (None, 0): result.error = e
+  except Exception as e:
+    result.error = e
+  finally:
+    if result.auth_time is None:
+      result.auth_time = time.perf_counter() - start
+    else:
+      result.run_time = time.perf_counter() - start
+    for output in outputs: output.finish()
+    scullery.local.cloud = None
+  return result
+
+def run(recipe_cb, args, cloud_names:list[str], max_workers:int|None = None,
+        prefix:bool = True) -> list[Result]:
+  '''Run a recipe against several clouds in parallel
+
+  :param recipe_cb: recipe callback
+  :param args: parsed command line arguments
+  :param cloud_names: clouds to run against
+  :param max_workers: maximum number of clouds handled at the same time (default all)
+  :param prefix: prefix output lines with the cloud name
+  :returns: list of {py:obj}`scullery.multicloud.Result`, in `cloud_names` order
+  '''
+  inputs = read_inputs(args)
+  outputs = []
+  if prefix:
+    width = max(len(cn) for cn in cloud_names)
+    outputs = [ PrefixedOutput(sys.stdout, width), PrefixedOutput(sys.stderr, width) ]
+    sys.stdout, sys.stderr = outputs
+  try:
+    with ThreadPoolExecutor(max_workers = max_workers or len(cloud_names)) as pool:
+      return list(pool.map(lambda cn: run_one(recipe_cb, thread_args(args, inputs), cn, outputs),
+                            cloud_names))
+  finally:
+    if outputs: sys.stdout, sys.stderr = [ output.stream for output in outputs ]
+
+def report(results:list[Result], fp = None) -> None:
+  '''Write per-cloud timings and failures
+
+  :param results: outcomes returned by {py:obj}`scullery.multicloud.run`
+  :param fp: stream to write to (default `sys.stderr`)
+  '''
+  if fp is None: fp = sys.stderr
+  width = max([len('cloud')] + [len(r.cloud_name) for r in results])
+  fp.write(f'{"cloud":{width}} {"auth":>8} {"run":>8}  status\n')
+  for r in results:
+    auth = '-' if r.auth_time is None else f'{r.auth_time:.2f}s'
+    rtime = '-' if r.run_time is None else f'{r.run_time:.2f}s'
+    if r.ok:
+      status = 'ok'
+    else:
+      status = f'{type(r.error).__name__}: {r.error}'.splitlines()[0]
+    fp.write(f'{r.cloud_name:{width}} {auth:>8} {rtime:>8}  {status}\n')
+  failed = sum(not r.ok for r in results)
+  fp.write(f'{len(results) - failed} succeeded, {failed} failed\n')
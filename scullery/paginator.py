@@ -0,0 +1,235 @@
+#!python3
+#
+# Pagination
+#
+'''Iterate over paginated REST API queries
+
+Paginated queries are iterated as generators yielding one item at a
+time.  While the caller consumes a page, the next page is fetched
+on a background thread.  With {py:obj}`scullery.aio` sessions use
+`async for`; the next page is then fetched by a concurrent task.
+
+Supported pagination styles:
+
+- {py:obj}`scullery.paginator.MarkerPaginator` : `marker` query
+  parameter taken from the reply (e.g. RMS `page_info.next_marker`)
+  or from the last item of a full page (e.g. Nova servers)
+- {py:obj}`scullery.paginator.NextLinkPaginator` : the reply contains
+  a link to the next page (e.g. Glance `next`)
+- {py:obj}`scullery.paginator.OffsetPaginator` : `limit`/`offset`
+  query parameters
+'''
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Iterator
+
+try:
+  from icecream import ic
+except ImportError:  # Graceful fallback if IceCream isn't installed.
+  ic = lambda *a: None if not a else (a[0] if len(a) == 1 else a)  # noqa
+
+class Paginator:
+  '''Base class for paginated queries
+
+  Sub-classes implement {py:obj}`scullery.paginator.Paginator.next_page`.
+  '''
+  def __init__(self, session, url:str, key:str, params:dict|None = None,
+                prefetch:bool = True) -> None:
+    '''Constructor
+
+    :param session: session used to send requests
+    :param url: URL of the first page
+    :param key: key of the list of items in the reply
+    :param params: query parameters of the first page
+    :param prefetch: fetch the next page on a background thread
+    '''
+    self.session = session
+    self.url = url
+    self.key = key
+    self.params = dict(params or {})
+    self.prefetch = prefetch
+
+  def next_page(self, url:str, params:dict, data:dict, items:list) -> tuple[str,dict]|None:
+    '''Compute the request for the next page
+
+    :param url: URL of the current page
+    :param params: query parameters of the current page
+    :param data: decoded reply of the current page
+    :param items: items of the current page
+    :returns: tuple with URL and query parameters, or None on the last page
+    '''
+    raise NotImplementedError
+
+  def parse(self, resp, url:str, params:dict) -> tuple[list,tuple[str,dict]|None]:
+    '''INTERNAL: extract the items and next page request from a reply'''
+    if resp.status_code != 200 or not self.key in resp.json():
+      raise RuntimeError(resp.text)
+    data = resp.json()
+    items = data[self.key]
+    return items, (self.next_page(url, params, data, items) if items else None)
+
+  def fetch(self, url:str, params:dict) -> tuple[list,tuple[str,dict]|None]:
+    '''Fetch one page
+
+    :param url: page URL
+    :param params: query parameters
+    :returns: tuple with the list of items and the next page request (or None)
+    :raises RuntimeError: on error
+    '''
+    return self.parse(self.session.get(url, params = params), url, params)
+
+  async def afetch(self, url:str, params:dict) -> tuple[list,tuple[str,dict]|None]:
+    '''Async version of {py:obj}`scullery.paginator.Paginator.fetch`'''
+    return self.parse(await self.session.get(url, params = params), url, params)
+
+  def pages(self) -> Iterator[list]:
+    '''Iterate over pages
+
+    :returns: generator yielding a list of items per page
+    '''
+    request = (self.url, self.params)
+    if not self.prefetch:
+      while request is not None:
+        items, request = self.fetch(*request)
+        yield items
+      return
+
+    with ThreadPoolExecutor(max_workers = 1) as pool:
+      future = pool.submit(self.fetch, *request)
+      while future is not None:
+        items, request = future.result()
+        future = None if request is None else pool.submit(self.fetch, *request)
+        yield items
+
+  async def apages(self) -> AsyncIterator[list]:
+    '''Iterate over pages of an async session
+
+    :returns: async generator yielding a list of items per page
+
+    The next page is fetched by a concurrent task.
+    '''
+    import asyncio
+    request = (self.url, self.params)
+    if not self.prefetch:
+      while request is not None:
+        items, request = await self.afetch(*request)
+        yield items
+      return
+
+    task = asyncio.ensure_future(self.afetch(*request))
+    try:
+      while task is not None:
+        items, request = await task
+        task = None if request is None else asyncio.ensure_future(self.afetch(*request))
+        yield items
+    finally:
+      if task is not None: task.cancel()
+
+  def __iter__(self) -> Iterator[Any]:
+    for items in self.pages():
+      yield from items
+
+  async def items(self) -> AsyncIterator[Any]:
+    '''INTERNAL: async generator over items'''
+    async for items in self.apages():
+      for item in items:
+        yield item
+
+  def __aiter__(self) -> AsyncIterator[Any]:
+    return self.items()
+
+class MarkerPaginator(Paginator):
+  '''Pagination using a `marker` query parameter'''
+  def __init__(self, session, url:str, key:str, params:dict|None = None,
+                limit:int|None = None,
+                next_marker:Callable[[dict,list],str|None]|None = None,
+                marker_param:str = 'marker', limit_param:str = 'limit',
+                prefetch:bool = True) -> None:
+    '''Constructor
+
+    :param session: session used to send requests
+    :param url: URL of the query
+    :param key: key of the list of items in the reply
+    :param params: query parameters
+    :param limit: page size
+    :param next_marker: function of reply and items returning the next marker (or None)
+    :param marker_param: name of the marker query parameter
+    :param limit_param: name of the page size query parameter
+    :param prefetch: fetch the next page on a background thread
+
+    If `next_marker` is not given, the `id` of the last item is used
+    as long as pages are full.
+    '''
+    super().__init__(session, url, key, params, prefetch)
+    if limit is not None: self.params.setdefault(limit_param, limit)
+    self.limit = self.params.get(limit_param)
+    self.marker_param = marker_param
+    self.next_marker = self.last_id if next_marker is None else next_marker
+
+  def last_id(self, data:dict, items:list) -> str|None:
+    '''INTERNAL: default marker: ID of the last item of a full page'''
+    if self.limit is None or len(items) < int(self.limit): return None
+    return items[-1]['id']
+
+  def next_page(self, url:str, params:dict, data:dict, items:list) -> tuple[str,dict]|None:
+    marker = self.next_marker(data, items)
+    if marker is None: return None
+    return url, dict(params, **{ self.marker_param: marker })
+
+class NextLinkPaginator(Paginator):
+  '''Pagination following a link to the next page'''
+  def __init__(self, session, url:str, key:str, params:dict|None = None,
+                link:Callable[[str],str] = lambda href: href,
+                next_key:str = 'next',
+                prefetch:bool = True) -> None:
+    '''Constructor
+
+    :param session: session used to send requests
+    :param url: URL of the first page
+    :param key: key of the list of items in the reply
+    :param params: query parameters of the first page
+    :param link: function converting the next link into a URL
+    :param next_key: key of the next link in the reply, a dotted path for nested keys (e.g. `links.next`)
+    :param prefetch: fetch the next page on a background thread
+
+    The next link already contains the query parameters.
+    '''
+    super().__init__(session, url, key, params, prefetch)
+    self.link = link
+    self.next_key = next_key
+
+  def next_page(self, url:str, params:dict, data:dict, items:list) -> tuple[str,dict]|None:
+    href = data
+    for key in self.next_key.split('.'):
+      href = href.get(key) if isinstance(href, dict) else None
+    if not href: return None
+    return self.link(href), {}
+
+class OffsetPaginator(Paginator):
+  '''Pagination using `limit` and `offset` query parameters'''
+  def __init__(self, session, url:str, key:str, params:dict|None = None,
+                limit:int = 100,
+                offset_param:str = 'offset', limit_param:str = 'limit',
+                prefetch:bool = True) -> None:
+    '''Constructor
+
+    :param session: session used to send requests
+    :param url: URL of the query
+    :param key: key of the list of items in the reply
+    :param params: query parameters
+    :param limit: page size
+    :param offset_param: name of the offset query parameter
+    :param limit_param: name of the page size query parameter
+    :param prefetch: fetch the next page on a background thread
+
+    Stops at the first page that is not full.
+    '''
+    super().__init__(session, url, key, params, prefetch)
+    self.params.setdefault(limit_param, limit)
+    self.params.setdefault(offset_param, 0)
+    self.limit_param = limit_param
+    self.offset_param = offset_param
+
+  def next_page(self, url:str, params:dict, data:dict, items:list) -> tuple[str,dict]|None:
+    limit = int(params[self.limit_param])
+    if len(items) < limit: return None
+    return url, dict(params, **{ self.offset_param: int(params[self.offset_param]) + limit })
@@ -1,10 +1,44 @@
 '''
 Used to define sub-parsers
+
+Recipes are listed in a manifest so that the command line can be
+built without importing every recipe module.  Only the module of the
+selected recipe is imported.
 '''
+import argparse
+import importlib
 from typing import Callable, Any
 
 PARSER_FACTORY = {}
 
+RECIPES = {}
+'''Recipe manifest: id : (module, command, help, aliases)'''
+
+class RecipeParser(argparse.ArgumentParser):
+  '''Parser of a recipe
+
+  A recipe with operations can name a `default_op`: when the first
+  argument is not one of the operations (or `-h`), all the arguments
+  are parsed by the `default_op` operation.  For example,
+  `kermit PROJECT` is read as `kermit setup PROJECT`.
+  '''
+  def __init__(self, *args, default_op:str|None = None, **kwargs):
+    super().__init__(*args, **kwargs)
+    self.default_op = default_op
+    self.ops = None
+
+  def add_subparsers(self, **kwargs):
+    '''Add the operation sub-parsers (see `ArgumentParser.add_subparsers`)'''
+    self.ops = super().add_subparsers(**kwargs)
+    return self.ops
+
+  def parse_known_args(self, args = None, namespace = None):
+    '''Parse arguments, inserting the `default_op` if needed'''
+    if self.default_op is not None and self.ops is not None and args:
+      if args[0] not in self.ops.choices and args[0] not in ('-h', '--help'):
+        args = [ self.default_op ] + list(args)
+    return super().parse_known_args(args, namespace)
+
 def register_parser(mid:str, parser_cb:Callable[None,[Any]]):
   '''Register a sub-parser
 
@@ -13,3 +47,47 @@ def register_parser(mid:str, parser_cb:Callable[None,[Any]]):
   '''
   PARSER_FACTORY[mid] = parser_cb
 
+def register_recipe(mid:str, module:str, name:str, help:str, aliases:list[str] = []):
+  '''Add a recipe to the manifest
+
+  :param mid: id used by the recipe module in {py:obj}`scullery.parsers.register_parser`
+  :param module: module implementing the recipe
+  :param name: sub-command name
+  :param help: sub-command help text
+  :param aliases: sub-command aliases
+  '''
+  RECIPES[mid] = (module, name, help, aliases)
+
+register_recipe('cache', 'scullery.rcp_cache', 'cache', 'IAM directory snapshot', ['snapshot'])
+register_recipe('ecs', 'scullery.rcp_ecs', 'ecs', 'ECS management', ['vms', 'deh'])
+register_recipe('groups', 'scullery.rcp_groups', 'groups', 'Group recipes', ['group','grp','g'])
+register_recipe('images', 'scullery.rcp_ims', 'images', 'Image management', ['ims', 'im'])
+register_recipe('kermit', 'scullery.rcp_kermit', 'kermit', 'Kermit recipe', ['ker','kk'])
+register_recipe('projects', 'scullery.rcp_projects', 'project', 'Project Management service', ['projects', 'prj','p'])
+register_recipe('resources', 'scullery.rcp_rms', 'resources', 'Resource management', ['rms', 'rsc'])
+register_recipe('roles', 'scullery.rcp_roles', 'roles', 'Role recipes', ['role'])
+register_recipe('serve', 'scullery.rcp_serve', 'serve', 'Run the background accelerator daemon', ['daemon'])
+register_recipe('showproxy', 'scullery.rcp_showcfg', 'show-proxy-cfg', 'Show proxy auto configuration', ['spc','showproxy', 'showcfg'])
+register_recipe('tag management', 'scullery.rcp_tms', 'tags', 'Tag management service', ['tms'])
+register_recipe('users', 'scullery.rcp_users', 'users', 'User recipes', ['user','usr','u'])
+
+def add_parsers(subp, lazy:bool = False, selected:str|None = None) -> None:
+  '''Add the recipe sub-parsers
+
+  :param subp: sub-parsers object from `ArgumentParser.add_subparsers`
+  :param lazy: only import the module of the `selected` recipe
+  :param selected: name of the recipe to load when `lazy`
+
+  When `lazy`, the other recipes get a stub sub-parser that only
+  sets `recipe_name`.  The caller can then re-build the parser
+  with that recipe selected.
+  '''
+  for mid in sorted(set(RECIPES) | set(PARSER_FACTORY)):
+    if mid in RECIPES:
+      module, name, help, aliases = RECIPES[mid]
+      if lazy and selected != name:
+        pr = subp.add_parser(name, help = help, aliases = aliases, add_help = False)
+        pr.set_defaults(recipe_name = name)
+        continue
+      if mid not in PARSER_FACTORY: importlib.import_module(module)
+    PARSER_FACTORY[mid](subp)
@@ -0,0 +1,302 @@
+#!python3
+#
+# Rate limiting
+#
+'''Client side rate limiting and retries
+
+Requests are throttled per service host using token buckets and
+retried with exponential backoff and jitter when the cloud answers
+with `429 Too Many Requests` or a transient `5xx` error.  A
+`Retry-After` header sent by the server is honoured.
+
+Limits are configured per service, using either the full host name
+or only the service prefix, e.g. `iam` for `iam.eu-de.otc.t-systems.com`.
+'''
+import email.utils
+import random
+import threading
+import time
+
+from collections import Counter
+from urllib.parse import urlsplit
+
+try:
+  from icecream import ic
+except ImportError:  # Graceful fallback if IceCream isn't installed.
+  ic = lambda *a: None if not a else (a[0] if len(a) == 1 else a)  # noqa
+
+IDEMPOTENT = frozenset(['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'])
+'''HTTP methods that are safe to repeat after a server error'''
+
+class TokenBucket:
+  '''Token bucket rate limiter'''
+
+  def __init__(self, rate:float, burst:int = 1) -> None:
+    '''Constructor
+
+    :param rate: requests per second
+    :param burst: maximum number of requests that can be sent at once
+    :raises ValueError: if `rate` is not positive
+    '''
+    if not rate > 0: raise ValueError(f'{rate}: rate must be positive')
+    self.rate = rate
+    self.burst = max(1, burst)
+    self.tokens = float(self.burst)
+    self.stamp = time.monotonic()
+    self.lock = threading.Lock()
+
+  def reserve(self) -> float:
+    '''Take a token from the bucket
+
+    :returns: seconds the caller must wait before sending its request
+    '''
+    with self.lock:
+      now = time.monotonic()
+      self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+      self.stamp = now
+      self.tokens -= 1
+      if self.tokens >= 0: return 0.0
+      return -self.tokens / self.rate
+
+  def take(self) -> bool:
+    '''Take a token from the bucket if one is available now
+
+    :returns: True if a token was taken
+    '''
+    with self.lock:
+      now = time.monotonic()
+      self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+      self.stamp = now
+      if self.tokens < 1: return False
+      self.tokens -= 1
+      return True
+
+class RetryPolicy:
+  '''Retry with exponential backoff and jitter'''
+
+  def __init__(self, max_retries:int = 5, backoff:float = 0.5,
+                max_backoff:float = 30.0,
+                statuses:tuple[int] = (429, 500, 502, 503, 504)) -> None:
+    '''Constructor
+
+    :param max_retries: maximum number of retries per request
+    :param backoff: base delay in seconds
+    :param max_backoff: maximum delay in seconds
+    :param statuses: HTTP status codes that are retried
+
+    `429` responses are always retried as the server did not process
+    the request.  Other status codes are only retried for idempotent
+    methods.
+    '''
+    self.max_retries = max_retries
+    self.backoff = backoff
+    self.max_backoff = max_backoff
+    self.statuses = frozenset(statuses)
+
+  def should_retry(self, method:str, status:int, attempt:int) -> bool:
+    '''Check if a response should be retried
+
+    :param method: HTTP method
+    :param status: response status code
+    :param attempt: number of retries done so far
+    :returns: True if the request should be sent again
+    '''
+    if attempt >= self.max_retries or status not in self.statuses: return False
+    return status == 429 or method.upper() in IDEMPOTENT
+
+  def delay(self, attempt:int, retry_after:str|None = None) -> float:
+    '''Compute the delay before the next retry
+
+    :param attempt: number of retries done so far
+    :param retry_after: value of the `Retry-After` header (if any)
+    :returns: seconds to wait
+    '''
+    wait = random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt)))
+    if retry_after:
+      try:
+        wait = max(wait, float(retry_after))
+      except ValueError:
+        try:
+          when = email.utils.parsedate_to_datetime(retry_after)
+          wait = max(wait, when.timestamp() - time.time())
+        except (TypeError, ValueError):
+          pass
+    return wait
+
+class RateLimiter:
+  '''Per host rate limiting and retries
+
+  Keeps the following counters in `stats`:
+
+  - `requests` : requests sent (including retries)
+  - `throttled` : requests delayed by the client side rate limit
+  - `rate_limited` : `429` responses received
+  - `retried` : requests sent again after an error
+  - `failed` : requests that failed after exhausting retries
+
+  {py:obj}`scullery.api.ApiSession` also counts:
+
+  - `coalesced` : requests that shared the response of an identical
+    request in progress
+  - `cached` : requests answered from the read cache
+  '''
+
+  def __init__(self, limits:dict[str,tuple[float,int]]|None = None,
+                retry:RetryPolicy|None = None,
+                exceptions:tuple = ()) -> None:
+    '''Constructor
+
+    :param limits: dictionary of service/host : (rate, burst)
+    :param retry: retry policy (defaults to {py:obj}`scullery.ratelimit.RetryPolicy`)
+    :param exceptions: connection errors that are retried for idempotent methods
+    '''
+    self.retry = RetryPolicy() if retry is None else retry
+    self.exceptions = exceptions
+    self.limits = dict()
+    self.buckets = dict()
+    self.lock = threading.Lock()
+    self.stats = Counter()
+    self.stats_lock = threading.Lock()
+    for host, (rate, burst) in (limits or {}).items():
+      self.configure(host, rate, burst)
+
+  def configure(self, host:str, rate:float|None, burst:int = 1) -> None:
+    '''Set the rate limit for a host
+
+    :param host: full host name or service prefix (e.g. `iam`)
+    :param rate: requests per second (`None` to remove the limit)
+    :param burst: maximum number of requests that can be sent at once
+    :raises ValueError: if `rate` is not positive
+    '''
+    if rate is not None and not rate > 0: raise ValueError(f'{host}: rate must be positive')
+    with self.lock:
+      if rate is None:
+        self.limits.pop(host, None)
+      else:
+        self.limits[host] = (rate, burst)
+      self.buckets = dict()
+
+  def count(self, key:str) -> None:
+    '''INTERNAL: increment a counter'''
+    with self.stats_lock:
+      self.stats[key] += 1
+
+  def bucket(self, host:str) -> TokenBucket|None:
+    '''Return the token bucket for a host
+
+    :param host: host name
+    :returns: token bucket or None if the host is not rate limited
+    '''
+    if host in self.buckets: return self.buckets[host]
+    with self.lock:
+      if host not in self.buckets:
+        key = host if host in self.limits else host.split('.',1)[0]
+        if key in self.limits:
+          # Hosts sharing a service prefix share the bucket
+          if key not in self.buckets: self.buckets[key] = TokenBucket(*self.limits[key])
+          self.buckets[host] = self.buckets[key]
+        else:
+          self.buckets[host] = None
+      return self.buckets[host]
+
+  def wait_time(self, url:str) -> float:
+    '''INTERNAL: reserve a slot for a request to `url`'''
+    self.count('requests')
+    bucket = self.bucket(urlsplit(url).hostname or '')
+    if bucket is None: return 0.0
+    wait = bucket.reserve()
+    if wait > 0: self.count('throttled')
+    return wait
+
+  def retry_time(self, method:str, resp, attempt:int) -> float|None:
+    '''INTERNAL: check if a response should be retried
+
+    :returns: seconds to wait before retrying or None
+    '''
+    if resp.status_code == 429: self.count('rate_limited')
+    if not self.retry.should_retry(method, resp.status_code, attempt):
+      if resp.status_code in self.retry.statuses: self.count('failed')
+      return None
+    self.count('retried')
+    return self.retry.delay(attempt, resp.headers.get('Retry-After'))
+
+  def error_time(self, method:str, attempt:int) -> float|None:
+    '''INTERNAL: check if a connection error should be retried'''
+    if attempt >= self.retry.max_retries or method.upper() not in IDEMPOTENT:
+      self.count('failed')
+      return None
+    self.count('retried')
+    return self.retry.delay(attempt)
+
+  def call(self, method:str, url:str, send):
+    '''Send a request applying rate limits and retries
+
+    :param method: HTTP method
+    :param url: request URL
+    :param send: callable without arguments that sends the request
+    :returns: response
+    '''
+    attempt = 0
+    while True:
+      wait = self.wait_time(url)
+      if wait > 0: time.sleep(wait)
+      try:
+        resp = send()
+      except self.exceptions:
+        wait = self.error_time(method, attempt)
+        if wait is None: raise
+      else:
+        wait = self.retry_time(method, resp, attempt)
+        if wait is None: return resp
+      time.sleep(wait)
+      attempt += 1
+
+  async def acall(self, method:str, url:str, send):
+    '''Async version of {py:obj}`scullery.ratelimit.RateLimiter.call`
+
+    :param method: HTTP method
+    :param url: request URL
+    :param send: callable without arguments returning an awaitable
+    :returns: response
+    '''
+    import asyncio
+    attempt = 0
+    while True:
+      wait = self.wait_time(url)
+      if wait > 0: await asyncio.sleep(wait)
+      try:
+        resp = await send()
+      except self.exceptions:
+        wait = self.error_time(method, attempt)
+        if wait is None: raise
+      else:
+        wait = self.retry_time(method, resp, attempt)
+        if wait is None: return resp
+      await asyncio.sleep(wait)
+      attempt += 1
+
+def positive_rate(text:str) -> float:
+  '''Parse a rate in requests per second
+
+  :param text: positive number
+  :returns: rate
+  :raises ValueError: if `text` is not a positive number
+
+  Also used as `type` of command line options.
+  '''
+  rate = float(text)
+  if not rate > 0: raise ValueError(f'{text}: rate must be positive')
+  return rate
+
+def parse_limit(text:str) -> tuple[str,float,int]:
+  '''Parse a rate limit specification
+
+  :param text: string of the form `service=rate[:burst]`
+  :returns: tuple with host, rate, burst
+  :raises ValueError: on syntax errors, rates not above 0 or bursts below 1
+  '''
+  host, limit = text.split('=',1)
+  rate, burst = limit.split(':',1) if ':' in limit else (limit, 1)
+  burst = int(burst)
+  if burst < 1: raise ValueError(f'{text}: burst must be at least 1')
+  return host.strip(), positive_rate(rate), burst
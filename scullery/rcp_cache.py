@@ -0,0 +1,100 @@
+#
+# Snapshot recipes
+#
+'''
+## IAM directory snapshot
+
+Keep a local snapshot of users, groups, memberships, projects, roles
+and group grants so that listing and look-up recipes can answer
+without calling the cloud.
+
+Refresh the snapshot:
+
+```bash
+scullery cache sync [--no-grants] [--workers N]
+```
+
+Show the snapshot age and size:
+
+```bash
+scullery cache
+```
+
+Then use the snapshot:
+
+```bash
+scullery --offline users
+scullery --max-age 3600 project get eu-de_myproject
+```
+
+`--offline` only uses the snapshot and fails for recipes that need
+the cloud.  `--max-age SECS` uses the snapshot while it is not older
+than `SECS`, and the cloud otherwise.
+
+Group grants are read from the role assignments listing; use
+`--no-grants` to skip them.
+
+***
+'''
+
+import argparse
+import sys
+import time
+
+try:
+  from icecream import ic
+except ImportError:  # Graceful fallback if IceCream isn't installed.
+  ic = lambda *a: None if not a else (a[0] if len(a) == 1 else a)  # noqa
+
+from scullery import cloud
+from scullery import parsers
+from scullery import snapshot
+
+
+def info(args:argparse.Namespace) -> None:
+  '''Show the snapshot age and contents'''
+  import scullery
+
+  cc = snapshot.OfflineSession(scullery.cloud_creds())
+  age = cc.snapshot.age()
+  print(f'file: {cc.snapshot.path}')
+  if age is None:
+    print('not synced')
+    return
+  print(f'age:  {age:.0f}s')
+  for table, count in cc.snapshot.counts().items():
+    print(f'{table:16} {count}')
+
+def sync(args:argparse.Namespace) -> None:
+  '''Refresh the snapshot from the cloud'''
+  cc = cloud()
+  snap = snapshot.Snapshot(snapshot.snapshot_path(cc.cloud_name, cc.domain_name))
+  start = time.perf_counter()
+  counts = snap.sync(cc.iam, grants = args.grants, max_workers = args.workers,
+                      progress = lambda msg: sys.stderr.write(f'Syncing {msg}\n'))
+  sys.stderr.write(f'{snap.path}: synced in {time.perf_counter() - start:.1f}s\n')
+  for table, count in counts.items():
+    print(f'{table:16} {count}')
+
+
+def parser(subp):
+  pr = subp.add_parser('cache',
+            help = 'IAM directory snapshot',
+            aliases = ['snapshot'])
+  pr.set_defaults(recipe_cb = info)
+  csp = pr.add_subparsers(title='op',
+                          description='Operation.  If not specified, show the snapshot status.',
+                          required = False,
+                          help = 'Operation')
+  pp = csp.add_parser('sync',
+                  help = 'Refresh the snapshot from the cloud',
+                  aliases = ['refresh'])
+  pp.add_argument('--no-grants', dest = 'grants',
+                  help = 'Do not save project and domain grants',
+                  action = 'store_false', default = True)
+  pp.add_argument('-w','--workers',
+                  help = 'Concurrent API calls',
+                  type = int, default = snapshot.SYNC_WORKERS)
+  pp.set_defaults(recipe_cb = sync)
+
+parsers.register_parser('cache',parser)
@@ -36,7 +36,7 @@ def list_servers(args:argparse.Namespace) -> None:
 def action(args:argparse.Namespace) -> None:
   cc = cloud(scoped = True)
   for ecs_name in args.server:
-    q = cc.ecs.servers(name = ecs_name)
+    q = list(cc.ecs.servers(name = ecs_name))
     if len(q) != 1: raise KeyError(ecs_name)
     if args.mode == 'start':
       action = ecs.ACTION.START
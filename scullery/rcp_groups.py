@@ -63,41 +63,54 @@ def add_group(args:argparse.Namespace):
 
 def del_group(args:argparse.Namespace):
   cc = cloud()
-  for g in args.name:
-    try:
-      grps = cc.iam.groups(g)
-      if len(grps) != 1: raise KeyError(g)
-      cc.iam.del_group(grps[0]['id'])
-      sys.stderr.write(f'Removed group: {g} ({grps[0]["id"]})\n')
-    except KeyError:
+  found = cc.iam.resolve('groups', args.name)
+  def delete(g:str) -> str:
+    if not g in found: raise KeyError(g)
+    cc.iam.del_group(found[g]['id'])
+    return found[g]['id']
+
+  for g, res in zip(args.name, cc.map(delete, args.name)):
+    if isinstance(res, KeyError):
       sys.stderr.write(f'{g}: Group not found\n')
+    elif isinstance(res, Exception):
+      sys.stderr.write(f'{g}: {res}\n')
+    else:
+      sys.stderr.write(f'Removed group: {g} ({res})\n')
 
 def get_group(args:argparse.Namespace):
-  cc = cloud()
-  for group_name in args.group:
+  cc = cloud(snapshot = True)
+  def lookup(group_name:str):
     group = cc.iam.groups(group_name)
-    if len(group) != 1:
+    if len(group) != 1: return None
+    group = group[0]
+    return (group,
+            cc.iam.get_domain_group_perms(group['domain_id'], group['id']),
+            cc.iam.group_users(group['id']))
+
+  for group_name, res in zip(args.group, cc.map(lookup, args.group)):
+    if res is None:
       sys.stderr.write(f'{group_name} not matched\n')
       continue
-    group = group[0]
+    if isinstance(res, Exception):
+      sys.stderr.write(f'{group_name}: {res}\n')
+      continue
+    group, perms, users = res
     print('id:    {id}\n name: {name}\n desc: {description}'.format(**group))
     # ~ print(json.dumps(group,indent=2))
 
-    perms = cc.iam.get_domain_group_perms(group['domain_id'], group['id'])
     if len(perms) > 0:
       # ~ print(json.dumps(perms,indent=2))
       print(' Domain roles:')
       for r in perms:
         print('  - {display_name}: {description}'.format(**r))
 
-    users = cc.iam.group_users(group['id'])
     if len(users) > 0:
       print(' users;')
       for u in users:
         print('   {name}: {description}'.format(**u))
 
 def list_groups(args:argparse.Namespace):
-  cc = cloud()
+  cc = cloud(snapshot = True)
   for g in cc.iam.groups():
     print('{name} {description}'.format(**g))
 
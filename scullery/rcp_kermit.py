@@ -21,17 +21,47 @@ Setting up a project will:
 Additional users/credentials can be created using the `user` recipe and
 assigned to the created groups.
 
+Several projects can be set-up from the same spec in one run, by
+naming them on the command line or listing them in a file (one name
+per line, `#` starts a comment).  The spec template is parsed once,
+the projects share the session and the look-ups of regions and
+roles, and run concurrently.  The output has the credentials of all
+projects:
+
+```bash
+scullery kermit setup --projects-file=class.txt --output=class.yaml
+```
+
+The spec is compiled into a dependency graph (project, then roles and
+groups, then grants; groups, then users, then memberships) and
+independent steps run concurrently (`--workers`, default 8).  A table
+with the start time and duration of every step is written to standard
+error at the end; steps marked `*` form the critical path.  If a step
+fails, the steps depending on it are skipped, the credentials of the
+users created are still written and the exit status is 1.
+
+With `--journal=file`, every completed step is appended to `file`
+(one JSON line with the created IDs).  After a failure, fix the
+cause and rerun with `--resume=file`: recorded steps are skipped
+without querying the cloud and only the remaining work is done.
+The journal does not contain passwords; generated passwords of users
+created before the failure are written as `*redacted*` by the resumed
+run, and can be found in the output of the failed run.
+
 If setting up a project using defaults you only need to use:
 
 ```bash
-scullery kermit setup --defaults=region_project-name --output=info.yaml
+scullery kermit setup region_project-name --output=info.yaml
 ```
 
+`setup` is the default operation, so `scullery kermit region_project-name`
+still works as before operations were added.
+
 If you want to tweak the project configuration you need to use a YAML
 file:
 
 ```bash
-scullery kermit setup --spec=input.yaml --output=info.yaml
+scullery kermit setup --spec=input.yaml --output=info.yaml region_project-name
 ```
 
 Example YAML file:
@@ -84,29 +114,63 @@ creds:
   my_admin: change_Me123
 ```
 
-## delete
+## plan and apply
+
+To bring an existing project in line with its spec:
+
+```bash
+scullery kermit plan [--spec=input.yaml] region_project-name
+scullery kermit apply [--spec=input.yaml] [--output=info.yaml] region_project-name
+```
+
+`plan` reads the IAM state in bulk (users, groups, roles, the role
+assignments of the project and the members of its groups) and lists
+what is missing (`+`) and what is extra (`-`).  `apply` performs only
+those changes, using the same concurrent steps as `setup`.  Extra
+items are those carrying the scullery signature of the project (see
+{py:obj}`scullery.usergroup.ownership_index`) but not in the spec,
+and grants or memberships of the spec groups not in the spec.  The
+output of `apply` only has the credentials of the users it created.
+
+## verify
 
-To delete a project:
+To check that the users written to an output file can log in:
 
 ```bash
-scullery kermit del region_project-name [--force] [--execute]
+scullery kermit verify info.yaml [--workers=8] [--rate=5]
 ```
-This will delete all the set-up done by the `setup` option.
 
-This recipe will use the Resource Management service to check
-if there are no active resources associated with the project.
-If there are it will stop unless the `--force` option is used.
+Every user of the file (YAML or CSV output) requests a token, which
+is revoked right away.  Log-ins run concurrently, sharing the session
+connection pool, and at most `--rate` are started per second.  A
+table with the result of every user is written to standard output;
+the exit status is 1 if any log-in failed.  Users whose password was
+written as `*redacted*` are reported as `unknown`.
 
-By default, it will simply show on the screen the actions that
-will be implemented.  Use the `--execute` command to actually
-perform changes to the cloud.
+## delete
+
+Kermit does not delete projects.  Use the project recipe instead:
+
+```bash
+scullery project del region_project-name [--force] [--wait]
+```
+
+It deletes the users, groups and roles carrying the scullery
+signature of the project, then the project.  It stops if the project
+has active resources, unless `--force` is used.
 
 ***
 '''
 
 import argparse
+import csv
+import datetime
+import getpass
+import hashlib
+import json
 import os
 import sys
+import time
 import yaml
 
 try:
@@ -114,82 +178,217 @@ try:
 except ImportError:  # Graceful fallback if IceCream isn't installed.
   ic = lambda *a: None if not a else (a[0] if len(a) == 1 else a)  # noqa
 
+from scullery import api
 from scullery import cloud
+from scullery import dag
 from scullery import parsers
+from scullery import ratelimit
 from scullery import usergroup
 
-def kermit(args:argparse.Namespace):
+KERMIT_WORKERS = 8
+'''Default number of set-up tasks running at the same time'''
+VERIFY_RATE = 5.0
+'''Default log-ins per second of `kermit verify`'''
+
+def setup_graph(cc, project:str, spec:dict, desc:str,
+                g:dag.Graph|None = None, prefix:str = '') -> tuple[dag.Graph,dict[str,str]]:
+  '''Compile a kermit spec into a dependency graph
+
+  :param cc: API session
+  :param project: project name (`region_name`)
+  :param spec: decoded spec
+  :param desc: project description
+  :param g: graph to add the steps to (a new graph if None)
+  :param prefix: prefix of the step names of this project
+  :returns: tuple with the graph and the password of every user
+
+  Tasks: `region:` and `domain` look-ups, then `project`, then
+  `role:`, `group:` and `grant:` per group; `user:` after its group,
+  then `member:` for the membership.  Groups used by users but not
+  defined in the spec are looked up by a `group:` task, roles not
+  defined in the spec by a `role-id:` task.
+
+  The look-up steps `domain`, `region:` and `role-id:` are not
+  prefixed, so several projects added to the same graph share them.
+  '''
+  if g is None: g = dag.Graph()
+  k = lambda name: prefix + name
+  region, _ = project.split('_',1)
+  if not f'region:{region}' in g.nodes:
+    def get_region(r:dict) -> dict:
+      q = cc.iam.projects(name = region)
+      if len(q) != 1: raise KeyError(region)
+      return q[0]
+    g.add(f'region:{region}', get_region)
+  if not 'domain' in g.nodes:
+    g.add('domain', lambda r: cc.iam.domain())
+
+  def new_project(r:dict) -> str:
+    prj_id = cc.iam.new_project(project, r[f'region:{region}']['id'], desc)
+    sys.stderr.write(f'New project {project}: {prj_id}\n')
+    return prj_id
+  g.add(k('project'), new_project, [f'region:{region}'])
+
+  roles = spec.get('roles') or {}
+  for role, perms in roles.items():
+    def new_role(r:dict, role = role, perms = perms) -> dict:
+      rec = usergroup.add_role(cc, role, policy = perms, project = project)
+      sys.stderr.write(f'New role {role}: {rec["id"]}\n')
+      return rec
+    g.add(k(f'role:{role}'), new_role, [k('project')])
+
+  groups = spec.get('groups') or {}
+  for group, role in groups.items():
+    def new_group(r:dict, group = group) -> str:
+      grp_id = usergroup.add_group(cc, group, project = project)
+      sys.stderr.write(f'New group {group}: {grp_id}\n')
+      return grp_id
+    g.add(k(f'group:{group}'), new_group, [k('project')])
+
+    if role in roles:
+      role_step = k(f'role:{role}')
+    else:
+      role_step = f'role-id:{role}'
+      if not role_step in g.nodes:
+        g.add(role_step, lambda r, role = role: cc.iam.get_role(role))
+    def grant(r:dict, group = group, role = role, role_step = role_step) -> None:
+      cc.iam.grant_project_group_perms(r[k('project')], r[k(f'group:{group}')], r[role_step]['id'])
+      sys.stderr.write(f'Granted {role} on {project} to {group}\n')
+    g.add(k(f'grant:{group}'), grant, [k('project'), k(f'group:{group}'), role_step])
+
+  creds = dict(spec.get('creds') or {})
+  users = spec.get('users') or {}
+  for user, group in users.items():
+    if user not in creds: creds[user] = cc.iam.gen_user_password()
+    if not k(f'group:{group}') in g.nodes:
+      def get_group(r:dict, group = group) -> str:
+        q = cc.iam.groups(group)
+        if len(q) != 1: raise KeyError(group)
+        return q[0]['id']
+      g.add(k(f'group:{group}'), get_group)
+
+    def new_user(r:dict, user = user) -> str:
+      new_user, _ = usergroup.user_record(cc, r['domain'], user, creds[user], project = project)
+      usr_id = cc.iam.new_user(**new_user)
+      sys.stderr.write(f'New user {user}: {usr_id}\n')
+      return usr_id
+    g.add(k(f'user:{user}'), new_user, ['domain', k(f'group:{group}')])
+    g.add(k(f'member:{user}'),
+          lambda r, user = user, group = group: cc.iam.add_group_user(r[k(f'group:{group}')], r[k(f'user:{user}')]),
+          [k(f'user:{user}'), k(f'group:{group}')])
+
+  return g, creds
+
+REDACTED = '*redacted*'
+'''Password written for users whose generated password is not known any more'''
+
+def read_journal(path:str, project:str, spec_hash:str) -> dict[str,object]:
+  '''Read the steps recorded in a kermit journal
+
+  :param path: journal file
+  :param project: project being set-up
+  :param spec_hash: SHA-256 of the spec being used
+  :returns: dictionary step : result
+  :raises ValueError: if the journal belongs to another project
+
+  A truncated last line (e.g. from an interrupted run) is ignored.
+  '''
+  done = dict()
+  with open(path) as fp:
+    for line in fp:
+      try:
+        rec = json.loads(line)
+      except ValueError:
+        continue
+      if 'kermit' in rec:
+        if rec['kermit'] != project:
+          raise ValueError(f'{path}: journal of project {rec["kermit"]}, not {project}')
+        if rec.get('spec') != spec_hash:
+          sys.stderr.write(f'{path}: Warning: spec changed since the journal was written\n')
+      elif 'step' in rec:
+        done[rec['step']] = rec.get('result')
+  return done
+
+PROJECT_MARK = 'KERMIT0PROJECT0MARK'
+'''Stands for `{project}` while the spec template is parsed'''
+DESCRIPTION_MARK = 'KERMIT0DESCRIPTION0MARK'
+'''Stands for `{description}` while the spec template is parsed'''
+
+def load_spec(args:argparse.Namespace) -> tuple[str,object]:
+  '''INTERNAL: read and parse the spec template of a kermit command line
+
+  :returns: tuple with the template text and the parsed template
+
+  The template is parsed once; {py:obj}`scullery.rcp_kermit.render`
+  then fills in each project.
+  '''
   if args.desc is None:
-    args.desc = f'-- kermit-project created by {os.getlogin()} using scullery'
+    args.desc = f'-- kermit-project created by {getpass.getuser()} using scullery'
   else:
-    args.desc = f'-- kermit-project created by {os.getlogin()} using scullery|{args.desc}'
+    args.desc = f'-- kermit-project created by {getpass.getuser()} using scullery|{args.desc}'
   if args.spec is None:
     root,_ = os.path.splitext(__file__)
     args.spec = open(root+'.yaml','r')
 
-  ytxt = args.spec.read().format(project = args.project,
-                                  description = args.desc)
-  spec = yaml.safe_load(ytxt)
-
-  if '_' not in args.project:
-    raise ValueError(f'Project name {args.project} does not have a region')
-
-  cc = cloud()
-  region, _ = args.project.split('_',1)
-  q = cc.iam.projects(name = region)
-  if len(q) != 1: raise KeyError(region)
-  regdat = q[0]
-
-  ############################# TESTING ##########################
-  prj_id = cc.iam.new_project(args.project, regdat['id'], args.desc)
-  sys.stderr.write(f'New project id: {prj_id}\n')
-  # ~ q = cc.iam.projects(name = args.project)
-  # ~ prj_id = q[0]['id']
-  # ~ sys.stderr.write(f'Existing project id: {prj_id}\n')
-
-  role_rec = dict()
-  if 'roles' in spec:
-    for role,perms in spec['roles'].items():
-      role_rec[role] = usergroup.add_role(cc, role,
-                              policy = perms, project = args.project)
-      sys.stderr.write(f'New role {role}: {role_rec[role]["id"]}\n')
-
-  group_ids = dict()
-  if 'groups' in spec:
-    for group, role in spec['groups'].items():
-      group_ids[group] = usergroup.add_group(cc, group,
-                                            project = args.project)
-      sys.stderr.write(f'New group {group}: {group_ids[group]}\n')
-      if role in role_rec:
-        role_id = role_rec[role]['id']
-      else:
-        q = cc.iam.get_role(role)
-        role_id = q['id']
-
-      cc.iam.grant_project_group_perms(prj_id, group_ids[group], role_id)
-      sys.stderr.write(f'Granted {role} on project to {group}\n')
-
-  creds = spec['creds'] if 'creds' in spec else dict()
-  user_rec = dict()
-
+  text = args.spec.read()
+  template = yaml.safe_load(text.format(project = PROJECT_MARK,
+                                        description = DESCRIPTION_MARK))
+  return text, template
+
+def render(template, project:str, desc:str):
+  '''Fill in a parsed spec template for a project
+
+  :param template: parsed template from {py:obj}`scullery.rcp_kermit.load_spec`
+  :param project: project name
+  :param desc: project description
+  :returns: the spec of the project
+  :raises ValueError: if the project name has no region
+  '''
+  if '_' not in project:
+    raise ValueError(f'Project name {project} does not have a region')
+  if isinstance(template, str):
+    return template.replace(PROJECT_MARK, project).replace(DESCRIPTION_MARK, desc)
+  if isinstance(template, dict):
+    return { render(key, project, desc): render(value, project, desc) for key, value in template.items() }
+  if isinstance(template, list):
+    return [ render(value, project, desc) for value in template ]
+  return template
+
+def project_names(args:argparse.Namespace) -> list[str]:
+  '''INTERNAL: projects named on the command line and in `--projects-file`'''
+  names = list(args.project)
+  if args.projects_file is not None:
+    for line in args.projects_file:
+      line = line.split('#',1)[0].strip()
+      if line: names.append(line)
+  if not names: raise ValueError('No project specified')
+  return list(dict.fromkeys(names))
+
+def write_output(cc, args:argparse.Namespace, graph:dag.Graph,
+                  setups:list[tuple[str,dict,dict[str,str],str]], earlier:bool = True) -> None:
+  '''INTERNAL: write the credentials of the users set-up
+
+  :param setups: list of (project, spec, passwords, step prefix) tuples
+  :param earlier: include users created by an earlier run (password redacted)
+  '''
   output_data = list()
-
-  if 'users' in spec:
-    for user, group in spec['users'].items():
-      if user not in creds:
-        creds[user] = cc.iam.gen_user_password()
-      user_rec[user] = usergroup.add_user(cc,
-                              name = user,
-                              passwd = creds[user],
-                              project = args.project,
-                              groups = [ group ])
-      sys.stderr.write(f'New user {user}: {user_rec[user]["id"]}\n')
-
+  redacted = 0
+  for project, spec, creds, prefix in setups:
+    for user in (spec.get('users') or {}):
+      node = graph.nodes[f'{prefix}user:{user}']
+      if node.state != dag.STATE.DONE: continue
+      passwd = creds[user]
+      if node.start is None:
+        if not earlier: continue
+        if user not in (spec.get('creds') or {}):
+          # Created by an earlier run: the journal does not keep generated passwords
+          passwd = REDACTED
+          redacted += 1
       output_data.append({
         'ii': len(output_data),
         'user': user,
-        'passwd': creds[user],
-        'project': args.project,
+        'passwd': passwd,
+        'project': project,
         'domain': cc.domain_name,
       })
 
@@ -209,31 +408,380 @@ def kermit(args:argparse.Namespace):
     template = '{ii}, {domain}, {project}, {user}, {passwd}\n'
 
   for dat in output_data:
+    if args.output.name.endswith('.yaml'):
+      # Quoted, so any password (e.g. *redacted*) reads back as written
+      dat = dict(dat, passwd = json.dumps(dat['passwd']))
     args.output.write(template.format(**dat))
 
+  if redacted:
+    sys.stderr.write(f'Passwords of {redacted} users created earlier are in the output of that run\n')
 
-def parser(subp):
-  pr = subp.add_parser('kermit',
-                        help = 'Kermit recipe',
-                        aliases = ['ker','kk'])
-  pr.set_defaults(recipe_cb = kermit)
-  pr.add_argument('project',
-                  help = 'Project name')
-  pr.add_argument('-d','--description','--desc', dest = 'desc',
+def check_failed(graph:dag.Graph) -> None:
+  '''INTERNAL: report failed steps and exit with status 1 if any'''
+  if graph.failed:
+    for node in graph.failed:
+      sys.stderr.write(f'{node.name}: {node.error}\n')
+    sys.exit(1)
+
+def kermit(args:argparse.Namespace):
+  projects = project_names(args)
+  text, template = load_spec(args)
+  specs = { project: render(template, project, args.desc) for project in projects }
+  cc = cloud()
+  graph = dag.Graph()
+  setups = []
+  for project, spec in specs.items():
+    prefix = f'{project}/' if len(specs) > 1 else ''
+    _, creds = setup_graph(cc, project, spec, args.desc, graph, prefix)
+    setups.append((project, spec, creds, prefix))
+
+  run_name = ','.join(projects)
+  spec_hash = hashlib.sha256(text.encode()).hexdigest()
+  done = dict()
+  if args.resume is not None:
+    done = read_journal(args.resume, run_name, spec_hash)
+    sys.stderr.write(f'{args.resume}: resuming, {len([s for s in done if s in graph.nodes])} of {len(graph.nodes)} steps already done\n')
+  journal = args.journal or args.resume
+  jfp = None
+  if journal is not None:
+    jfp = open(journal, 'a')
+    jfp.write(json.dumps({
+      'kermit': run_name,
+      'spec': spec_hash,
+      'started': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec = 'seconds'),
+    }) + '\n')
+    jfp.flush()
+  def record(node:dag.Node) -> None:
+    jfp.write(json.dumps({ 'step': node.name, 'result': node.result, 'time': round(node.duration, 3) }) + '\n')
+    jfp.flush()
+
+  try:
+    graph.run(args.workers, done, None if jfp is None else record)
+  finally:
+    if jfp is not None: jfp.close()
+  graph.report()
+  write_output(cc, args, graph, setups)
+  check_failed(graph)
+
+class Plan:
+  '''Differences between a kermit spec and the cloud'''
+  def __init__(self, project:str) -> None:
+    '''Constructor
+
+    :param project: project name
+    '''
+    self.project = project
+    self.done = dict()
+    '''Results of the set-up steps already in place, by step name'''
+    self.changes = list()
+    '''List of (`+`, `-` or `!`, description) tuples'''
+    self.removals = list()
+    '''List of (step name, function, dependencies) tuples deleting extra items'''
+    self.unchanged = 0
+    '''Number of items already as specified'''
+
+  def add(self, op:str, text:str) -> None:
+    '''INTERNAL: record a change'''
+    self.changes.append((op, text))
+
+  def remove(self, step:str, text:str, fn, deps:list[str]|None = None) -> None:
+    '''INTERNAL: record a deletion'''
+    self.add('-', text)
+    self.removals.append((step, fn, deps or []))
+
+  def show(self, fp = None) -> None:
+    '''Write the plan
+
+    :param fp: stream to write to (default `sys.stdout`)
+    '''
+    if fp is None: fp = sys.stdout
+    for op, text in self.changes:
+      fp.write(f'{op} {text}\n')
+    add = sum(1 for op, _ in self.changes if op == '+')
+    rm = sum(1 for op, _ in self.changes if op == '-')
+    err = sum(1 for op, _ in self.changes if op == '!')
+    fp.write(f'{self.project}: {add} to create, {rm} to delete, {self.unchanged} unchanged')
+    fp.write(f', {err} errors\n' if err else '\n')
+
+def plan_changes(cc, project:str, spec:dict) -> Plan:
+  '''Compare a kermit spec with the cloud
+
+  :param cc: API session
+  :param project: project name
+  :param spec: decoded spec
+  :returns: the plan
+  :raises RuntimeError: on API errors
+
+  The state is read in bulk: one listing of users, groups, custom
+  and system roles and the project, then the role assignments of the
+  project and the members of its groups.  Items are matched by name
+  (roles also by display name, as {py:obj}`scullery.iam.Iam.resolve`).
+  Users, groups and custom roles carrying the scullery signature of
+  the project but missing from the spec are deleted, as are grants
+  and memberships of the spec groups that the spec does not list
+  (memberships only for users owned by the project).  The policy of
+  existing roles is not compared.
+  '''
+  listings = cc.map(lambda fn: fn(), [cc.iam.users, cc.iam.groups, cc.iam.custom_roles,
+                                      cc.iam.system_roles, lambda: cc.iam.projects(project)])
+  for res in listings:
+    if isinstance(res, Exception): raise res
+  users, groups, custom_roles, system_roles, prjs = listings
+  owned = usergroup.ownership_index(cc, listings[:3]).get(project, { k: [] for k in usergroup.OWNED_KINDS })
+  user_ids = { u['name']: u['id'] for u in users }
+  group_ids = { g['name']: g['id'] for g in groups }
+  group_names = { g['id']: g['name'] for g in groups }
+  keys = api.iam.Iam.NAME_KEYS['roles']
+  all_roles = api.iam.Index(custom_roles + system_roles, keys)
+  custom = api.iam.Index(custom_roles, keys)
+
+  spec_roles = spec.get('roles') or {}
+  spec_groups = spec.get('groups') or {}
+  spec_users = spec.get('users') or {}
+  p = Plan(project)
+
+  prj_id = prjs[0]['id'] if len(prjs) == 1 else None
+  if prj_id is None:
+    p.add('+', f'project {project}')
+  else:
+    p.done['project'] = prj_id
+    p.done[f'region:{project.split("_",1)[0]}'] = None # Only needed to create the project
+    p.unchanged += 1
+
+  for role in spec_roles:
+    rec = custom.get(role)
+    if rec is None:
+      p.add('+', f'role {role}')
+    else:
+      p.done[f'role:{role}'] = rec
+      p.unchanged += 1
+
+  for group in list(spec_groups) + [ g for g in spec_users.values() if not g in spec_groups ]:
+    if group in group_ids:
+      p.done[f'group:{group}'] = group_ids[group]
+      if group in spec_groups: p.unchanged += 1
+    elif group in spec_groups:
+      p.add('+', f'group {group}')
+    else:
+      p.add('!', f'group {group} not found')
+
+  # Grants and memberships only exist for existing projects and groups
+  managed = { group_ids[g] for g in spec_groups if g in group_ids }
+  dropped = { g['id'] for g in owned['group'] if not g['name'] in spec_groups }
+  grants = set()
+  if prj_id is not None:
+    for a in cc.iam.role_assignments(project_id = prj_id):
+      if 'group' in a: grants.add((a['group']['id'], a['role']['id']))
+  members = set()
+  gids = sorted({ group_ids[g] for g in spec_users.values() if g in group_ids } | managed)
+  for gid, res in zip(gids, cc.map(cc.iam.group_users, gids)):
+    if isinstance(res, Exception): raise res
+    members |= { (u['id'], gid) for u in res }
+
+  wanted = set()
+  for group, role in spec_groups.items():
+    rec = custom.get(role) if role in spec_roles else all_roles.get(role)
+    if rec is None and not role in spec_roles:
+      p.add('!', f'role {role} not found')
+    elif not role in spec_roles:
+      p.done[f'role-id:{role}'] = rec
+    gid = group_ids.get(group)
+    if rec is not None and gid is not None: wanted.add((gid, rec['id']))
+    if rec is not None and (gid, rec['id']) in grants:
+      p.done[f'grant:{group}'] = None
+      p.unchanged += 1
+    else:
+      p.add('+', f'grant {role} on {project} to {group}')
+  for gid, rid in sorted(grants):
+    if not gid in managed or (gid, rid) in wanted: continue
+    role = all_roles.get(rid) or { 'display_name': rid }
+    role_name = role.get('display_name') or role.get('name')
+    p.remove(f'revoke:{group_names[gid]}:{role_name}', f'grant {role_name} on {project} to {group_names[gid]}',
+              lambda r, gid = gid, rid = rid: cc.iam.revoke_project_group_perms(r['project'], gid, rid))
+
+  owned_users = { u['id'] for u in owned['user'] }
+  for user, group in spec_users.items():
+    uid = user_ids.get(user)
+    if uid is None:
+      p.add('+', f'user {user}')
+    else:
+      p.done[f'user:{user}'] = uid
+      p.unchanged += 1
+    if uid is not None and (uid, group_ids.get(group)) in members:
+      p.done[f'member:{user}'] = None
+      p.unchanged += 1
+    else:
+      p.add('+', f'member {user} of {group}')
+  if all(f'user:{user}' in p.done for user in spec_users): p.done['domain'] = None
+  wanted = { (user_ids.get(u), group_ids.get(g)) for u, g in spec_users.items() }
+  for uid, gid in sorted(members):
+    if not gid in managed or not uid in owned_users or (uid, gid) in wanted: continue
+    user = next(u['name'] for u in owned['user'] if u['id'] == uid)
+    if not user in spec_users: continue # Deleted below
+    p.remove(f'unmember:{user}:{group_names[gid]}', f'member {user} of {group_names[gid]}',
+              lambda r, uid = uid, gid = gid: cc.iam.del_group_user(gid, uid))
+
+  for u in owned['user']:
+    if not u['name'] in spec_users:
+      p.remove(f'del-user:{u["name"]}', f'user {u["name"]}', lambda r, uid = u['id']: cc.iam.del_user(uid))
+  for g in owned['group']:
+    if g['id'] in dropped:
+      p.remove(f'del-group:{g["name"]}', f'group {g["name"]}', lambda r, gid = g['id']: cc.iam.del_group(gid))
+  deps = [ step for step, _, _ in p.removals if step.startswith(('revoke:', 'del-group:')) ]
+  for role in owned['role']:
+    name = role.get('display_name') or role['name']
+    if not name in spec_roles:
+      p.remove(f'del-role:{name}', f'role {name}', lambda r, rid = role['id']: cc.iam.del_role(rid), deps)
+  return p
+
+def kermit_plan(args:argparse.Namespace):
+  _, template = load_spec(args)
+  spec = render(template, args.project, args.desc)
+  cc = cloud()
+  plan_changes(cc, args.project, spec).show()
+
+def kermit_apply(args:argparse.Namespace):
+  _, template = load_spec(args)
+  spec = render(template, args.project, args.desc)
+  cc = cloud()
+  p = plan_changes(cc, args.project, spec)
+  p.show(sys.stderr)
+  if any(op == '!' for op, _ in p.changes): sys.exit(1)
+
+  graph, creds = setup_graph(cc, args.project, spec, args.desc)
+  for step, fn, deps in p.removals:
+    graph.add(step, fn, ['project'] + deps)
+  if len([ n for n in graph.nodes if not n in p.done ]) == 0:
+    sys.stderr.write(f'{args.project}: nothing to do\n')
+    return
+  graph.run(args.workers, p.done)
+  graph.report()
+  write_output(cc, args, graph, [(args.project, spec, creds, '')], earlier = False)
+  check_failed(graph)
+
+def read_clouds(fp) -> list[tuple[str,dict[str,str]]]:
+  '''INTERNAL: read the credentials written by `setup` or `apply`
+
+  :param fp: YAML (`clouds:`) or CSV output file
+  :returns: list of (entry name, credentials) tuples
+  '''
+  text = fp.read()
+  keys = (api.CRSTR.USER_DOMAIN_NAME, api.CRSTR.PROJECT_NAME, api.CRSTR.USERNAME, api.CRSTR.PASSWORD)
+  entries = []
+  if text.lstrip().startswith(api.CRSTR.CLOUDS):
+    for name, cfg in ((yaml.safe_load(text) or {}).get(api.CRSTR.CLOUDS) or {}).items():
+      auth = cfg.get(api.CRSTR.AUTH) or {}
+      entries.append((name, { k: str(auth.get(k, '')) for k in keys }))
+  else:
+    for row in csv.reader(text.splitlines(), skipinitialspace = True):
+      if not row or row[0].startswith('#'): continue
+      if len(row) != len(keys) + 1: raise ValueError(f'{fp.name}: invalid line: {",".join(row[:1])}...')
+      entries.append((row[0], dict(zip(keys, row[1:]))))
+  return entries
+
+def kermit_verify(args:argparse.Namespace):
+  entries = read_clouds(args.file)
+  cc = cloud()
+  bucket = ratelimit.TokenBucket(args.rate)
+
+  def login(entry:tuple[str,dict[str,str]]) -> float|None:
+    _, creds = entry
+    if creds[api.CRSTR.PASSWORD] == REDACTED: return None
+    time.sleep(bucket.reserve())
+    start = time.perf_counter()
+    cc.check_creds(creds)
+    return time.perf_counter() - start
+
+  t0 = time.perf_counter()
+  results = cc.map(login, entries, args.workers)
+  elapsed = time.perf_counter() - t0
+
+  counts = { 'ok': 0, 'failed': 0, 'unknown': 0 }
+  rows = []
+  for (name, creds), res in zip(entries, results):
+    if isinstance(res, Exception):
+      state, detail = 'failed', str(res).splitlines()[0] if str(res) else type(res).__name__
+    elif res is None:
+      state, detail = 'unknown', 'password not in this file'
+    else:
+      state, detail = 'ok', f'{res:.2f}s'
+    counts[state] += 1
+    rows.append((name, creds[api.CRSTR.PROJECT_NAME], creds[api.CRSTR.USERNAME], state, detail))
+
+  widths = [ max([len(h)] + [len(r[i]) for r in rows]) for i, h in enumerate(('entry', 'project', 'user')) ]
+  sys.stdout.write(f'{"entry":{widths[0]}} {"project":{widths[1]}} {"user":{widths[2]}} result\n')
+  for name, project, user, state, detail in rows:
+    sys.stdout.write(f'{name:{widths[0]}} {project:{widths[1]}} {user:{widths[2]}} {state} {detail}\n')
+  sys.stderr.write(f'{len(rows)} users in {elapsed:.2f}s: {counts["ok"]} ok, {counts["failed"]} failed, {counts["unknown"]} unknown\n')
+  if counts['failed']: sys.exit(1)
+
+def spec_options(pp, many:bool = False) -> None:
+  '''INTERNAL: add the options common to kermit commands'''
+  if many:
+    pp.add_argument('project',
+                    nargs = '*',
+                    help = 'Project names')
+    pp.add_argument('-P','--projects-file',
+                    type = argparse.FileType('r'), default = None,
+                    help = 'File with more project names, one per line')
+  else:
+    pp.add_argument('project',
+                    help = 'Project name')
+  pp.add_argument('-d','--description','--desc', dest = 'desc',
                   help = 'Project description')
-  pr.add_argument('-s','--spec',
+  pp.add_argument('-s','--spec',
                   type = argparse.FileType('r'), default = None,
                   help = 'Spec file')
-  pr.add_argument('-o','--output',
+
+def parser(subp):
+  pr = subp.add_parser('kermit',
+                        help = 'Kermit recipe',
+                        aliases = ['ker','kk'],
+                        default_op = 'setup')
+  ksp = pr.add_subparsers(title = 'op',
+                          description = 'Operation',
+                          required = True,
+                          help = 'Operation')
+
+  pp = ksp.add_parser('setup',
+                      help = 'Set-up a project from a spec',
+                      aliases = ['new', 'create'])
+  spec_options(pp, many = True)
+  pp.add_argument('-o','--output',
                   type = argparse.FileType('x'), default = sys.stdout,
                   help = 'Output file')
+  pp.add_argument('-J','--journal',
+                  help = 'Append completed steps to this journal file')
+  pp.add_argument('--resume', metavar = 'JOURNAL',
+                  help = 'Skip the steps recorded in this journal, then keep appending to it')
+  pp.add_argument('-w','--workers', type = int, default = KERMIT_WORKERS,
+                  help = f'Set-up tasks running at the same time (default {KERMIT_WORKERS})')
+  pp.set_defaults(recipe_cb = kermit)
+
+  pp = ksp.add_parser('plan',
+                      help = 'Show the changes needed to match a spec')
+  spec_options(pp)
+  pp.set_defaults(recipe_cb = kermit_plan)
+
+  pp = ksp.add_parser('apply',
+                      help = 'Make a project match a spec')
+  spec_options(pp)
+  pp.add_argument('-o','--output',
+                  type = argparse.FileType('x'), default = sys.stdout,
+                  help = 'Output file (credentials of the users created)')
+  pp.add_argument('-w','--workers', type = int, default = KERMIT_WORKERS,
+                  help = f'Tasks running at the same time (default {KERMIT_WORKERS})')
+  pp.set_defaults(recipe_cb = kermit_apply)
+
+  pp = ksp.add_parser('verify',
+                      help = 'Check that the users of a set-up output can log in')
+  pp.add_argument('file',
+                  type = argparse.FileType('r'),
+                  help = 'Output of setup or apply (YAML or CSV)')
+  pp.add_argument('-w','--workers', type = int, default = KERMIT_WORKERS,
+                  help = f'Log-ins running at the same time (default {KERMIT_WORKERS})')
+  pp.add_argument('--rate', type = ratelimit.positive_rate, default = VERIFY_RATE,
+                  help = f'Log-ins per second (default {VERIFY_RATE:g})')
+  pp.set_defaults(recipe_cb = kermit_verify)
 
 parsers.register_parser('kermit',parser)
-
-
-
-
-
-
-
-
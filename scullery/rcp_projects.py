@@ -20,6 +20,14 @@ Get details of a project
 scullery prj get region_projectname
 ```
 
+## project permission matrix
+
+Export every project, group and role grant for audits
+
+```bash
+scullery prj matrix [--format csv|json] [-o file] [region_projectname ...]
+```
+
 ## add project
 
 Create a new project
@@ -42,6 +50,33 @@ This recipe will check using Resource Management that no
 active resources are assigned to this project.  Use `--force`
 to ignore.
 
+With `--wait`, the recipe waits until the projects are gone (see
+`prj wait` below).
+
+Users, groups and custom roles created by scullery for the project
+(see {py:obj}`scullery.usergroup.ownership_index`) are deleted too.
+Several projects can be given; the directory is scanned once and all
+deletions run concurrently, followed by a summary.
+
+## wait for project deletion
+
+```bash
+scullery prj wait [options] region_projectname ...
+```
+
+Polls the status of all projects in a single loop until they are
+gone.  Each project is polled with exponential backoff and all polls
+share one request budget.
+
+Options (also accepted by `prj del --wait`):
+
+- `--timeout=secs` : give up after this many seconds (default 3600)
+- `--interval=secs` : delay before the first poll of a project (default 30)
+- `--max-interval=secs` : maximum delay between polls of a project (default 300)
+- `--poll-rate=n` : status queries per second for all projects (default 2)
+
+Exits with status 1 if some projects are still pending.
+
 ## grant permissions on project
 
 Grants a role to a group on a project
@@ -60,9 +95,9 @@ scullery prj revoke rolename on region_projectname from groupname
 ***
 '''
 import argparse
+import csv
+import getpass
 import json
-import os
-import re
 import sys
 
 try:
@@ -72,13 +107,14 @@ except ImportError:  # Graceful fallback if IceCream isn't installed.
 
 from scullery import cloud
 from scullery import parsers
-
-RE_PRJSIG = re.compile(r'^-- \S+ created by \S+ using scullery -- project:(\S+)($|\|)')
+from scullery import ratelimit
+from scullery import usergroup
+from scullery import waiter
 
 def add_prj(args:argparse.Namespace):
   cc = cloud()
 
-  desc = f'-- Project created by {os.getlogin()} using scullery'
+  desc = f'-- Project created by {getpass.getuser()} using scullery'
   if args.description is not None:
     desc += f'|{args.description}'
 
@@ -94,84 +130,175 @@ def add_prj(args:argparse.Namespace):
   sys.stderr.write(f'Project ID={newid}\n')
 
 def list_prj(args:argparse.Namespace):
-  cc = cloud()
-  for p in cc.iam.projects():
-    details = cc.iam.get_project_details(p['id'])
+  cc = cloud(snapshot = True)
+  for details in cc.map(lambda p: cc.iam.get_project_details(p['id']), cc.iam.projects()):
+    if isinstance(details, Exception):
+      sys.stderr.write(f'Error: {details}\n')
+      continue
     print('{id} {name:22} {status:8} {description}'.format(**details))
       # ~ print(json.dumps(details, indent=2))
 
+def role_name(cc, role_id:str) -> str:
+  '''INTERNAL: display name of a role, or its ID if unknown'''
+  role = cc.iam.index('roles').get(role_id)
+  if role is None: return role_id
+  return role.get('display_name') or role['name']
+
 def get_prj(args:argparse.Namespace):
-  cc = cloud()
+  cc = cloud(snapshot = True)
   grps = cc.iam.groups()
   for prj_name in args.project:
-    prjlst = cc.iam.projects(name=args.project)
+    prjlst = cc.iam.projects(name=prj_name)
     for prj in prjlst:
       details = cc.iam.get_project_details(prj['id'])
       print('id:        {id}\n  name:    {name}\n  desc:    {description}\n  enabled: {enabled}\n  status:  {status}'.format(**details))
-      roles = {}
-      for g in grps:
-        gr = cc.iam.get_project_group_perms(prj['id'], g['id'])
-        if len(gr) > 0:
-          roles[g['id']] = [ g['name'] ]
-          q = ''
-          rstr = ''
-          for r in gr:
-            rstr += q + r['display_name']
-            q = ', '
-          roles[g['id']].append(rstr)
+      grants = {}
+      for a in cc.iam.role_assignments(project_id = prj['id']):
+        if not 'group' in a: continue
+        grants.setdefault(a['group']['id'], []).append(role_name(cc, a['role']['id']))
+      roles = [ (g['name'], ', '.join(grants[g['id']])) for g in grps if g['id'] in grants ]
       if len(roles) > 0:
         print('  roles per group')
-        for role in roles.values():
+        for role in roles:
           print('    {0}: {1}'.format(*role))
 
+MATRIX_FIELDS = ('project_id', 'project', 'group_id', 'group', 'role_id', 'role')
+'''Columns of the project permission matrix'''
+
+def prj_matrix(args:argparse.Namespace):
+  cc = cloud(snapshot = True)
+  projects = { p['id']: p for p in cc.iam.projects() }
+  groups = { g['id']: g for g in cc.iam.groups() }
+  if args.project:
+    wanted = [ p for p in projects.values() if p['name'] in args.project ]
+    for name in set(args.project) - { p['name'] for p in wanted }:
+      sys.stderr.write(f'{name}: Project not found\n')
+    assignments = []
+    for prj, res in zip(wanted, cc.map(lambda p: cc.iam.role_assignments(project_id = p['id']), wanted)):
+      if isinstance(res, Exception): raise res
+      assignments += res
+  else:
+    assignments = cc.iam.role_assignments()
+
+  rows = []
+  for a in assignments:
+    if not 'group' in a or not 'project' in a['scope']: continue
+    prj_id, grp_id, role_id = a['scope']['project']['id'], a['group']['id'], a['role']['id']
+    rows.append({
+      'project_id': prj_id,
+      'project': projects[prj_id]['name'] if prj_id in projects else '',
+      'group_id': grp_id,
+      'group': groups[grp_id]['name'] if grp_id in groups else '',
+      'role_id': role_id,
+      'role': role_name(cc, role_id),
+    })
+  rows.sort(key = lambda r: (r['project'], r['group'], r['role']))
+
+  fp = sys.stdout if args.output is None else open(args.output, 'w', newline = '')
+  try:
+    if args.format == 'json':
+      fp.write(json.dumps(rows, indent = 2) + '\n')
+    else:
+      writer = csv.DictWriter(fp, fieldnames = MATRIX_FIELDS)
+      writer.writeheader()
+      writer.writerows(rows)
+  finally:
+    if fp is not sys.stdout: fp.close()
 
 def del_prj(args:argparse.Namespace):
   cc = cloud()
+  summary = { prjname: { 'status': 'not found' } for prjname in args.name }
+  projects = cc.iam.resolve('projects', args.name)
+
+  names = [ prjname for prjname in args.name if prjname in projects ]
+  for prjname, res in zip(names, cc.map(lambda p: list(cc.rms.resources(p)), names)):
+    if isinstance(res, Exception):
+      summary[prjname]['status'] = f'failed: {res}'
+    elif len(res) > 0:
+      sys.stderr.write(f'Warning: Project {prjname} has {len(res)} active resources\n')
+      if not args.force:
+        sys.stderr.write('Use --force option to continue regardless\n\n')
+        sys.stderr.write('Resources found:\n')
+        for rs in res:
+          sys.stderr.write('- {provider}.{type} {name}\n'.format(**rs))
+        summary[prjname]['status'] = f'skipped: {len(res)} resources'
+  names = [ prjname for prjname in names if summary[prjname]['status'] == 'not found' ]
+  if len(names) == 0: return report_del_prj(summary)
+
+  # Delete any associated users, groups and roles of all projects at once...
+  delete = { 'user': cc.iam.del_user, 'group': cc.iam.del_group, 'role': cc.iam.del_role }
+  index = usergroup.ownership_index(cc)
+  items = []
+  for prjname in names:
+    owned = index.get(projects[prjname]['name'], {})
+    summary[prjname].update({ kind: 0 for kind in usergroup.OWNED_KINDS }, errors = 0)
+    for kind in usergroup.OWNED_KINDS:
+      items += [ (prjname, kind, i) for i in owned.get(kind, []) ]
+  for (prjname, kind, item), res in zip(items, cc.map(lambda t: delete[t[1]](t[2]['id']), items)):
+    if isinstance(res, Exception):
+      sys.stderr.write(f'Error deleting {kind} {item["name"]}: {res}\n')
+      summary[prjname]['errors'] += 1
+    else:
+      sys.stderr.write(f'Deleted {kind} {item["name"]}\n')
+      summary[prjname][kind] += 1
+
+  for prjname, res in zip(names, cc.map(lambda p: cc.iam.del_project(projects[p]['id']), names)):
+    if isinstance(res, Exception):
+      summary[prjname]['status'] = f'failed: {res}'
+    else:
+      sys.stderr.write(f'Deleted {prjname} ({projects[prjname]["id"]})\n')
+      summary[prjname]['status'] = 'deleted'
+
+  if args.wait:
+    deleted = { p: projects[p] for p in names if summary[p]['status'] == 'deleted' }
+    for prjname, status in wait_prj_gone(cc, deleted, args).items():
+      summary[prjname]['status'] = 'gone' if status == waiter.STATUS.DONE else status
+  report_del_prj(summary)
+  if any(res['status'].startswith(waiter.STATUS.TIMEOUT) for res in summary.values()): sys.exit(1)
+
+def wait_prj_gone(cc, projects:dict[str,dict], args:argparse.Namespace, delay:float|None = None) -> dict[str,str]:
+  '''INTERNAL: wait until projects no longer exist
+
+  :param cc: API session
+  :param projects: dictionary name : project
+  :param args: parsed command line with the wait options
+  :param delay: seconds before the first poll (defaults to `--interval`)
+  :returns: dictionary name : {py:obj}`scullery.waiter.STATUS` value
+  '''
+  if len(projects) == 0: return {}
+  w = waiter.Waiter(lambda prj_id: cc.iam.project_status(prj_id) is None,
+                    session = cc,
+                    interval = args.interval,
+                    max_interval = args.max_interval,
+                    rate = args.poll_rate,
+                    timeout = args.timeout)
+  for prj in projects.values(): w.add(prj['id'], prj['name'], delay)
+  results = w.run()
+  return { name: results[prj['id']] for name, prj in projects.items() }
+
+def wait_prj(args:argparse.Namespace):
+  cc = cloud()
+  index = cc.iam.index('projects') # Matches names and IDs
+  projects = { prj: index.get(prj) for prj in args.name if index.get(prj) is not None }
   for prjname in args.name:
-    try:
-      prjdat = cc.iam.projects(prjname)
-      if len(prjdat) != 1: raise KeyError(prjname)
-
-      res = cc.rms.resources(prjname)
-      if len(res) > 0:
-        sys.stderr.write(f'Warning: Project {prjname} has {len(res)} active resources\n')
-        if not args.force:
-          sys.stderr.write('Use --force option to continue regardless\n\n')
-          sys.stderr.write('Resources found:\n')
-          for rs in res:
-            sys.stderr.write('- {provider}.{type} {name}\n'.format(**rs))
-          continue
-
-      # Delete any associated users...
-      for u in cc.iam.users():
-        if 'description' not in u: continue
-        if not (mv := RE_PRJSIG.search(u['description'])): continue
-        if mv.group(1) != prjname: continue
-        cc.iam.del_user(u['id'])
-        sys.stderr.write(f'Deleted user {u["name"]}\n')
-
-      # Delete any associated groups
-      for g in cc.iam.groups():
-        if 'description' not in g: continue
-        if not (mv := RE_PRJSIG.search(g['description'])): continue
-        if mv.group(1) != prjname: continue
-        cc.iam.del_group(g['id'])
-        sys.stderr.write(f'Deleted group {g["name"]}\n')
-
-      # Delete any associated roles
-      for r in cc.iam.custom_roles():
-        if 'description' not in r: continue
-        if not (mv := RE_PRJSIG.search(r['description'])): continue
-        if mv.group(1) != prjname: continue
-        cc.iam.del_role(r['id'])
-        sys.stderr.write(f'Deleted role {r["name"]}\n')
-
-      ############################# TESTING ##########################
-      # ~ sys.stderr.write(f'NOT Deleted {prjname} ({prjdat[0]["id"]})\n')
-      cc.iam.del_project(prjdat[0]['id'])
-      sys.stderr.write(f'Deleted {prjname} ({prjdat[0]["id"]})\n')
-    except KeyError:
-      sys.stderr.write(f'{prjname}: Project not found\n')
+    if not prjname in projects: sys.stderr.write(f'{prjname}: Project not found (already deleted?)\n')
+  results = wait_prj_gone(cc, projects, args, delay = 0)
+  timeouts = [ p for p, status in results.items() if status != waiter.STATUS.DONE ]
+  if timeouts:
+    sys.stderr.write(f'Still pending: {" ".join(timeouts)}\n')
+    sys.exit(1)
+
+def report_del_prj(summary:dict[str,dict]) -> None:
+  '''INTERNAL: write the outcome of a project teardown'''
+  if len(summary) < 2:
+    for prjname, res in summary.items():
+      if res['status'] == 'not found': sys.stderr.write(f'{prjname}: Project not found\n')
+    return
+  width = max(len('project'), *(len(p) for p in summary))
+  sys.stderr.write(f'\n{"project":{width}} {"users":>5} {"groups":>6} {"roles":>5} {"errors":>6}  status\n')
+  for prjname, res in summary.items():
+    counts = [ str(res.get(k, '-')) for k in ('user', 'group', 'role', 'errors') ]
+    sys.stderr.write(f'{prjname:{width}} {counts[0]:>5} {counts[1]:>6} {counts[2]:>5} {counts[3]:>6}  {res["status"]}\n')
 
 def grant_prj(args:argparse.Namespace):
   cc = cloud()
@@ -261,6 +388,17 @@ def revoke_prj(args:argparse.Namespace):
   cc.iam.revoke_project_group_perms(prj_id, grp_id, role_id)
 
 
+def wait_options(pp) -> None:
+  '''INTERNAL: add the options of recipes waiting for project deletion'''
+  pp.add_argument('--timeout', type = float, default = 3600,
+                  help = 'Seconds to wait (default 3600)')
+  pp.add_argument('--interval', type = float, default = 30,
+                  help = 'Seconds before polling a project the first time (default 30)')
+  pp.add_argument('--max-interval', type = float, default = 300,
+                  help = 'Maximum seconds between polls of a project (default 300)')
+  pp.add_argument('--poll-rate', type = ratelimit.positive_rate, default = 2,
+                  help = 'Status queries per second for all projects together (default 2)')
+
 def parser(subp):
   pr = subp.add_parser('project',
                         help = 'Project Management service',
@@ -280,6 +418,19 @@ def parser(subp):
                   nargs='+')
   pp.set_defaults(recipe_cb = get_prj)
 
+  pp = sp.add_parser('matrix',
+                  help = 'Export the project, group and role permission matrix',
+                  aliases = ['perms'])
+  pp.add_argument('-f','--format',
+                  choices = ['csv', 'json'], default = 'csv',
+                  help = 'Output format')
+  pp.add_argument('-o','--output',
+                  help = 'Output file (defaults to standard output)')
+  pp.add_argument('project',
+                  help='Projects to include (defaults to all)',
+                  nargs='*')
+  pp.set_defaults(recipe_cb = prj_matrix)
+
   pp = sp.add_parser('add',
                   help = 'Add Project',
                   aliases = ['create', 'new','a'])
@@ -295,11 +446,23 @@ def parser(subp):
   pp.add_argument('-f','--force',
                     action='store_true', default=False,
                     help = 'Force remove even if resources exists')
+  pp.add_argument('-w','--wait',
+                    action='store_true', default=False,
+                    help = 'Wait until the projects are gone')
+  wait_options(pp)
   pp.add_argument('name',
                   nargs = '+',
                   help='Project name to delete')
   pp.set_defaults(recipe_cb = del_prj)
 
+  pp = sp.add_parser('wait',
+                  help = 'Wait for project deletions to complete')
+  wait_options(pp)
+  pp.add_argument('name',
+                  nargs = '+',
+                  help='Project name (or ID) being deleted')
+  pp.set_defaults(recipe_cb = wait_prj)
+
   pp = sp.add_parser('grant',
                   help = 'Grant roles',
                   aliases = ['gr'])
@@ -91,18 +91,21 @@ def dump_roles(roles:list) -> None:
     print('{name:16} {type} {display_name:24} {description}'.format(**values))
 
 def list_cc_roles(args:argparse.Namespace):
-  cc = cloud()
+  cc = cloud(snapshot = True)
   dump_roles(cc.iam.custom_roles())
 
 def del_role(args:argparse.Namespace):
   cc = cloud()
+  # Resolve every name first: each delete drops the roles index
+  roles = cc.iam.resolve('roles', args.name)
   for r in args.name:
-    try:
-      role = cc.iam.get_role(r)
-      sys.stderr.write(f'{role}\n')
-      cc.iam.del_role(role['id'])
-    except KeyError:
-      sys.stderr.write(f'{g}: Role not found\n')
+    if not r in roles: sys.stderr.write(f'{r}: Role not found\n')
+  names = list(roles)
+  for r, res in zip(names, cc.map(lambda r: cc.iam.del_role(roles[r]['id']), names)):
+    if isinstance(res, Exception):
+      sys.stderr.write(f'{r}: {res}\n')
+    else:
+      sys.stderr.write(f'{roles[r]}\n')
 
 def add_role(args:argparse.Namespace):
   cc = cloud()
@@ -115,12 +118,12 @@ def add_role(args:argparse.Namespace):
   print(json.dumps(new_role, indent=2))
 
 def list_sys_roles(args:argparse.Namespace):
-  cc = cloud()
+  cc = cloud(snapshot = True)
   dump_roles(cc.iam.system_roles())
 
 
 def get_role(args:argparse.Namespace):
-  cc = cloud()
+  cc = cloud(snapshot = True)
   for role_name in args.role:
     role = cc.iam.get_role(role_name)
     print(json.dumps(role, indent=2))
@@ -0,0 +1,70 @@
+#
+# Daemon recipe
+#
+'''
+## Accelerator daemon
+
+Keep authenticated sessions, connection pools and a read cache warm
+in a background process:
+
+```bash
+scullery serve [--socket PATH] [--cache-ttl SECS] &
+```
+
+While the daemon is running, other `scullery` commands are forwarded
+to it over a Unix socket and their output is streamed back.  Use
+`--no-daemon` to run a command in its own process.  Commands using
+`--record` or `--replay` are never forwarded, as a cassette belongs
+to a single command.
+
+Successful `GET` responses are re-used for `--cache-ttl` seconds
+(`0` disables the cache).  Any change made through a session empties
+its cache.
+
+***
+'''
+
+import argparse
+import signal
+import sys
+
+try:
+  from icecream import ic
+except ImportError:  # Graceful fallback if IceCream isn't installed.
+  ic = lambda *a: None if not a else (a[0] if len(a) == 1 else a)  # noqa
+
+from scullery import daemon
+from scullery import parsers
+
+
+def run(args:argparse.Namespace) -> None:
+  '''Run the accelerator daemon until interrupted'''
+  from scullery import __main__ as cli
+
+  server = daemon.Server(cli.run, args.socket, args.cache_ttl, cli.session_options)
+  signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+  sys.stderr.write(f'Listening on {server.path}\n')
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    pass
+  except RuntimeError as e:
+    sys.stderr.write(f'{e}\n')
+    sys.exit(1)
+  sys.stderr.write(f'{server.requests} commands served\n')
+
+
+def parser(subp):
+  pr = subp.add_parser('serve',
+            help = 'Run the background accelerator daemon',
+            aliases = ['daemon'])
+  pr.add_argument('-s','--socket',
+                  help = 'Unix socket path',
+                  default = None)
+  pr.add_argument('-t','--cache-ttl',
+                  help = 'Seconds GET responses are re-used (0 to disable)',
+                  type = float,
+                  default = daemon.DEFAULT_CACHE_TTL)
+  pr.set_defaults(recipe_cb = run)
+
+parsers.register_parser('serve',parser)
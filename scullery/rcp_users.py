@@ -39,6 +39,33 @@ Options:
 - `--group=groupname` : Make the new user member of `groupname`.  This
   option can be used multiple times.
 
+## import
+
+Create users in bulk from a CSV or YAML file
+
+```bash
+scullery usr import [options] file
+```
+
+CSV files have a header line naming the columns `name`, `password`,
+`email`, `description`, `project` and `groups` (group names separated
+by `;`).  YAML files contain a list of mappings with the same keys
+(optionally under a `users` key); `groups` may be a list.  Only
+`name` is required.  Passwords not given are generated.
+
+Options:
+
+- `--format=csv|yaml` : Input format (guessed from the file extension)
+- `--output=file` : Results file (defaults to `file.results.csv`).
+  A line with the user id, generated password and status is
+  appended as each user is processed.
+- `--workers=N` : Users created at the same time (default 8)
+- `--rate=N` : IAM requests per second (default 10), unless
+  `--rate-limit` already limits IAM
+
+If the results file exists, the import resumes: users already
+created are skipped and failed group memberships are retried.
+
 ## del
 
 Delete user
@@ -77,9 +104,11 @@ This will remove `username` from `groupname`.
 # Users recipe
 #
 import argparse
+import csv
 import json
 
 import os
+import re
 import sys
 import yaml
 
@@ -90,6 +119,7 @@ except ImportError:  # Graceful fallback if IceCream isn't installed.
 
 from scullery import cloud
 from scullery import parsers
+from scullery import ratelimit
 from scullery import usergroup
 
 def mod_group(args:argparse.Namespace):
@@ -112,21 +142,27 @@ def mod_group(args:argparse.Namespace):
     raise KeyError(args.op)
 
 def list_users(args:argparse.Namespace):
-  cc = cloud()
+  cc = cloud(snapshot = True)
   for u in cc.iam.users():
     if 'description' not in u: u['description'] = ''
     print('{name} {description} {email}'.format(**u))
 
 def get_user(args:argparse.Namespace):
-  cc = cloud()
-  for user_name in args.user:
+  cc = cloud(snapshot = True)
+  def lookup(user_name:str):
     users = cc.iam.users(user_name)
-    if len(users) != 1:
+    if len(users) != 1: return None
+    return users[0], cc.iam.user_groups(users[0]['id'])
+
+  for user_name, res in zip(args.user, cc.map(lookup, args.user)):
+    if res is None:
       print(f'{user_name} not matched')
       continue
-    u = users[0]
+    if isinstance(res, Exception):
+      sys.stderr.write(f'{user_name}: {res}\n')
+      continue
+    u, q = res
     print(json.dumps(u,indent=2))
-    q = cc.iam.user_groups(u['id'])
     if len(q) > 0:
       print('groups:')
       for g in q:
@@ -144,16 +180,73 @@ def add_user(args:argparse.Namespace):
               groups = args.group)
   print(yaml.dump(res))
 
+def read_import(path:str, fmt:str|None = None) -> list[dict]:
+  '''INTERNAL: read the users of a bulk import file'''
+  if fmt is None:
+    fmt = 'yaml' if os.path.splitext(path)[1].lower() in ('.yaml', '.yml') else 'csv'
+  with open(path, newline = '') as fp:
+    if fmt == 'yaml':
+      data = yaml.safe_load(fp) or []
+      if isinstance(data, dict): data = data.get('users', [])
+    else:
+      data = list(csv.DictReader(fp))
+
+  entries = []
+  for row in data:
+    entry = { k: str(row[k]).strip() for k in usergroup.IMPORT_FIELDS if row.get(k) is not None }
+    groups = row.get('groups') or []
+    if isinstance(groups, str): groups = re.split(r'[;,]', groups)
+    entry['groups'] = [ str(g).strip() for g in groups if str(g).strip() ]
+    entries.append(entry)
+  return entries
+
+def read_results(path:str) -> dict[str,dict]:
+  '''INTERNAL: read the results of a previous import, last line per user wins'''
+  if not os.path.exists(path): return {}
+  with open(path, newline = '') as fp:
+    return { row['name']: row for row in csv.DictReader(fp) if row.get('name') }
+
+def import_users(args:argparse.Namespace):
+  cc = cloud()
+  entries = read_import(args.file, args.format)
+  output = args.output or args.file + '.results.csv'
+  done = read_results(output)
+  skipped = sum(1 for e in entries if done.get(e.get('name'), {}).get('status') == 'ok')
+  if done: sys.stderr.write(f'{output}: resuming, {skipped} users already created\n')
+
+  header = not os.path.exists(output) or os.path.getsize(output) == 0
+  fd = os.open(output, os.O_WRONLY|os.O_APPEND|os.O_CREAT, 0o600) # Results contain passwords
+  with os.fdopen(fd, 'a', newline = '') as fp:
+    writer = csv.DictWriter(fp, fieldnames = usergroup.RESULT_FIELDS)
+    if header: writer.writeheader()
+    def on_result(res:dict) -> None:
+      writer.writerow(res)
+      fp.flush()
+      if res['status'] == 'ok':
+        sys.stderr.write(f'Created user: {res["name"]} ({res["id"]})\n')
+      else:
+        sys.stderr.write(f'{res["name"]}: {res["error"]}\n')
+    results = usergroup.import_users(cc, entries, done, on_result, args.workers, args.rate)
+
+  failed = sum(1 for r in results if r['status'] != 'ok')
+  sys.stderr.write(f'{len(results) - failed} created, {skipped} skipped, {failed} failed; results in {output}\n')
+  if failed: sys.exit(1)
+
 def del_user(args:argparse.Namespace):
   cc = cloud()
-  for u in args.name:
-    try:
-      user = cc.iam.users(u)
-      if len(user) != 1: raise KeyError(u)
-      cc.iam.del_user(user[0]['id'])
-      sys.stderr.write(f'Removed user: {u} ({user[0]["id"]})\n')
-    except KeyError:
+  found = cc.iam.resolve('users', args.name)
+  def delete(u:str) -> str:
+    if not u in found: raise KeyError(u)
+    cc.iam.del_user(found[u]['id'])
+    return found[u]['id']
+
+  for u, res in zip(args.name, cc.map(delete, args.name)):
+    if isinstance(res, KeyError):
       sys.stderr.write(f'{u}: User not found\n')
+    elif isinstance(res, Exception):
+      sys.stderr.write(f'{u}: {res}\n')
+    else:
+      sys.stderr.write(f'Removed user: {u} ({res})\n')
 
 def set_passwd(args:argparse.Namespace):
   cc = cloud()
@@ -203,6 +296,22 @@ def parser(subp):
 
   pp.set_defaults(recipe_cb = add_user)
 
+  pp = usp.add_parser('import',
+                  help = 'Create users in bulk from a CSV or YAML file',
+                  aliases = ['bulk', 'imp'])
+  pp.add_argument('-f','--format',
+                  choices = ['csv', 'yaml'],
+                  help = 'Input format (guessed from the file extension if not specified)')
+  pp.add_argument('-o','--output',
+                  help = 'Results file (defaults to FILE.results.csv); resumes if it exists')
+  pp.add_argument('-w','--workers', type = int, default = usergroup.IMPORT_WORKERS,
+                  help = f'Users created at the same time (default {usergroup.IMPORT_WORKERS})')
+  pp.add_argument('--rate', type = ratelimit.positive_rate, default = usergroup.IMPORT_RATE,
+                  help = f'IAM requests per second (default {usergroup.IMPORT_RATE:g})')
+  pp.add_argument('file',
+                  help = 'File with the users to create')
+  pp.set_defaults(recipe_cb = import_users)
+
   pp = usp.add_parser('del',
                   help = 'Delete user',
                   aliases = ['rm', 'd','rr'])
@@ -9,26 +9,32 @@ try:
 except ImportError:  # Graceful fallback if IceCream isn't installed.
   ic = lambda *a: None if not a else (a[0] if len(a) == 1 else a)  # noqa
 
+from scullery import paginator
+
 
 class Rms:
   '''Resource management'''
   API_HOST = 'rms.{region}.otc.t-systems.com'
   '''API end-point'''
+  API_SCHEME = 'https'
+  '''API URL scheme'''
 
   def api_path(self, path):
     '''API URL'''
     host = Rms.API_HOST.format(region = self.session.region)
-    return f'https://{host}/{path}'
+    return f'{Rms.API_SCHEME}://{host}/{path}'
 
   def __init__(self, session) -> None:
     '''Constructor'''
     self.session = session
 
-  def resources(self, match:str|None = None, typestr:str|None = None) -> list:
+  def resources(self, match:str|None = None, typestr:str|None = None):
     '''List resources
 
     :param match: If specified, it will only return projects/region matching
     :param typestr: Specify a provider.type to select
+    :returns: generator yielding resources
+    :raises RuntimeError: on error
 
     See: [Resource Management](https://docs.otc.t-systems.com/resource-management-service/api-ref/apis/resource_query/querying_all_resources_under_your_account.html)
     '''
@@ -45,22 +51,12 @@ class Rms:
         params['region_id'] = match
         match = None
 
-    resources = []
-
-    while not 'marker' in params or not params['marker'] is None:
-      resp = self.session.get(self.api_path(f'v1/resource-manager/domains/{domain_id}/all-resources'), params = params)
-      if resp.status_code != 200 or not 'resources' in resp.json():
-        raise RuntimeError(resp.text)
-      q = resp.json()
-      params['marker'] = q['page_info']['next_marker']
-
-      if match is None:
-        resources.extend(q['resources'])
-      else:
-        for r in q['resources']:
-          if r['project_name'] == match: resources.append(r)
-
-    return resources
+    pages = paginator.MarkerPaginator(self.session,
+                    self.api_path(f'v1/resource-manager/domains/{domain_id}/all-resources'),
+                    'resources', params,
+                    next_marker = lambda data, items: data['page_info']['next_marker'])
+    for r in pages:
+      if match is None or r['project_name'] == match: yield r
 
 
 if __name__ == '__main__':
@@ -70,7 +66,7 @@ if __name__ == '__main__':
 
   cfg = creds.creds(cloud_name = 'otc-de-iam')
   api = api.ApiSession(cfg)
-  res = api.rms.resources()
+  res = list(api.rms.resources())
   print(json.dumps(res,indent=2))
 
   del(api)
@@ -0,0 +1,329 @@
+#!python3
+#
+# IAM directory snapshot
+#
+'''Local SQLite snapshot of the IAM directory
+
+{py:obj}`scullery.snapshot.Snapshot.sync` saves users, groups,
+memberships, projects (with their details), custom and system roles
+and group grants of a domain to a SQLite file in the configuration
+directory.  {py:obj}`scullery.snapshot.OfflineSession` answers the
+read-only {py:obj}`scullery.iam.Iam` queries from that file without
+contacting the cloud.
+
+Recipes opt-in with `cloud(snapshot = True)`; see the `--offline`
+and `--max-age` options.
+'''
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+
+from typing import Callable
+
+try:
+  from icecream import ic
+except ImportError:  # Graceful fallback if IceCream isn't installed.
+  ic = lambda *a: None if not a else (a[0] if len(a) == 1 else a)  # noqa
+
+from scullery import api
+from scullery import ratelimit
+
+SCHEMA = '''
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE users (id TEXT PRIMARY KEY, name TEXT, data TEXT);
+CREATE INDEX users_name ON users (name);
+CREATE TABLE groups (id TEXT PRIMARY KEY, name TEXT, data TEXT);
+CREATE INDEX groups_name ON groups (name);
+CREATE TABLE members (group_id TEXT, user_id TEXT, PRIMARY KEY (group_id, user_id));
+CREATE INDEX members_user ON members (user_id);
+CREATE TABLE projects (id TEXT PRIMARY KEY, name TEXT, data TEXT, details TEXT);
+CREATE INDEX projects_name ON projects (name);
+CREATE TABLE roles (id TEXT PRIMARY KEY, name TEXT, display_name TEXT, custom INTEGER, data TEXT);
+CREATE TABLE domain_grants (domain_id TEXT, group_id TEXT, role TEXT);
+CREATE INDEX domain_grants_group ON domain_grants (domain_id, group_id);
+CREATE TABLE project_grants (project_id TEXT, group_id TEXT, role TEXT);
+CREATE INDEX project_grants_group ON project_grants (project_id, group_id);
+'''
+'''Database schema: entities are kept as JSON with indexed keys'''
+
+SYNC_WORKERS = 8
+'''Default number of concurrent API calls while syncing'''
+
+def snapshot_path(cloud_name:str|None, domain_name:str) -> str:
+  '''Return the snapshot file of a cloud
+
+  :param cloud_name: cloud configuration name
+  :param domain_name: user domain name
+  :returns: path in the configuration directory
+  '''
+  name = re.sub(r'[^\w.-]', '_', f'{cloud_name or ""}-{domain_name}')
+  return os.path.join(api.tokencache.config_dir(), f'iam-{name}.sqlite')
+
+class Snapshot:
+  '''IAM directory snapshot file'''
+  def __init__(self, path:str) -> None:
+    '''Constructor
+
+    :param path: SQLite file
+    '''
+    self.path = path
+    self.db = None
+    self.lock = threading.Lock()
+
+  def query(self, sql:str, *args) -> list[tuple]:
+    '''Run a query
+
+    :param sql: SQL statement
+    :param args: statement parameters
+    :returns: list of rows
+    :raises FileNotFoundError: if the snapshot was never synced
+    '''
+    with self.lock:
+      if self.db is None:
+        if not os.path.isfile(self.path):
+          raise FileNotFoundError(f'{self.path}: no snapshot, run "cache sync"')
+        self.db = sqlite3.connect(f'file:{self.path}?mode=ro', uri = True,
+                                  check_same_thread = False)
+      return self.db.execute(sql, args).fetchall()
+
+  def entities(self, sql:str, *args) -> list[dict]:
+    '''Run a query returning JSON entities
+
+    :param sql: SQL statement selecting a single JSON column
+    :param args: statement parameters
+    :returns: list of decoded entities
+    '''
+    return [ json.loads(row[0]) for row in self.query(sql, *args) ]
+
+  def synced_at(self) -> float|None:
+    '''Return the time of the last sync (seconds since the epoch) or None'''
+    if not os.path.isfile(self.path): return None
+    rows = self.query('SELECT value FROM meta WHERE key = ?', 'synced_at')
+    return float(rows[0][0]) if rows else None
+
+  def age(self) -> float|None:
+    '''Return the seconds since the last sync or None'''
+    synced_at = self.synced_at()
+    return None if synced_at is None else time.time() - synced_at
+
+  def counts(self) -> dict[str,int]:
+    '''Return the number of rows per table'''
+    tables = ('users', 'groups', 'members', 'projects', 'roles', 'domain_grants', 'project_grants')
+    return { t: self.query(f'SELECT COUNT(*) FROM {t}')[0][0] for t in tables }
+
+  def close(self) -> None:
+    '''Close the database'''
+    with self.lock:
+      if self.db is not None: self.db.close()
+      self.db = None
+
+  def sync(self, client:api.iam.Iam, grants:bool = True, max_workers:int = SYNC_WORKERS,
+            progress:Callable[[str],None]|None = None) -> dict[str,int]:
+    '''Refresh the snapshot from the cloud
+
+    :param client: IAM client of an online session
+    :param grants: also save domain and project grants of groups
+    :param max_workers: concurrent API calls
+    :param progress: called with a message before each step
+    :returns: number of rows per table
+    :raises RuntimeError: on API errors
+
+    The new snapshot is written to a temporary file which then replaces
+    the previous one, so readers never see a partial snapshot.
+    Group grants are taken from {py:obj}`scullery.iam.Iam.role_assignments`.
+    '''
+    if progress is None: progress = lambda msg: None
+    session = client.session
+    def run(fn, items:list) -> list:
+      results = session.map(fn, items, max_workers)
+      for res in results:
+        if isinstance(res, Exception): raise res
+      return results
+
+    progress('directory')
+    client.invalidate('roles')
+    client.sys_roles = None
+    users, groups, projects, domains, custom, system = run(lambda fn: fn(), [
+      client.users, client.groups, client.projects, client.domains,
+      client.custom_roles, client.system_roles,
+    ])
+    progress(f'{len(groups)} group memberships')
+    members = run(lambda g: client.group_users(g['id']), groups)
+    progress(f'{len(projects)} project details')
+    details = run(lambda p: client.get_project_details(p['id']), projects)
+    assignments = []
+    if grants:
+      progress('role assignments')
+      assignments = client.role_assignments()
+    roles = { r['id']: r for r in system + custom }
+    role = lambda a: json.dumps(roles.get(a['role']['id'], a['role']))
+    domain_grants = [ (a['scope']['domain']['id'], a['group']['id'], role(a))
+                      for a in assignments if 'group' in a and 'domain' in a['scope'] ]
+    project_grants = [ (a['scope']['project']['id'], a['group']['id'], role(a))
+                      for a in assignments if 'group' in a and 'project' in a['scope'] ]
+
+    progress('writing')
+    cfgdir = os.path.dirname(self.path) or '.'
+    os.makedirs(cfgdir, mode = 0o700, exist_ok = True)
+    fd, tmpname = tempfile.mkstemp(dir = cfgdir, prefix = '.iam', suffix = '.sqlite')
+    os.close(fd)
+    try:
+      os.chmod(tmpname, 0o600)
+      db = sqlite3.connect(tmpname)
+      with db:
+        db.executescript(SCHEMA)
+        db.executemany('INSERT INTO meta VALUES (?,?)', [
+          ('synced_at', str(time.time())),
+          ('domains', json.dumps(domains)),
+          ('grants', json.dumps(grants)),
+        ])
+        db.executemany('INSERT INTO users VALUES (?,?,?)',
+                        [ (u['id'], u['name'], json.dumps(u)) for u in users ])
+        db.executemany('INSERT INTO groups VALUES (?,?,?)',
+                        [ (g['id'], g['name'], json.dumps(g)) for g in groups ])
+        db.executemany('INSERT OR IGNORE INTO members VALUES (?,?)',
+                        [ (g['id'], u['id']) for g, us in zip(groups, members) for u in us ])
+        db.executemany('INSERT INTO projects VALUES (?,?,?,?)',
+                        [ (p['id'], p['name'], json.dumps(p), json.dumps(d)) for p, d in zip(projects, details) ])
+        db.executemany('INSERT OR IGNORE INTO roles VALUES (?,?,?,?,?)',
+                        [ (r['id'], r['name'], r.get('display_name'), int(is_custom), json.dumps(r))
+                          for is_custom, roles in ((1, custom), (0, system)) for r in roles ])
+        db.executemany('INSERT INTO domain_grants VALUES (?,?,?)', domain_grants)
+        db.executemany('INSERT INTO project_grants VALUES (?,?,?)', project_grants)
+      db.close()
+      self.close()
+      os.replace(tmpname, self.path)
+    except BaseException:
+      os.unlink(tmpname)
+      raise
+    return self.counts()
+
+class SnapshotIam(api.iam.Iam):
+  '''IAM client answering queries from a {py:obj}`scullery.snapshot.Snapshot`
+
+  Only read methods are supported.  Others fail as the session
+  cannot send requests.
+  '''
+  def __init__(self, session, snapshot:Snapshot) -> None:
+    '''Constructor
+
+    :param session: offline session
+    :param snapshot: snapshot to query
+    '''
+    super().__init__(session)
+    self.snapshot = snapshot
+
+  def system_roles(self) -> list:
+    if self.sys_roles is None:
+      self.sys_roles = self.snapshot.entities('SELECT data FROM roles WHERE custom = 0 ORDER BY rowid')
+    return self.sys_roles
+
+  def custom_roles(self) -> list:
+    if self.usr_roles is None:
+      self.usr_roles = self.snapshot.entities('SELECT data FROM roles WHERE custom = 1 ORDER BY rowid')
+    return self.usr_roles
+
+  def users(self, name:str|None = None) -> list:
+    if name is None: return self.snapshot.entities('SELECT data FROM users ORDER BY rowid')
+    return self.snapshot.entities('SELECT data FROM users WHERE name = ?', name)
+
+  def user_groups(self, usrid:str) -> list:
+    return self.snapshot.entities('SELECT g.data FROM members m JOIN groups g ON g.id = m.group_id'
+                                  ' WHERE m.user_id = ? ORDER BY m.rowid', usrid)
+
+  def groups(self, name:str|None = None) -> list:
+    if name is None: return self.snapshot.entities('SELECT data FROM groups ORDER BY rowid')
+    return self.snapshot.entities('SELECT data FROM groups WHERE name = ?', name)
+
+  def group_users(self, grpid:str) -> list:
+    return self.snapshot.entities('SELECT u.data FROM members m JOIN users u ON u.id = m.user_id'
+                                  ' WHERE m.group_id = ? ORDER BY m.rowid', grpid)
+
+  def domains(self) -> list:
+    return json.loads(self.snapshot.query('SELECT value FROM meta WHERE key = ?', 'domains')[0][0])
+
+  def grants_saved(self) -> None:
+    '''INTERNAL: check that the snapshot includes grants'''
+    rows = self.snapshot.query('SELECT value FROM meta WHERE key = ?', 'grants')
+    if not rows or not json.loads(rows[0][0]):
+      raise RuntimeError('Snapshot has no grants, run "cache sync" with grants')
+
+  def get_domain_group_perms(self, domid:str, grpid:str) -> list:
+    self.grants_saved()
+    return self.snapshot.entities('SELECT role FROM domain_grants WHERE domain_id = ? AND group_id = ?', domid, grpid)
+
+  def get_project_group_perms(self, prjid:str, grpid:str) -> list:
+    self.grants_saved()
+    return self.snapshot.entities('SELECT role FROM project_grants WHERE project_id = ? AND group_id = ?', prjid, grpid)
+
+  def role_assignments(self, project_id:str|None = None, group_id:str|None = None,
+                        user_id:str|None = None, role_id:str|None = None,
+                        domain_id:str|None = None) -> list:
+    '''List group role assignments saved in the snapshot'''
+    self.grants_saved()
+    if user_id is not None: return []
+    assignments = []
+    for scope, table, scope_id in (('project', 'project_grants', project_id), ('domain', 'domain_grants', domain_id)):
+      if scope_id is None and (project_id or domain_id): continue
+      sql = f'SELECT {scope}_id, group_id, role FROM {table}'
+      if scope_id is not None: sql += f' WHERE {scope}_id = ?'
+      for sid, gid, role in self.snapshot.query(sql + ' ORDER BY rowid', *([] if scope_id is None else [scope_id])):
+        role = json.loads(role)
+        if group_id not in (None, gid) or role_id not in (None, role['id']): continue
+        assignments.append({ 'role': { 'id': role['id'] }, 'group': { 'id': gid }, 'scope': { scope: { 'id': sid } } })
+    return assignments
+
+  def projects(self, name:str|None = None) -> list:
+    if name is None: return self.snapshot.entities('SELECT data FROM projects ORDER BY rowid')
+    return self.snapshot.entities('SELECT data FROM projects WHERE name = ?', name)
+
+  def get_project_details(self, prj_id:str) -> dict:
+    q = self.snapshot.entities('SELECT details FROM projects WHERE id = ?', prj_id)
+    if len(q) != 1: raise RuntimeError(f'{prj_id}: project not found in snapshot')
+    return q[0]
+
+class OfflineSession(api.SessionBase):
+  '''Session answering IAM queries from a snapshot
+
+  Has the same attributes as {py:obj}`scullery.api.ApiSession` but
+  does not authenticate.  Any request to the cloud raises
+  `RuntimeError`.
+  '''
+  def __init__(self, creds:dict) -> None:
+    '''Constructor
+
+    :param creds: session credentials (only used to select the snapshot)
+    '''
+    super().__init__(creds)
+    self.max_workers = 1
+    self.limiter = ratelimit.RateLimiter()
+    self.snapshot = Snapshot(snapshot_path(self.cloud_name, self.domain_name))
+    self.iam = SnapshotIam(self, self.snapshot)
+    self.region_data = None
+    self.project_data = None
+
+  def __getattr__(self, name:str):
+    if name in api.ApiSession.SERVICES:
+      raise RuntimeError(f'{name}: not available offline')
+    raise AttributeError(name)
+
+  map = api.ApiSession.map
+  project_id = api.ApiSession.project_id
+  region_id = api.ApiSession.region_id
+
+  def request(self, method:str, api_url:str, **kwargs):
+    '''Fails: there is no connection to the cloud
+
+    :raises RuntimeError: always
+    '''
+    raise RuntimeError(f'{method} {api_url}: not available offline')
+
+  def get(self, api_url, **kwargs): return self.request('GET', api_url)
+  def post(self, api_url, **kwargs): return self.request('POST', api_url)
+  def patch(self, api_url, **kwargs): return self.request('PATCH', api_url)
+  def delete(self, api_url, **kwargs): return self.request('DELETE', api_url)
+  def put(self, api_url, **kwargs): return self.request('PUT', api_url)
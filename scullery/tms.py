@@ -13,11 +13,13 @@ class Tms:
   '''Tag management class'''
   API_HOST = 'tms.{region}.otc.t-systems.com'
   '''API end-point'''
+  API_SCHEME = 'https'
+  '''API URL scheme'''
 
   def api_path(self, path):
     '''API URL'''
     host = Tms.API_HOST.format(region = self.session.region)
-    return f'https://{host}/{path}'
+    return f'{Tms.API_SCHEME}://{host}/{path}'
 
   def __init__(self, session) -> None:
     '''Constructor for Tms class'''
@@ -0,0 +1,141 @@
+#!python3
+#
+# Token cache
+#
+'''Persistent session token cache
+
+Keeps session tokens in a permission restricted file under the
+user's configuration directory so that they can be re-used across
+processes until they expire.
+'''
+import datetime
+import json
+import os
+import tempfile
+import time
+
+try:
+  from icecream import ic
+except ImportError:  # Graceful fallback if IceCream isn't installed.
+  ic = lambda *a: None if not a else (a[0] if len(a) == 1 else a)  # noqa
+
+class STR:
+  '''String constants for this module'''
+  CONFIG_DIR = 'SCULLERY_CONFIG_DIR'
+  XDG_CONFIG_HOME = 'XDG_CONFIG_HOME'
+  HOME = 'HOME'
+  CFG_HOME = '.config'
+  APP_DIR = 'scullery'
+  TOKENS_JSON = 'tokens.json'
+
+  TOKEN = 'token'
+  EXPIRES_AT = 'expires_at'
+
+REFRESH_AHEAD = 900
+'''Seconds before `expires_at` when a token is considered stale'''
+
+def config_dir() -> str:
+  '''Return the scullery configuration directory
+
+  :returns: path to directory
+
+  Uses `SCULLERY_CONFIG_DIR` if defined, otherwise `scullery`
+  under `XDG_CONFIG_HOME` or `~/.config`.
+  '''
+  if STR.CONFIG_DIR in os.environ: return os.environ[STR.CONFIG_DIR]
+  if STR.XDG_CONFIG_HOME in os.environ:
+    return os.path.join(os.environ[STR.XDG_CONFIG_HOME], STR.APP_DIR)
+  home = os.environ[STR.HOME] if STR.HOME in os.environ else os.path.expanduser('~')
+  return os.path.join(home, STR.CFG_HOME, STR.APP_DIR)
+
+def cache_file() -> str:
+  '''Return the path to the token cache file'''
+  return os.path.join(config_dir(), STR.TOKENS_JSON)
+
+def cache_key(cloud_name:str|None, user:str, domain:str, scope:str) -> str:
+  '''Compute the cache key for a token
+
+  :param cloud_name: cloud configuration name
+  :param user: user name
+  :param domain: user domain name
+  :param scope: project or region the token is scoped to
+  :returns: key string
+  '''
+  return '|'.join([cloud_name or '', domain, user, scope])
+
+def parse_expires_at(expires_at:str) -> float:
+  '''Convert an API `expires_at` time stamp to epoch seconds
+
+  :param expires_at: ISO 8601 time stamp, e.g. `2024-01-01T10:00:00.000000Z`
+  :returns: seconds since the epoch
+  '''
+  if expires_at.endswith('Z'): expires_at = expires_at[:-1] + '+00:00'
+  dt = datetime.datetime.fromisoformat(expires_at)
+  if dt.tzinfo is None: dt = dt.replace(tzinfo = datetime.timezone.utc)
+  return dt.timestamp()
+
+def _read() -> dict:
+  '''INTERNAL: read the cache file'''
+  try:
+    with open(cache_file(), 'r') as fp:
+      data = json.load(fp)
+    return data if isinstance(data, dict) else dict()
+  except (OSError, ValueError):
+    return dict()
+
+def _write(data:dict) -> None:
+  '''INTERNAL: atomically replace the cache file
+
+  The file is only readable by the current user.
+  '''
+  cfgdir = config_dir()
+  os.makedirs(cfgdir, mode = 0o700, exist_ok = True)
+  fd, tmpname = tempfile.mkstemp(dir = cfgdir, prefix = '.tokens')
+  try:
+    os.chmod(tmpname, 0o600)
+    with os.fdopen(fd, 'w') as fp:
+      json.dump(data, fp)
+    os.replace(tmpname, cache_file())
+  except Exception:
+    os.unlink(tmpname)
+    raise
+
+def lookup(key:str, refresh_ahead:float = REFRESH_AHEAD) -> dict|None:
+  '''Look-up a cached token
+
+  :param key: cache key from {py:obj}`scullery.tokencache.cache_key`
+  :param refresh_ahead: ignore tokens expiring within this many seconds
+  :returns: dict with `token` and `expires_at` or None
+  '''
+  entry = _read().get(key)
+  if entry is None: return None
+  if entry[STR.EXPIRES_AT] - refresh_ahead <= time.time(): return None
+  return entry
+
+def store(key:str, token:str, expires_at:float) -> None:
+  '''Save a token in the cache
+
+  :param key: cache key
+  :param token: token to save
+  :param expires_at: token expiration in seconds since the epoch
+
+  Expired entries are purged while saving.
+  '''
+  now = time.time()
+  data = { k:v for k,v in _read().items() if v.get(STR.EXPIRES_AT,0) > now }
+  data[key] = { STR.TOKEN: token, STR.EXPIRES_AT: expires_at }
+  _write(data)
+
+def discard(key:str) -> None:
+  '''Remove a token from the cache
+
+  :param key: cache key
+  '''
+  data = _read()
+  if key not in data: return
+  del data[key]
+  _write(data)
+
+if __name__ == '__main__':
+  for k,v in _read().items():
+    print(k, time.ctime(v[STR.EXPIRES_AT]))
@@ -2,8 +2,10 @@
 User functions
 
 '''
-import os
-from typing import Any
+import getpass
+import re
+from typing import Any, Callable
+from urllib.parse import urlsplit
 
 try:
   from icecream import ic
@@ -12,28 +14,73 @@ except ImportError:  # Graceful fallback if IceCream isn't installed.
 
 from scullery import api
 
-def add_user(cc:api.ApiSession,
+RE_PRJSIG = re.compile(r'^-- \S+ created by \S+ using scullery -- project:(\S+)($|\||\n)')
+'''Signature in the description of items created by scullery for a project'''
+
+OWNED_KINDS = ('user', 'group', 'role')
+'''Kinds of items tracked by {py:obj}`scullery.usergroup.ownership_index`'''
+
+IMPORT_WORKERS = 8
+'''Default number of users created at the same time by {py:obj}`scullery.usergroup.import_users`'''
+IMPORT_RATE = 10.0
+'''Default IAM requests per second of {py:obj}`scullery.usergroup.import_users`'''
+
+def ownership_index(cc:api.ApiSession, listings:list[list]|None = None) -> dict[str,dict[str,list]]:
+  '''Index the users, groups and custom roles created by scullery per project
+
+  :param cc: API session
+  :param listings: users, groups and custom roles already listed by the
+    caller (fetched if not given)
+  :returns: dictionary project name : { kind : list of items }, with
+    the kinds in {py:obj}`scullery.usergroup.OWNED_KINDS`
+  :raises RuntimeError: on error
+
+  Items are matched by the `-- ... using scullery -- project:`
+  signature in their description.  The three listings are fetched
+  concurrently, once, whatever the number of projects.
+  '''
+  if listings is None:
+    listings = cc.map(lambda fn: fn(), [cc.iam.users, cc.iam.groups, cc.iam.custom_roles])
+  index = dict()
+  for kind, items in zip(OWNED_KINDS, listings):
+    if isinstance(items, Exception): raise items
+    for i in items:
+      if not (mv := RE_PRJSIG.search(i.get('description') or '')): continue
+      owned = index.setdefault(mv.group(1), { k: [] for k in OWNED_KINDS })
+      owned[kind].append(i)
+  return index
+
+def user_record(cc:api.ApiSession,
+              domain_id:str,
               name:str|None = None,
               passwd:str|None = None,
               description:str|None = None,
               email:str|None = None,
-              project:str|None = None,
-              groups:list[str]|None = None) -> dict[str,str]:
+              project:str|None = None) -> tuple[dict[str,Any],dict[str,str]]:
+  '''Prepare the request to create a user
+
+  :param cc: API session
+  :param domain_id: domain of the new user
+  :param name: user name (a random name is generated if None)
+  :param passwd: password (a random password is generated if None)
+  :param description: user description
+  :param email: e-mail address
+  :param project: project name to include in the description signature
+  :returns: tuple with {py:obj}`scullery.iam.Iam.new_user` arguments and
+    the generated values (`name` and `password` if generated)
+  '''
   result = dict()
-
-  domain_id = cc.iam.domain()
   new_user = {
     'pwd_status': False,
     'domain_id': domain_id,
-    'description': f'-- user created by {os.getlogin()} using scullery',
+    'description': f'-- user created by {getpass.getuser()} using scullery',
   }
 
   if name is None:
     new_user['name'] = cc.iam.gen_user_name()
-    result['name'] = new_user['name']
   else:
     new_user['name'] = name
-    result['name'] = name
+  result['name'] = new_user['name']
 
   if passwd is None:
     new_user['password'] = cc.iam.gen_user_password()
@@ -46,14 +93,25 @@ def add_user(cc:api.ApiSession,
     new_user['description'] += f' -- project:{project}'
   if description is not None:
     new_user['description'] += f'\n{description}'
+  return new_user, result
+
+def add_user(cc:api.ApiSession,
+              name:str|None = None,
+              passwd:str|None = None,
+              description:str|None = None,
+              email:str|None = None,
+              project:str|None = None,
+              groups:list[str]|None = None) -> dict[str,str]:
+  domain_id = cc.iam.domain()
+  new_user, result = user_record(cc, domain_id, name, passwd, description, email, project)
 
   gids = dict()
   if groups:
     # Make sure groups exist!
+    found = cc.iam.resolve('groups', groups)
     for g in groups:
-      q = cc.iam.groups(g)
-      if len(q) != 1: raise KeyError(g)
-      gids[q[0]['name']] = q[0]['id']
+      if not g in found: raise KeyError(g)
+      gids[found[g]['name']] = found[g]['id']
 
   # ~ print(new_user, groups)
   newid = cc.iam.new_user(**new_user)
@@ -62,12 +120,96 @@ def add_user(cc:api.ApiSession,
     cc.iam.add_group_user(gid, newid)
   return result
 
+IMPORT_FIELDS = ('name', 'password', 'email', 'description', 'project', 'groups')
+'''Fields recognized in bulk user import files'''
+
+RESULT_FIELDS = ('name', 'id', 'password', 'groups', 'status', 'error')
+'''Fields of bulk user import results'''
+
+def import_users(cc:api.ApiSession,
+              entries:list[dict],
+              done:dict[str,dict]|None = None,
+              on_result:Callable[[dict],None]|None = None,
+              max_workers:int = IMPORT_WORKERS,
+              rate:float|None = IMPORT_RATE) -> list[dict]:
+  '''Create users and their group memberships in bulk
+
+  :param cc: API session
+  :param entries: users to create, dictionaries with the keys in
+    {py:obj}`scullery.usergroup.IMPORT_FIELDS`.  `groups` is a list of group names.
+  :param done: results of a previous run by user name, used to resume
+  :param on_result: called with each result as soon as the user is processed
+  :param max_workers: maximum users created at the same time
+  :param rate: IAM requests per second (None for no limit)
+  :returns: list of results (dictionaries with the keys in {py:obj}`scullery.usergroup.RESULT_FIELDS`)
+
+  The domain, the groups and the existing users are looked up once.
+  Users are then created concurrently; requests go through the
+  session rate limiter.  Unless the session already limits IAM
+  requests, they are limited to `rate` during the import.
+
+  Users with an `ok` result in `done` are skipped.  Users created in
+  a previous run whose memberships failed keep their ID and password;
+  only the memberships are retried.  A user whose name is already
+  taken by a user not recorded in `done` is reported as an error.
+  '''
+  import threading
+
+  done = done or {}
+  domain_id = cc.iam.domain()
+  group_names = sorted({ g for e in entries for g in e.get('groups', []) })
+  groups = cc.iam.resolve('groups', group_names) if group_names else {}
+  existing = cc.iam.index('users')
+  lock = threading.Lock()
+
+  def create(entry:dict) -> dict:
+    name = entry.get('name')
+    prev = done.get(name, {})
+    res = {
+      'name': name,
+      'id': prev.get('id', ''),
+      'password': prev.get('password', ''),
+      'groups': ';'.join(entry.get('groups', [])),
+      'status': 'ok',
+      'error': '',
+    }
+    try:
+      if not name: raise ValueError('Missing user name')
+      missing = [ g for g in entry.get('groups', []) if not g in groups ]
+      if missing: raise KeyError(f'Unknown groups: {", ".join(missing)}')
+      if not res['id']:
+        if existing.get(name) is not None: raise KeyError(f'{name}: user already exists')
+        new_user, generated = user_record(cc, domain_id, name,
+                                          passwd = entry.get('password') or None,
+                                          description = entry.get('description') or None,
+                                          email = entry.get('email') or None,
+                                          project = entry.get('project') or None)
+        res['password'] = generated.get('password', '')
+        res['id'] = cc.iam.new_user(**new_user)
+      for g in entry.get('groups', []):
+        cc.iam.add_group_user(groups[g]['id'], res['id'])
+    except Exception as e:
+      res['status'] = 'failed'
+      res['error'] = str(e).replace('\n', ' ')
+    if on_result is not None:
+      with lock:
+        on_result(res)
+    return res
+
+  todo = [ e for e in entries if done.get(e.get('name'), {}).get('status') != 'ok' ]
+  host = urlsplit(cc.iam.api_path('')).hostname
+  limited = rate is not None and cc.limiter.bucket(host) is None
+  if limited: cc.limiter.configure(host, rate)
+  try:
+    return cc.map(create, todo, max_workers)
+  finally:
+    if limited: cc.limiter.configure(host, None)
 
 def add_group(cc:api.ApiSession,
               name:str,
               description:str|None = None,
               project:str|None = None):
-  desc = f'-- group created by {os.getlogin()} using scullery'
+  desc = f'-- group created by {getpass.getuser()} using scullery'
   if project is not None: desc += f' -- project:{project}'
   if description is not None: desc += f'|{description}'
   return cc.iam.new_group(name, desc)
@@ -77,7 +219,7 @@ def add_role(cc:api.ApiSession,
               policy:Any,
               description:str|None = None,
               project:str|None = None):
-  desc = f'-- role created by {os.getlogin()} using scullery'
+  desc = f'-- role created by {getpass.getuser()} using scullery'
   if project is not None: desc += f' -- project:{project}'
   if description is not None: desc += f'|{description}'
   return cc.iam.new_role(display_name = name, policy = policy,
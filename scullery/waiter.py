@@ -0,0 +1,168 @@
+#!python3
+#
+# Waiting for slow operations
+#
+'''Track many pending operations in a single polling loop
+
+Long running operations (e.g. project deletion, which takes over 30
+minutes) are polled by one loop instead of one loop per item.  Every
+item has its own exponential backoff, so items started at different
+times are not all polled at once, and all polls draw from a shared
+request budget ({py:obj}`scullery.ratelimit.TokenBucket`).  Polls that
+are due at the same time are sent concurrently over the session
+connection pool.
+
+```python
+w = waiter.Waiter(lambda prj_id: cc.iam.project_status(prj_id) is None,
+                  session = cc, timeout = 3600)
+for prj in projects: w.add(prj['id'], prj['name'])
+results = w.run()
+```
+'''
+import heapq
+import random
+import sys
+import time
+
+from typing import Any, Callable
+
+try:
+  from icecream import ic
+except ImportError:  # Graceful fallback if IceCream isn't installed.
+  ic = lambda *a: None if not a else (a[0] if len(a) == 1 else a)  # noqa
+
+from scullery import ratelimit
+
+PROGRESS_EVERY = 60
+'''Seconds between progress messages when nothing changes'''
+
+class STATUS:
+  '''Final states of waited items'''
+  DONE = 'done'
+  TIMEOUT = 'timeout'
+
+class Pending:
+  '''INTERNAL: an item being waited for'''
+  def __init__(self, key:Any, name:str, interval:float) -> None:
+    self.key = key
+    self.name = name
+    self.interval = interval
+    self.polls = 0
+    self.error = None
+
+class Waiter:
+  '''Wait for many items in a single polling loop'''
+  def __init__(self, check:Callable[[Any],bool],
+                session = None,
+                interval:float = 10.0, max_interval:float = 300.0,
+                rate:float = 2.0, burst:int = 5,
+                timeout:float|None = None,
+                progress = None) -> None:
+    '''Constructor
+
+    :param check: function of an item key returning True when the item is done
+    :param session: session whose `map` sends due polls concurrently (optional)
+    :param interval: seconds before the first poll of an item
+    :param max_interval: maximum seconds between polls of an item
+    :param rate: polls per second allowed for all items together
+    :param burst: maximum polls sent at once
+    :param timeout: seconds to wait in total (None waits forever)
+    :param progress: stream for progress messages (defaults to `sys.stderr`, False to disable)
+
+    The interval of an item doubles (with jitter) after each poll
+    that finds it still pending.  A poll raising an exception counts
+    as pending; the error is reported with the final state if the
+    item does not complete.
+    '''
+    self.check = check
+    self.session = session
+    self.interval = interval
+    self.max_interval = max_interval
+    self.budget = ratelimit.TokenBucket(rate, burst)
+    self.timeout = timeout
+    self.progress = sys.stderr if progress is None else progress
+    self.queue = []
+    self.pending = dict()
+    self.seq = 0
+
+  def add(self, key:Any, name:str|None = None, delay:float|None = None) -> None:
+    '''Start waiting for an item
+
+    :param key: value passed to `check`
+    :param name: name used in progress messages (defaults to `key`)
+    :param delay: seconds before the first poll (defaults to `interval`)
+    '''
+    item = Pending(key, str(key) if name is None else name, self.interval)
+    self.pending[key] = item
+    self.schedule(item, self.interval if delay is None else delay)
+
+  def schedule(self, item:Pending, delay:float) -> None:
+    '''INTERNAL: queue the next poll of an item'''
+    self.seq += 1
+    heapq.heappush(self.queue, (time.monotonic() + delay, self.seq, item))
+
+  def say(self, msg:str) -> None:
+    '''INTERNAL: write a progress message'''
+    if self.progress: self.progress.write(msg + '\n')
+
+  def poll(self, item:Pending) -> bool:
+    '''INTERNAL: poll one item, exceptions count as pending'''
+    try:
+      return self.check(item.key)
+    except Exception as e:
+      item.error = e
+      return False
+
+  def run(self) -> dict[Any,str]:
+    '''Poll until all items are done or the timeout expires
+
+    :returns: dictionary key : final state ({py:obj}`scullery.waiter.STATUS`
+      values, followed by the last error for timed out items)
+    '''
+    start = time.monotonic()
+    deadline = None if self.timeout is None else start + self.timeout
+    total = len(self.pending)
+    results = dict()
+    shown = (None, start)
+
+    while self.pending:
+      due_at = self.queue[0][0]
+      final = deadline is not None and due_at >= deadline
+      if final: due_at = deadline
+      time.sleep(max(0.0, due_at - time.monotonic()))
+
+      # Take the due items that fit in the request budget, at least one
+      if final:
+        due = [ entry[2] for entry in self.queue ]
+        self.queue.clear()
+      else:
+        due = [ heapq.heappop(self.queue)[2] ]
+        now = time.monotonic()
+        while self.queue and self.queue[0][0] <= now and self.budget.take():
+          due.append(heapq.heappop(self.queue)[2])
+      time.sleep(self.budget.reserve())
+
+      if self.session is not None:
+        done = self.session.map(self.poll, due)
+      else:
+        done = [ self.poll(item) for item in due ]
+
+      for item, ok in zip(due, done):
+        item.polls += 1
+        if ok is True:
+          del self.pending[item.key]
+          results[item.key] = STATUS.DONE
+          self.say(f'{item.name}: done after {time.monotonic() - start:.0f}s ({len(results)}/{total})')
+        else:
+          item.interval = min(self.max_interval, item.interval * 2)
+          self.schedule(item, item.interval * random.uniform(0.8, 1.2))
+      if final: break
+      now = time.monotonic()
+      if self.pending and (shown[0] != len(self.pending) or now - shown[1] >= PROGRESS_EVERY):
+        self.say(f'Waiting for {len(self.pending)} of {total} ({now - start:.0f}s elapsed)')
+        shown = (len(self.pending), now)
+
+    for key, item in self.pending.items():
+      results[key] = STATUS.TIMEOUT if item.error is None else f'{STATUS.TIMEOUT}: {item.error}'
+      self.say(f'{item.name}: still pending after {time.monotonic() - start:.0f}s')
+    return results
@@ -0,0 +1,67 @@
+#
+# Test fixtures
+#
+'''Shared fixtures
+
+Tests run against {py:obj}`standin.StandIn`, the local stand-in of the
+cloud REST APIs in `benchmarks/`, never against a real cloud.
+'''
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+'''Repository top directory'''
+
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+sys.path.insert(0, ROOT)
+
+import standin
+
+CREDS = {
+  'cloud_name': 'standin',
+  'username': 'test',
+  'password': 'test',
+  'user_domain_name': 'test',
+  'project_name': 'eu-de',
+}
+'''Credentials used to log into the stand-in'''
+
+@pytest.fixture(scope = 'module')
+def server():
+  '''Stand-in server with a small tenant'''
+  with standin.StandIn(standin.Tenant(users = 20, groups = 5, projects = 5, resources = 10,
+                                      servers = 5, images = 5, roles = 3, tags = 3)) as srv:
+    yield srv
+
+@pytest.fixture
+def scull_env(tmp_path):
+  '''Environment for running `python -m scullery` against the stand-in'''
+  env = { k: v for k, v in os.environ.items() if not k.startswith(('OS_', 'SCULLERY_')) }
+  env.update({ f'OS_{k.upper()}': v for k, v in CREDS.items() })
+  env['SCULLERY_CONFIG_DIR'] = str(tmp_path)
+  env['PYTHONPATH'] = ROOT + os.pathsep + env.get('PYTHONPATH', '')
+  return env
+
+@pytest.fixture
+def endpoint(server):
+  '''Point the API end-points of all sessions to the stand-in'''
+  import scullery
+  scullery.api.set_api_endpoint(server.netloc, 'http')
+  try:
+    yield server
+  finally:
+    import gc
+    gc.collect() # Sessions revoke their tokens on the stand-in
+    scullery.api.set_api_endpoint()
+
+@pytest.fixture
+def session(endpoint):
+  '''{py:obj}`scullery.api.ApiSession` logged into the stand-in'''
+  import scullery
+  cc = scullery.api.ApiSession(CREDS)
+  yield cc
+  # pytest keeps the session until after the end-point is reset
+  cc.revoke_token(cc.token)
+  cc.token = None
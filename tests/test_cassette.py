@@ -0,0 +1,52 @@
+#
+# Cassette tests
+#
+'''Recording and replaying API sessions'''
+import gc
+
+import scullery
+
+from conftest import CREDS
+
+def session(cassette = None, token_cache = True):
+  '''INTERNAL: new session, using the token cache unless told otherwise'''
+  return scullery.api.ApiSession(CREDS, token_cache = token_cache, cassette = cassette)
+
+def test_record_replay(endpoint, monkeypatch, tmp_path):
+  cassettes = scullery.api.cassettes
+  monkeypatch.setenv('SCULLERY_CONFIG_DIR', str(tmp_path))
+  # A token in the cache must not keep the token request out of the recording
+  cached = session()
+  path = str(tmp_path / 'groups.jsonl')
+  tape = cassettes.Cassette(path, cassettes.MODE.RECORD)
+  cc = session(tape)
+  groups = cc.iam.groups()
+  tokens = [ cc.token, cached.token ]
+  del cc
+  gc.collect() # Revoke the token while recording
+  tape.close()
+
+  text = open(path).read()
+  assert 'POST' in text and '/v3/auth/tokens' in text
+  for token in tokens: assert token not in text
+  assert CREDS['password'] not in text
+
+  calls = endpoint.total_calls()
+  cc = session(cassettes.Cassette(path, cassettes.MODE.REPLAY))
+  assert cc.iam.groups() == groups
+  assert endpoint.total_calls() == calls
+
+def test_token_scrubbed_from_bodies(endpoint, monkeypatch, tmp_path):
+  cassettes = scullery.api.cassettes
+  monkeypatch.setenv('SCULLERY_CONFIG_DIR', str(tmp_path))
+  cached = session()
+  path = str(tmp_path / 'aksk.jsonl')
+  tape = cassettes.Cassette(path, cassettes.MODE.RECORD)
+  cc = session(tape)
+  cc.iam.get_aksk() # The request body contains the session token
+  tokens = [ cc.token, cached.token ]
+  del cc, cached
+  gc.collect()
+  tape.close()
+  text = open(path).read()
+  for token in tokens: assert token not in text
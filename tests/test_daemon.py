@@ -0,0 +1,68 @@
+#
+# Daemon tests
+#
+'''Forwarding commands to a {py:obj}`scullery.daemon.Server`'''
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+@pytest.fixture
+def daemon_env(server, scull_env, tmp_path):
+  '''Environment of commands forwarded to a running daemon'''
+  from scullery import daemon
+
+  scull_env['SCULLERY_SOCKET'] = str(tmp_path / 'scullery.sock')
+  proc = subprocess.Popen([sys.executable, '-m', 'scullery', 'serve'], env = scull_env,
+                          stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
+  try:
+    for _ in range(100):
+      if daemon.listening(scull_env['SCULLERY_SOCKET']): break
+      time.sleep(0.05)
+    yield scull_env
+  finally:
+    proc.terminate()
+    proc.wait()
+
+def scull(server, env, *argv):
+  '''INTERNAL: run a command against the stand-in'''
+  return subprocess.run([sys.executable, '-m', 'scullery', '--api-endpoint', server.url] + list(argv),
+                        env = env, capture_output = True, text = True, timeout = 60)
+
+def test_warm_session(server, daemon_env):
+  assert scull(server, daemon_env, 'grp').returncode == 0
+  logins = server.calls['POST /v3/auth/tokens']
+  rc = scull(server, daemon_env, 'grp')
+  assert rc.returncode == 0
+  assert 'grp00000' in rc.stdout
+  assert server.calls['POST /v3/auth/tokens'] == logins
+
+def test_sessions_kept_per_options(server, daemon_env, tmp_path):
+  assert scull(server, daemon_env, 'grp').returncode == 0
+  empty = tmp_path / 'empty.jsonl'
+  empty.write_text('')
+  # Forwarded on purpose: the daemon must not answer from the warm live session
+  forward = 'import sys; from scullery import daemon; sys.exit(daemon.forward(sys.argv[1:]))'
+  rc = subprocess.run([sys.executable, '-c', forward, '--api-endpoint', server.url,
+                        '--replay', str(empty), 'grp'],
+                      env = daemon_env, capture_output = True, text = True, timeout = 60)
+  assert rc.returncode != 0
+  assert 'not in cassette' in rc.stderr
+
+def test_cassette_not_forwarded(server, scull_env, tmp_path):
+  # A listener that never replies: a forwarded command would time out
+  path = str(tmp_path / 'scullery.sock')
+  sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+  sock.bind(path)
+  sock.listen()
+  sock.setblocking(False)
+  scull_env['SCULLERY_SOCKET'] = path
+  empty = tmp_path / 'empty.jsonl'
+  empty.write_text('')
+  with sock:
+    rc = scull(server, scull_env, '--replay', str(empty), 'grp')
+    with pytest.raises(BlockingIOError): sock.accept()
+  assert rc.returncode != 0
+  assert 'not in cassette' in rc.stderr
@@ -0,0 +1,95 @@
+#
+# Dependency graph tests
+#
+'''Ordering, failure cascade and resume of {py:obj}`scullery.dag.Graph`'''
+import io
+import threading
+import time
+
+import pytest
+
+from scullery import dag
+
+def graph(fail:str|None = None, log:list|None = None) -> dag.Graph:
+  '''INTERNAL: project, then roles and groups, then grants
+
+  :param fail: name of a task that raises
+  :param log: list the tasks append their name to when they run
+  '''
+  log = [] if log is None else log
+  def task(name:str):
+    def fn(results:dict):
+      log.append(name)
+      if name == fail: raise RuntimeError(f'{name} broke')
+      return f'{name}:' + ','.join(sorted(results))
+    return fn
+  g = dag.Graph()
+  g.add('project', task('project'))
+  g.add('role', task('role'))
+  g.add('group', task('group'), ['project'])
+  g.add('grant', task('grant'), ['project', 'role', 'group'])
+  g.add('user', task('user'), ['group'])
+  return g
+
+def test_order():
+  log = []
+  g = graph(log = log)
+  results = g.run(max_workers = 4)
+  assert set(results) == set(g.nodes)
+  for node in g.nodes.values():
+    assert node.state == dag.STATE.DONE
+    for dep in node.deps: assert log.index(dep) < log.index(node.name)
+  # Tasks see the results of their dependencies
+  assert results['grant'].startswith('grant:')
+  assert { 'group', 'project', 'role' } <= set(results['grant'][6:].split(','))
+
+def test_independent_tasks_overlap():
+  barrier = threading.Barrier(3, timeout = 5)
+  g = dag.Graph()
+  for name in 'abc': g.add(name, lambda r: barrier.wait())
+  g.run(max_workers = 3)
+  assert not g.failed
+
+def test_failure_cascade():
+  log = []
+  g = graph(fail = 'group', log = log)
+  results = g.run()
+  assert set(results) == { 'project', 'role' }
+  assert [ node.name for node in g.failed ] == ['group']
+  assert str(g.nodes['group'].error) == 'group broke'
+  assert g.nodes['grant'].state == dag.STATE.SKIPPED
+  assert g.nodes['user'].state == dag.STATE.SKIPPED
+  assert 'grant' not in log and 'user' not in log
+
+def test_resume():
+  log = []
+  g = graph(log = log)
+  done = { 'project': 'old project', 'role': 'old role', 'other': 'ignored' }
+  completed = []
+  results = g.run(done = done, on_done = lambda node: completed.append(node.name))
+  assert sorted(log) == ['grant', 'group', 'user']
+  assert sorted(completed) == sorted(log)
+  assert results['project'] == 'old project' and 'other' not in results
+  assert g.nodes['project'].state == dag.STATE.DONE and g.nodes['project'].start is None
+
+def test_check():
+  g = dag.Graph()
+  g.add('a', lambda r: None, ['b'])
+  with pytest.raises(KeyError): g.run()
+  g.add('b', lambda r: None, ['c'])
+  g.add('c', lambda r: None, ['a'])
+  with pytest.raises(ValueError, match = 'cycle'): g.check()
+  with pytest.raises(KeyError): g.add('a', lambda r: None)
+
+def test_critical_path():
+  g = dag.Graph()
+  g.add('slow', lambda r: time.sleep(0.2))
+  g.add('fast', lambda r: None)
+  g.add('last', lambda r: None, ['slow', 'fast'])
+  g.run()
+  assert [ node.name for node in g.critical_path() ] == ['slow', 'last']
+  fp = io.StringIO()
+  g.report(fp)
+  lines = fp.getvalue().splitlines()
+  assert [ l.split()[1] for l in lines if l.startswith('*') ] == ['slow', 'last']
+  assert lines[-1].startswith('3 tasks in')
@@ -0,0 +1,92 @@
+#
+# IAM client tests
+#
+'''Name resolution of {py:obj}`scullery.iam.Iam`'''
+import asyncio
+import inspect
+import subprocess
+import sys
+
+import pytest
+
+import scullery
+
+from conftest import CREDS
+
+def test_resolve_same_rule_for_any_batch(session):
+  users = session.iam.users()
+  other = users[-1]
+  names = [ u['name'] for u in users[:3] ] + [ 'nobody', other['id'] ]
+  small = session.iam.resolve('users', names, bulk = False)
+  large = session.iam.resolve('users', names, bulk = True)
+  assert small == large
+  assert set(small) == set(names[:3])
+  # Automatic choice, on both sides of the threshold
+  session.iam.invalidate('users')
+  assert session.iam.resolve('users', names[:scullery.api.iam.BULK_THRESHOLD - 1]) == small
+  many = names + [ f'nobody{i}' for i in range(scullery.api.iam.BULK_THRESHOLD) ]
+  assert session.iam.resolve('users', many) == small
+
+def test_resolve_roles_by_display_name(session):
+  custom = session.iam.custom_roles()[0]
+  system = session.iam.system_roles()[0]
+  found = session.iam.resolve('roles', [ custom['display_name'], system['name'], custom['id'] ])
+  assert found == { custom['display_name']: custom, system['name']: system }
+  # get_role still accepts IDs
+  assert session.iam.get_role(custom['id']) == custom
+
+def test_index_invalidated(session):
+  assert session.iam.resolve('groups', ['kept'], bulk = True) == {}
+  gid = session.iam.new_group('kept')
+  assert session.iam.resolve('groups', ['kept'])['kept']['id'] == gid
+
+def test_aio_resolve(endpoint):
+  pytest.importorskip('aiohttp')
+  from scullery import aio
+
+  async def resolve() -> tuple:
+    async with aio.AsyncApiSession(CREDS) as cc:
+      users = await cc.iam.users()
+      names = [ u['name'] for u in users[:3] ] + [ users[-1]['id'] ]
+      return (names,
+              await cc.iam.resolve('users', names, bulk = False),
+              await cc.iam.resolve('users', names, bulk = True),
+              await cc.iam.get_role('te_admin'))
+
+  names, small, large, role = asyncio.run(resolve())
+  assert small == large
+  assert set(small) == set(names[:3])
+  assert role['name'] == 'te_admin'
+
+def test_aio_clients_never_block(endpoint):
+  pytest.importorskip('aiohttp')
+  from scullery import aio
+  for client in (aio.Iam, aio.Ecs, aio.Ims, aio.Rms, aio.Tms, aio.Deh):
+    for name, fn in inspect.getmembers(client.SYNC, inspect.isfunction):
+      if name.startswith('_'): continue
+      wrapped = getattr(client, name)
+      assert inspect.iscoroutinefunction(wrapped) or inspect.isasyncgenfunction(wrapped), f'{client.__name__}.{name}'
+
+  async def query() -> tuple:
+    async with aio.AsyncApiSession(CREDS) as cc:
+      images = [ img async for img in cc.ims.images() ]
+      assignments = await cc.iam.role_assignments()
+      async for server in cc.ecs.servers():
+        break # Stops the generator in its worker thread
+      return images, assignments, await cc.tms.tags()
+
+  images, assignments, tags = asyncio.run(query())
+  assert images and assignments and tags
+
+def test_del_roles_listed_once(endpoint, scull_env):
+  names = [ f'tmp-role-{i}' for i in range(3) ]
+  cc = scullery.api.ApiSession(CREDS)
+  for name in names: cc.iam.new_role(display_name = name, policy = [{ 'Action': ['ecs:*:get*'], 'Effect': 'Allow' }])
+  listed = endpoint.calls['GET /v3.0/OS-ROLE/roles']
+  rc = subprocess.run([sys.executable, '-m', 'scullery', '--api-endpoint', endpoint.url, '--no-daemon',
+                       'roles', 'del'] + names + ['nothing'],
+                      env = scull_env, capture_output = True, text = True, timeout = 60)
+  assert rc.returncode == 0, rc.stderr
+  assert 'nothing: Role not found' in rc.stderr
+  assert endpoint.calls['GET /v3.0/OS-ROLE/roles'] - listed == 1
+  assert cc.iam.resolve('roles', names) == {}
@@ -0,0 +1,55 @@
+#
+# Kermit tests
+#
+'''Journal and resume of `kermit setup`'''
+import json
+import subprocess
+import sys
+
+import pytest
+
+from scullery import rcp_kermit
+
+def scull(server, scull_env, *argv):
+  '''INTERNAL: run scullery against the stand-in'''
+  return subprocess.run([sys.executable, '-m', 'scullery', '--api-endpoint', server.url, '--no-daemon'] + list(argv),
+                        env = scull_env, capture_output = True, text = True, timeout = 60)
+
+def writes(server) -> int:
+  '''INTERNAL: count the requests that change the tenant'''
+  return sum(n for call, n in server.calls.items()
+              if not call.startswith('GET') and not call.endswith('/v3/auth/tokens'))
+
+def test_read_journal(tmp_path):
+  path = tmp_path / 'journal.jsonl'
+  path.write_text(json.dumps({ 'kermit': 'eu-de_j', 'spec': 'abc' }) + '\n'
+                  + json.dumps({ 'step': 'project', 'result': 'id1' }) + '\n'
+                  + '{"step": "group:adm')
+  assert rcp_kermit.read_journal(str(path), 'eu-de_j', 'abc') == { 'project': 'id1' }
+  with pytest.raises(ValueError): rcp_kermit.read_journal(str(path), 'eu-de_other', 'abc')
+
+def test_resume(server, scull_env, tmp_path):
+  journal = str(tmp_path / 'journal.jsonl')
+  start = writes(server)
+  rc = scull(server, scull_env, 'kermit', 'setup', 'eu-de_resume', '-J', journal, '-o', str(tmp_path / 'first.yaml'))
+  assert rc.returncode == 0, rc.stderr
+  steps = rcp_kermit.read_journal(journal, 'eu-de_resume', json.loads(open(journal).readline())['spec'])
+  assert 'project' in steps
+
+  before = writes(server)
+  assert before > start
+  rc = scull(server, scull_env, 'kermit', 'setup', 'eu-de_resume', '--resume', journal, '-o', str(tmp_path / 'second.yaml'))
+  assert rc.returncode == 0, rc.stderr
+  # Every step was recorded, nothing is created again
+  assert writes(server) == before
+  assert '*redacted*' in (tmp_path / 'second.yaml').read_text()
+
+def test_plan_after_setup(server, scull_env, tmp_path):
+  # The default spec has a custom role, named by its display name
+  rc = scull(server, scull_env, 'kermit', 'setup', 'eu-de_plan', '-o', str(tmp_path / 'info.yaml'))
+  assert rc.returncode == 0, rc.stderr
+  rc = scull(server, scull_env, 'kermit', 'plan', 'eu-de_plan')
+  assert rc.returncode == 0, rc.stderr
+  changes = [ line for line in rc.stdout.splitlines() if line.startswith(('+', '-', '!')) ]
+  assert changes == []
+  assert '0 to create, 0 to delete' in rc.stdout
@@ -0,0 +1,32 @@
+#
+# Multi-cloud tests
+#
+'''Running a recipe against several clouds'''
+import argparse
+import io
+import sys
+
+import scullery
+from scullery import multicloud
+
+def test_threads_get_own_args(monkeypatch, capsys):
+  monkeypatch.setattr(scullery, 'cloud', lambda *a, **kw: None)
+  spec = io.StringIO('groups: {}\n')
+  spec.name = 'spec.yaml'
+  args = argparse.Namespace(desc = 'text', spec = spec, output = sys.stdout)
+  seen = []
+
+  def recipe(args):
+    args.desc = f'prefix|{args.desc}' # Recipes change their arguments
+    seen.append((args.desc, args.spec.read(), args.spec.name))
+    print('out line')
+    sys.stderr.write('err line\n')
+
+  results = multicloud.run(recipe, args, ['one', 'two'])
+  assert all(r.ok for r in results)
+  assert seen == [('prefix|text', 'groups: {}\n', 'spec.yaml')] * 2
+  assert args.desc == 'text'
+  out, err = capsys.readouterr()
+  assert sorted(out.splitlines()) == ['one out line', 'two out line']
+  assert sorted(err.splitlines()) == ['one err line', 'two err line']
+  assert not isinstance(sys.stderr, multicloud.PrefixedOutput)
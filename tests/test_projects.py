@@ -0,0 +1,37 @@
+#
+# Project recipe tests
+#
+'''Waiting for project deletions'''
+import gc
+import subprocess
+import sys
+
+import pytest
+
+import scullery
+import standin
+
+from conftest import CREDS
+
+@pytest.fixture
+def slow_delete():
+  '''Stand-in keeping deleted projects for a while'''
+  with standin.StandIn(standin.Tenant(users = 2, groups = 2, projects = 3, delete_delay = 0.5)) as srv:
+    yield srv
+
+@pytest.mark.parametrize('by', ['name', 'id'])
+def test_wait(by, slow_delete, scull_env):
+  scullery.api.set_api_endpoint(slow_delete.netloc, 'http')
+  try:
+    cc = scullery.api.ApiSession(CREDS)
+    prj = cc.iam.projects()[-1]
+    cc.iam.del_project(prj['id'])
+    del cc
+  finally:
+    gc.collect()
+    scullery.api.set_api_endpoint()
+  rc = subprocess.run([sys.executable, '-m', 'scullery', '--api-endpoint', slow_delete.url, '--no-daemon',
+                       'project', 'wait', '--interval', '0.1', '--timeout', '10', prj[by]],
+                      env = scull_env, capture_output = True, text = True, timeout = 60)
+  assert rc.returncode == 0, rc.stderr
+  assert 'not found' not in rc.stderr
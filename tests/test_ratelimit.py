@@ -0,0 +1,116 @@
+#
+# Rate limiting tests
+#
+'''Token buckets, retry policy and rate limit parsing'''
+import pytest
+
+from scullery import ratelimit
+
+@pytest.mark.parametrize('rate', [0, -1.0, float('nan')])
+def test_bucket_rejects_bad_rates(rate):
+  with pytest.raises(ValueError): ratelimit.TokenBucket(rate)
+  with pytest.raises(ValueError): ratelimit.RateLimiter({ 'iam': (rate, 1) })
+
+@pytest.mark.parametrize('text', ['iam=0', 'iam=-2', 'iam=nan', 'iam=1:0', 'iam', 'iam=x'])
+def test_parse_limit_errors(text):
+  with pytest.raises(ValueError): ratelimit.parse_limit(text)
+
+def test_parse_limit():
+  assert ratelimit.parse_limit('iam=10') == ('iam', 10.0, 1)
+  assert ratelimit.parse_limit(' ecs.eu-de.example.com = 2.5:4') == ('ecs.eu-de.example.com', 2.5, 4)
+
+def test_positive_rate():
+  assert ratelimit.positive_rate('0.5') == 0.5
+  with pytest.raises(ValueError): ratelimit.positive_rate('0')
+
+class Clock:
+  '''INTERNAL: stands for `time.monotonic`, moved by hand'''
+  def __init__(self): self.now = 1000.0
+  def __call__(self): return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+  clock = Clock()
+  monkeypatch.setattr(ratelimit.time, 'monotonic', clock)
+  return clock
+
+def test_bucket_reserve(clock):
+  bucket = ratelimit.TokenBucket(2.0, burst = 2)
+  assert bucket.reserve() == 0
+  assert bucket.reserve() == 0
+  # Empty: each request waits one more interval
+  assert bucket.reserve() == pytest.approx(0.5)
+  assert bucket.reserve() == pytest.approx(1.0)
+  clock.now += 1.0
+  assert bucket.reserve() == pytest.approx(0.5)
+  # Refills up to the burst only
+  clock.now += 60
+  assert [ bucket.reserve() for _ in range(3) ] == [0, 0, pytest.approx(0.5)]
+
+def test_bucket_take(clock):
+  bucket = ratelimit.TokenBucket(4.0)
+  assert bucket.take()
+  assert not bucket.take()
+  clock.now += 0.2
+  assert not bucket.take()
+  clock.now += 0.05
+  assert bucket.take()
+
+@pytest.mark.parametrize('method, status, attempt, retry', [
+  ('GET', 503, 0, True),
+  ('delete', 500, 4, True),
+  ('POST', 503, 0, False),   # May have been processed
+  ('POST', 429, 0, True),    # Never processed
+  ('GET', 404, 0, False),
+  ('GET', 429, 5, False),    # Out of retries
+])
+def test_should_retry(method, status, attempt, retry):
+  assert ratelimit.RetryPolicy().should_retry(method, status, attempt) == retry
+
+def test_delay():
+  policy = ratelimit.RetryPolicy(backoff = 0.5, max_backoff = 3.0)
+  for attempt in range(8):
+    assert 0 <= policy.delay(attempt) <= min(3.0, 0.5 * 2 ** attempt)
+  assert policy.delay(0, '7') >= 7
+  assert policy.delay(0, 'soon') <= 0.5
+  import email.utils, time
+  when = email.utils.formatdate(time.time() + 60, usegmt = True)
+  assert 50 < policy.delay(0, when) <= 60
+
+class Response:
+  '''INTERNAL: stands for a `requests` response'''
+  def __init__(self, status_code, headers = {}):
+    self.status_code = status_code
+    self.headers = headers
+
+def test_call_retries(monkeypatch):
+  sleeps = []
+  monkeypatch.setattr(ratelimit.time, 'sleep', sleeps.append)
+  limiter = ratelimit.RateLimiter(retry = ratelimit.RetryPolicy(max_retries = 2))
+  # The 429 is retried, the 503 of a POST is not
+  replies = [ Response(429, { 'Retry-After': '3' }), Response(503), Response(200) ]
+  resp = limiter.call('POST', 'https://iam.example.com/v3/users', lambda: replies.pop(0))
+  assert resp.status_code == 503 and len(replies) == 1
+  assert len(sleeps) == 1 and sleeps[0] >= 3
+  # GET is retried until max_retries
+  replies = [ Response(503) ] * 4
+  resp = limiter.call('GET', 'https://iam.example.com/v3/users', lambda: replies.pop(0))
+  assert resp.status_code == 503 and len(replies) == 1
+  assert dict(limiter.stats) == { 'requests': 5, 'rate_limited': 1, 'retried': 3, 'failed': 2 }
+
+def test_call_shares_prefix_bucket(monkeypatch, clock):
+  sleeps = []
+  monkeypatch.setattr(ratelimit.time, 'sleep', sleeps.append)
+  limiter = ratelimit.RateLimiter({ 'iam': (1.0, 1) })
+  for host in ('iam.eu-de.example.com', 'iam.eu-nl.example.com', 'ecs.eu-de.example.com'):
+    assert limiter.call('GET', f'https://{host}/', lambda: Response(200)).status_code == 200
+  assert sleeps == [ pytest.approx(1.0) ]
+  assert limiter.stats['requests'] == 3 and limiter.stats['throttled'] == 1
+
+def test_one_ratelimit_module(session):
+  import sys
+  from scullery import snapshot
+  # Limits set through scullery.ratelimit apply to API sessions
+  assert isinstance(session.limiter, ratelimit.RateLimiter)
+  assert snapshot.ratelimit is ratelimit
+  assert not 'ratelimit' in sys.modules
@@ -0,0 +1,79 @@
+#
+# Recipe smoke tests
+#
+'''Import every module and run one command per recipe'''
+import glob
+import os
+import subprocess
+import sys
+
+import pytest
+
+from conftest import ROOT
+
+RECIPE_MODULES = sorted(os.path.basename(f)[:-3]
+                        for f in glob.glob(os.path.join(ROOT, 'scullery', 'rcp_*.py')))
+'''Recipe module names'''
+
+MODULES = sorted(os.path.basename(f)[:-3]
+                  for f in glob.glob(os.path.join(ROOT, 'scullery', '*.py'))
+                  if not os.path.basename(f) in ('__init__.py', '__main__.py', 'api.py'))
+'''Modules that must import on their own (`api` is loaded by `scullery.__getattr__`)'''
+
+COMMANDS = [
+  ['cache', 'sync'],
+  ['ecs'],
+  ['groups'],
+  ['images'],
+  ['kermit', 'plan', 'eu-de_smoke'],
+  ['project'],
+  ['resources'],
+  ['roles'],
+  ['serve', '--help'],
+  ['show-proxy-cfg'],
+  ['tags'],
+  ['users'],
+]
+'''One read-only command line per recipe'''
+
+@pytest.mark.parametrize('module', MODULES)
+def test_import(module, scull_env):
+  # A fresh interpreter, so no earlier import can hide a missing one
+  rc = subprocess.run([sys.executable, '-c', f'import scullery.{module}'],
+                      env = scull_env, capture_output = True, text = True)
+  assert rc.returncode == 0, rc.stderr
+
+def test_every_recipe_has_a_command():
+  from scullery import parsers
+  modules = { module.rsplit('.',1)[1] for module, _, _, _ in parsers.RECIPES.values() }
+  assert modules == set(RECIPE_MODULES)
+  names = { name for _, name, _, _ in parsers.RECIPES.values() }
+  assert names == { argv[0] for argv in COMMANDS }
+
+@pytest.mark.parametrize('argv', COMMANDS, ids = [ ' '.join(argv) for argv in COMMANDS ])
+def test_command(argv, server, scull_env):
+  rc = subprocess.run([sys.executable, '-m', 'scullery', '--api-endpoint', server.url, '--no-daemon'] + argv,
+                      env = scull_env, capture_output = True, text = True, timeout = 60)
+  assert rc.returncode == 0, rc.stderr
+  assert rc.stdout
+
+@pytest.mark.parametrize('argv, op', [
+  (['kermit', 'eu-de_x'], 'kermit'),
+  (['kermit', '-d', 'text', 'eu-de_x'], 'kermit'),
+  (['kk', 'setup', 'eu-de_x'], 'kermit'),
+  (['kermit', 'plan', 'eu-de_x'], 'kermit_plan'),
+])
+def test_kermit_default_op(argv, op):
+  from scullery.__main__ import cmd_cli
+  args = cmd_cli(lazy = True, recipe = 'kermit').parse_args(argv)
+  assert args.recipe_cb.__name__ == op
+  assert 'eu-de_x' in args.project
+
+def test_kermit_without_op(server, scull_env, tmp_path):
+  # The command line from before kermit had operations
+  out = tmp_path / 'info.yaml'
+  rc = subprocess.run([sys.executable, '-m', 'scullery', '--api-endpoint', server.url, '--no-daemon',
+                       'kermit', 'eu-de_compat', '-o', str(out)],
+                      env = scull_env, capture_output = True, text = True, timeout = 60)
+  assert rc.returncode == 0, rc.stderr
+  assert 'eu-de_compat' in out.read_text()
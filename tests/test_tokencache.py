@@ -0,0 +1,45 @@
+#
+# Token cache tests
+#
+'''Persistent session tokens'''
+import os
+import stat
+import time
+
+import pytest
+
+from scullery import tokencache
+
+@pytest.fixture(autouse = True)
+def config_dir(monkeypatch, tmp_path):
+  monkeypatch.setenv(tokencache.STR.CONFIG_DIR, str(tmp_path / 'cfg'))
+  return tmp_path / 'cfg'
+
+def test_store_lookup(config_dir):
+  key = tokencache.cache_key('standin', 'test', 'domain', 'eu-de')
+  assert tokencache.lookup(key) is None
+  tokencache.store(key, 'secret', time.time() + 3600)
+  assert tokencache.lookup(key)['token'] == 'secret'
+  assert stat.S_IMODE(os.stat(tokencache.cache_file()).st_mode) == 0o600
+  tokencache.discard(key)
+  assert tokencache.lookup(key) is None
+
+def test_stale_tokens():
+  tokencache.store('soon', 'a', time.time() + 60)
+  assert tokencache.lookup('soon') is None
+  assert tokencache.lookup('soon', refresh_ahead = 0)['token'] == 'a'
+  tokencache.store('gone', 'b', time.time() - 1)
+  tokencache.store('other', 'c', time.time() + 3600)
+  # Expired entries are purged on the next store
+  assert set(tokencache._read()) == { 'soon', 'other' }
+
+def test_unreadable_cache(config_dir):
+  os.makedirs(config_dir)
+  with open(tokencache.cache_file(), 'w') as fp: fp.write('{ broken')
+  assert tokencache.lookup('any') is None
+  tokencache.store('any', 'a', time.time() + 3600)
+  assert tokencache.lookup('any')['token'] == 'a'
+
+def test_parse_expires_at():
+  assert tokencache.parse_expires_at('1970-01-01T00:01:00.000000Z') == 60
+  assert tokencache.parse_expires_at('1970-01-01T01:00:00+01:00') == 0
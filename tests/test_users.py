@@ -0,0 +1,19 @@
+#
+# User recipe tests
+#
+'''Bulk user import'''
+from scullery import usergroup
+
+def test_import_rate_limited(session):
+  group = session.iam.groups()[0]['name']
+  entries = [ { 'name': f'imported{i}', 'groups': [group] } for i in range(6) ]
+  results = usergroup.import_users(session, entries, rate = 50)
+  assert [ r['status'] for r in results ] == ['ok'] * len(entries)
+  assert session.limiter.stats['throttled'] > 0
+  # The limit only applies during the import
+  assert session.limiter.limits == {}
+
+def test_import_keeps_session_limit(session):
+  session.limiter.configure('127.0.0.1', 1000.0, 100)
+  usergroup.import_users(session, [ { 'name': 'imported_kept' } ], rate = 1)
+  assert session.limiter.limits == { '127.0.0.1': (1000.0, 100) }
@@ -0,0 +1,29 @@
+#
+# Waiter tests
+#
+'''Polling many items in one loop'''
+import io
+
+from scullery import waiter
+
+def test_done_and_timeout():
+  polls = { 'a': 0, 'b': 0, 'c': 0 }
+  def check(key:str) -> bool:
+    polls[key] += 1
+    if key == 'c': raise RuntimeError('not found')
+    return key == 'a' or polls[key] >= 3
+  progress = io.StringIO()
+  w = waiter.Waiter(check, interval = 0.01, max_interval = 0.02, rate = 1000, burst = 10,
+                    timeout = 0.5, progress = progress)
+  for key in polls: w.add(key, name = f'item {key}')
+  res = w.run()
+  assert res['a'] == res['b'] == waiter.STATUS.DONE
+  assert res['c'].startswith(waiter.STATUS.TIMEOUT) and 'not found' in res['c']
+  assert polls['a'] == 1 and polls['b'] == 3 and polls['c'] > 3
+
+def test_first_poll_delay():
+  polls = []
+  w = waiter.Waiter(lambda key: polls.append(key) or True, interval = 60, progress = False)
+  w.add('now', delay = 0)
+  assert w.run() == { 'now': waiter.STATUS.DONE }
+  assert polls == ['now']